@@ -12,3 +12,7 @@ class CompanyStatusChoices(models.TextChoices):
     HOLD = "HOLD", "HOLD"
     DEACTIVATED = "DEACTIVATED", "DEACTIVATED"
     CANCELLED = "CANCELLED", "CANCELLED"
+
+
+# Companies in these statuses may sync with their integration providers
+SYNCABLE_COMPANY_STATUSES = [CompanyStatusChoices.ACTIVE, CompanyStatusChoices.ACCEPTED]
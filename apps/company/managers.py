@@ -0,0 +1,12 @@
+from django.db import models
+
+from apps.company.constants import SYNCABLE_COMPANY_STATUSES
+
+
+class CompanyQuerySet(models.QuerySet):
+
+    def can_sync_provider(self):
+        """
+        Companies allowed to sync with their providers, see `Company.can_sync_provider`.
+        """
+        return self.filter(is_active=True, status__in=SYNCABLE_COMPANY_STATUSES)
@@ -1,7 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
-from apps.company.constants import CompanyStatusChoices
+from apps.company.constants import SYNCABLE_COMPANY_STATUSES, CompanyStatusChoices
+from apps.company.managers import CompanyQuerySet
 
 User = get_user_model()
 
@@ -15,6 +16,8 @@ class Company(models.Model):
     )
     is_active = models.BooleanField(default=True)
 
+    objects = CompanyQuerySet.as_manager()
+
     def __str__(self):
         return f'Company:{self.name}'
 
@@ -33,11 +36,7 @@ class Company(models.Model):
         return f"Default QuickBooks Invoice mappings created for company '{self.name}'"
 
     def can_sync_provider(self):
-        return (
-                self.is_active and
-                self.status in [CompanyStatusChoices.ACTIVE, CompanyStatusChoices.ACCEPTED]
-
-        )
+        return self.is_active and self.status in SYNCABLE_COMPANY_STATUSES
 
 
 class CompanyMember(models.Model):
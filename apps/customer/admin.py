@@ -1,9 +1,12 @@
 from django.contrib import admin
+
+from apps.integration.admin_actions import refresh_from_provider_action
+from utils.admin_utils import ChangelistColumnsMixin
 from .models import Customer
 
 
 @admin.register(Customer)
-class CustomerAdmin(admin.ModelAdmin):
+class CustomerAdmin(ChangelistColumnsMixin, admin.ModelAdmin):
     list_display = (
         "company_name",
         "customer_id",
@@ -15,5 +18,18 @@ class CustomerAdmin(admin.ModelAdmin):
     )
     search_fields = ("company_name", "customer_id", "dba", "tax_id")
     list_filter = ("company", "integration_provider", "created_at")
-    readonly_fields = ("created_at", "modified_at", "integration_raw_data")
+    readonly_fields = ("created_at", "modified_at", "raw_data")
     ordering = ("-created_at",)
+    list_select_related = ("company", "integration_provider")
+    list_only_fields = (
+        "company_name",
+        "customer_id",
+        "dba",
+        "company__name",
+        "integration_provider__name",
+        "created_at",
+        "modified_at",
+    )
+    # Skip the unfiltered COUNT(*) on large tables
+    show_full_result_count = False
+    actions = (refresh_from_provider_action("Customer", "customer_id"),)
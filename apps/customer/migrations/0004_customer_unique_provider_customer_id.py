@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-18 10:47
+
+from django.db import migrations
+from django.db.models import Count, Max
+
+
+def remove_duplicate_customers(apps, schema_editor):
+    """
+    Keep only the newest row per (company, integration_provider, customer_id)
+    so the unique constraint can be created. Rows without a company or provider
+    (created by hand) or without a customer_id are never compared by the
+    constraint and are left alone.
+    """
+    Customer = apps.get_model('customer', 'Customer')
+    duplicates = (
+        Customer.objects.filter(company__isnull=False, integration_provider__isnull=False)
+        .exclude(customer_id='')
+        .values('company', 'integration_provider', 'customer_id')
+        .annotate(row_count=Count('id'), keep_id=Max('id'))
+        .filter(row_count__gt=1)
+    )
+    for duplicate in duplicates:
+        Customer.objects.filter(
+            company=duplicate['company'],
+            integration_provider=duplicate['integration_provider'],
+            customer_id=duplicate['customer_id'],
+        ).exclude(id=duplicate['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0005_alter_companymember_user_account'),
+        ('customer', '0003_customer_integration_provider_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_customers, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='customer',
+            unique_together={('company', 'integration_provider', 'customer_id')},
+        ),
+    ]
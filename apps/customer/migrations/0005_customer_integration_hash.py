@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 10:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0004_customer_unique_provider_customer_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='integration_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+    ]
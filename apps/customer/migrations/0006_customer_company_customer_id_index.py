@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-18 11:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0005_customer_integration_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['company', 'customer_id'], name='customer_cu_company_df9486_idx'),
+        ),
+    ]
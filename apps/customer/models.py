@@ -1,7 +1,9 @@
+from functools import cached_property
+
 from django.db import models
 
 from apps.company.models import Company
-from apps.integration.models import IntegrationProvider
+from apps.integration.models import IntegrationProvider, RawPayload
 
 
 class Customer(models.Model):
@@ -41,9 +43,30 @@ class Customer(models.Model):
 
     integration_provider = models.ForeignKey(IntegrationProvider, on_delete=models.SET_NULL, null=True, blank=True)
     integration_raw_data = models.JSONField(default=dict, blank=True)
+    # SHA-256 of the provider payload, lets syncs skip unchanged records.
+    # With compressed raw data storage it also addresses the RawPayload row.
+    integration_hash = models.CharField(max_length=64, blank=True, default="", editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        unique_together = ("company", "integration_provider", "customer_id")
+        indexes = [
+            # Customer lookups by id within a company, across providers
+            models.Index(fields=["company", "customer_id"]),
+        ]
+
     def __str__(self):
         return self.company_name
+
+    @cached_property
+    def raw_data(self):
+        """
+        Provider payload, inline or loaded (once) from compressed RawPayload storage.
+        """
+        if self.integration_raw_data:
+            return self.integration_raw_data
+        if self.integration_hash:
+            return RawPayload.load(self.integration_hash)
+        return None
@@ -1,9 +1,11 @@
 from django.contrib import admin
-from .models import IntegrationProvider, CompanyIntegration, ProviderFieldMapping
+
+from utils.admin_utils import ChangelistColumnsMixin
+from .models import IntegrationProvider, CompanyIntegration, ProviderFieldMapping, SyncState, SyncRun
 
 
 @admin.register(IntegrationProvider)
-class IntegrationProviderAdmin(admin.ModelAdmin):
+class IntegrationProviderAdmin(ChangelistColumnsMixin, admin.ModelAdmin):
     list_display = (
         "name",
         "display_name",
@@ -16,10 +18,11 @@ class IntegrationProviderAdmin(admin.ModelAdmin):
     search_fields = ("name", "display_name")
     readonly_fields = ("created_at", "modified_at")
     ordering = ("name",)
+    list_defer_fields = ("config",)
 
 
 @admin.register(CompanyIntegration)
-class CompanyIntegrationAdmin(admin.ModelAdmin):
+class CompanyIntegrationAdmin(ChangelistColumnsMixin, admin.ModelAdmin):
     list_display = (
         "company",
         "provider",
@@ -32,11 +35,74 @@ class CompanyIntegrationAdmin(admin.ModelAdmin):
     search_fields = ("company__name", "provider__name")
     readonly_fields = ("created_at", "modified_at")
     ordering = ("company", "provider")
+    list_select_related = ("company", "provider")
+    list_only_fields = (
+        "company__name",
+        "provider__name",
+        "provider_identifier",
+        "is_active",
+        "created_at",
+        "modified_at",
+    )
 
 
 @admin.register(ProviderFieldMapping)
-class ProviderFieldMappingAdmin(admin.ModelAdmin):
+class ProviderFieldMappingAdmin(ChangelistColumnsMixin, admin.ModelAdmin):
     list_display = ('company', 'provider', 'entity_name', 'local_field', 'provider_field', 'is_required')
     list_filter = ('entity_name', 'provider', 'company', 'is_required')
     search_fields = ('local_field', 'provider_field', 'company__name', 'provider__name')
     readonly_fields = ('created_at', 'modified_at')
+    list_select_related = ('company', 'provider')
+    list_defer_fields = ('provider__config',)
+
+
+@admin.register(SyncState)
+class SyncStateAdmin(ChangelistColumnsMixin, admin.ModelAdmin):
+    list_display = ('company_integration', 'entity_name', 'last_updated_time', 'last_synced_at')
+    list_filter = ('entity_name',)
+    search_fields = ('company_integration__company__name', 'company_integration__provider_identifier')
+    readonly_fields = ('created_at', 'modified_at')
+    list_select_related = ('company_integration__company', 'company_integration__provider')
+    list_defer_fields = (
+        'company_integration__credentials',
+        'company_integration__provider_data',
+        'company_integration__provider__config',
+    )
+
+
+@admin.register(SyncRun)
+class SyncRunAdmin(ChangelistColumnsMixin, admin.ModelAdmin):
+    list_display = (
+        "company_integration",
+        "entity_name",
+        "mode",
+        "status",
+        "started_at",
+        "duration_seconds",
+        "rows_fetched",
+        "rows_created",
+        "rows_updated",
+        "rows_skipped",
+        "rows_rejected",
+        "http_calls",
+        "fetch_seconds",
+        "db_write_seconds",
+    )
+    list_filter = ("status", "mode", "entity_name", "company_integration__provider", "started_at")
+    search_fields = ("company_integration__company__name", "company_integration__provider_identifier", "task_id")
+    list_select_related = ("company_integration__company", "company_integration__provider")
+    list_defer_fields = (
+        "error",
+        "rejects",
+        "company_integration__credentials",
+        "company_integration__provider_data",
+        "company_integration__provider__config",
+    )
+    date_hierarchy = "started_at"
+    ordering = ("-started_at",)
+
+    def get_readonly_fields(self, request, obj=None):
+        return [field.name for field in self.model._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.contrib import admin, messages
+
+from apps.integration.models import CompanyIntegration
+from apps.integration.services.bulk import chunked
+from apps.integration.tasks import refresh_integration_records
+
+
+def refresh_from_provider_action(entity_name: str, id_field: str):
+    """
+    Admin action queueing refresh_integration_records for the selected rows,
+    one task per integration and INTEGRATION_REFRESH_MAX_IDS ids.
+    Rows without a provider id or an active integration are left out.
+    """
+
+    @admin.action(description=f"Refresh selected {entity_name.lower()}s from the provider")
+    def refresh_from_provider(modeladmin, request, queryset):
+        ids_by_integration = {}
+        rows = queryset.exclude(**{id_field: ""}).filter(integration_provider__isnull=False).values_list(
+            "company_id", "integration_provider_id", id_field
+        )
+        for company_id, provider_id, record_id in rows:
+            ids_by_integration.setdefault((company_id, provider_id), []).append(record_id)
+
+        integrations = CompanyIntegration.objects.filter(
+            company_id__in={company_id for company_id, _ in ids_by_integration},
+            provider_id__in={provider_id for _, provider_id in ids_by_integration},
+            is_active=True,
+        ).values_list("id", "company_id", "provider_id")
+
+        queued = 0
+        for company_integration_id, company_id, provider_id in integrations:
+            ids = ids_by_integration.get((company_id, provider_id), [])
+            for chunk in chunked(ids, settings.INTEGRATION_REFRESH_MAX_IDS):
+                refresh_integration_records.delay(company_integration_id, entity_name, chunk)
+            queued += len(ids)
+
+        skipped = len(rows) - queued
+        modeladmin.message_user(request, f"Queued a provider refresh of {queued} {entity_name.lower()}s.",
+                                messages.SUCCESS)
+        if skipped:
+            modeladmin.message_user(request, f"{skipped} rows have no active integration and were skipped.",
+                                    messages.WARNING)
+
+    return refresh_from_provider
@@ -0,0 +1,40 @@
+from rest_framework import serializers
+
+from apps.integration.models import SyncRun
+
+
+class SyncRunSerializer(serializers.ModelSerializer):
+    provider = serializers.CharField(source="company_integration.provider.name", read_only=True)
+    duration_seconds = serializers.FloatField(read_only=True)
+    rows_per_second = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = SyncRun
+        fields = (
+            "id",
+            "company_integration",
+            "provider",
+            "entity_name",
+            "mode",
+            "resumed_from",
+            "status",
+            "task_id",
+            "started_at",
+            "finished_at",
+            "duration_seconds",
+            "rows_per_second",
+            "http_calls",
+            "bytes_received",
+            "fetch_seconds",
+            "transform_seconds",
+            "db_write_seconds",
+            "pages_fetched",
+            "rows_fetched",
+            "rows_created",
+            "rows_updated",
+            "rows_skipped",
+            "rows_rejected",
+            "rejects",
+            "error",
+        )
+        read_only_fields = fields
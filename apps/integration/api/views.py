@@ -1,21 +1,69 @@
+import json
+import logging
 import uuid
 
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, redirect
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.utils import timezone
 from intuitlib.client import AuthClient
 from intuitlib.enums import Scopes
-from rest_framework import status
+from rest_framework import generics, status
+from rest_framework.exceptions import NotAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from redis.exceptions import RedisError
 
 from apps.company.constants import CompanyStatusChoices
 from apps.company.models import Company
-from apps.integration.models import IntegrationProvider, CompanyIntegration
-from apps.integration.selectors import get_qbo_customers, get_qbo_invoices
-from apps.integration.services import create_or_update_qbo_customers, create_or_update_qbo_invoices
+from apps.integration.api.serializers import SyncRunSerializer
+from apps.integration.models import CompanyIntegration, SyncRun
+from apps.integration.provider_registry import get_provider
+from apps.integration.services import record_qbo_change_events, verify_qbo_webhook_signature
+from apps.integration.tasks import refresh_integration_records, schedule_qbo_webhook_flush, sync_qbo_customers, \
+    sync_qbo_invoices
+from config.celery import app as celery_app
+from utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+def _is_full_sync(request):
+    """
+    `?full=true` forces a full resync instead of an incremental one.
+    """
+    return request.GET.get("full", "").lower() in ("1", "true", "yes")
+
+
+def _job_company_key(job_id):
+    return f"sync-job-company:{job_id}"
+
+
+def _queue_job(request, task, args, company_id, kwargs=None, message="Sync queued"):
+    """
+    Enqueue `task` as a job only the requesting company can poll.
+    The owner is recorded before the job is queued, so a queued job can always be polled;
+    if Redis is down nothing is queued and the client is told to retry.
+    """
+    job_id = str(uuid.uuid4())
+    try:
+        # Job results carry no reliable owner (PENDING/RETRY/FAILURE have none), remember it here.
+        get_redis().set(_job_company_key(job_id), company_id, ex=settings.INTEGRATION_SYNC_JOB_TTL)
+    except RedisError:
+        logger.error("Could not record the owner of a sync job, not queueing it.", exc_info=True)
+        return Response({"error": "Try again later"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    task.apply_async(args=args, kwargs=kwargs, task_id=job_id)
+    return Response(
+        {
+            "message": message,
+            "job_id": job_id,
+            "status_url": request.build_absolute_uri(reverse("qbo-sync-job-status", args=[job_id])),
+        },
+        status=status.HTTP_202_ACCEPTED
+    )
 
 
 class QuickBooksConnectAPIView(APIView):
@@ -47,8 +95,10 @@ class QuickBooksConnectAPIView(APIView):
             },
                 status=status.HTTP_400_BAD_REQUEST)
 
-        # Get QuickBooks IntegrationProvider from DB
-        provider = get_object_or_404(IntegrationProvider, name="quickbooks_online")
+        # Get QuickBooks IntegrationProvider (cached, config already decrypted)
+        provider = get_provider("quickbooks_online", active_only=False)
+        if provider is None:
+            raise Http404("QuickBooks provider not found")
 
         # Load OAuth config from provider.config
         config = provider.config
@@ -124,7 +174,9 @@ class QuickBooksCallbackAPIView(APIView):
             )
 
         # 4️⃣ Get QuickBooks provider
-        provider = get_object_or_404(IntegrationProvider, name="quickbooks_online", is_active=True)
+        provider = get_provider("quickbooks_online")
+        if provider is None:
+            raise Http404("QuickBooks provider not found")
 
         # 5️⃣ Initialize QuickBooks AuthClient
         config = provider.config
@@ -208,39 +260,128 @@ class QuickBooksOnlineSyncCustomersAPIView(APIView):
             provider__name="quickbooks_online"
         ).first()
 
+        if not company_integration:
+            return Response(
+                {"error": "QuickBooks not connected for this company"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
         if not company_integration.is_active:
             return Response(
                 {"error": "Integration is not Active"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        # 2. Queue remote fetch + local DB update, poll the job status URL for progress
+        return _queue_job(request, sync_qbo_customers, [company_integration.id], company_id,
+                          kwargs={"full_sync": _is_full_sync(request)})
+
+
+class QuickBooksOnlineSyncInvoicesAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, company_id):
+        # ToDo need to check request user company
+        # ToDo need to check if admin is doing on behalf of company
+        # 1. Find integration
+        if request.user.company.id != company_id:
+            return Response(
+                {"error": "You are not authorized for this company."},
+                status=status.HTTP_401_UNAUTHORIZED
+            )
+        if not request.user.company.can_sync_provider():
+            return Response(
+                {"error": "Your company can not be sync"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        company_integration = CompanyIntegration.objects.filter(
+            company_id=company_id,
+            provider__name="quickbooks_online"
+        ).first()
+
         if not company_integration:
             return Response(
                 {"error": "QuickBooks not connected for this company"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # 2. Fetch remote + update local DB
-        try:
-            customers = get_qbo_customers(company_integration)
-            create_or_update_qbo_customers(company_integration, customers)
-        except Exception as e:
+        if not company_integration.is_active:
             return Response(
-                {"error": str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {"error": "Integration is not Active"},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
-        # 3. Send JSON response
-        return Response({"message": "Successfully Fetch and updated in Database"}, status=status.HTTP_200_OK)
+        # 2. Queue remote fetch + local DB update, poll the job status URL for progress
+        return _queue_job(request, sync_qbo_invoices, [company_integration.id], company_id,
+                          kwargs={"full_sync": _is_full_sync(request)})
 
 
-class QuickBooksOnlineSyncInvoicesAPIView(APIView):
+class SyncJobStatusAPIView(APIView):
+    """
+    Status of a sync job queued by the sync endpoints:
+    phase, pages fetched, rows fetched/upserted/skipped and elapsed time.
+    Only the company that queued a job can read it (see `_queue_job`).
+    """
     permission_classes = [IsAuthenticated]
 
-    def get(self, request, company_id):
-        # ToDo need to check request user company
-        # ToDo need to check if admin is doing on behalf of company
-        # 1. Find integration
+    # Celery states that carry no job payload yet
+    CELERY_PHASES = {
+        "PENDING": "queued",
+        "RECEIVED": "queued",
+        "RETRY": "retrying",
+        "FAILURE": "failed",
+    }
+
+    def get(self, request, job_id):
+        user_company = getattr(request.user, 'company', None)
+        if not user_company:
+            return Response({'error': 'You are not authorized to access this page.'},
+                            status=status.HTTP_401_UNAUTHORIZED)
+
+        try:
+            owner = get_redis().get(_job_company_key(job_id))
+        except RedisError:
+            logger.error("Could not look up the owner of sync job.", exc_info=True)
+            return Response({"error": "Try again later"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        # Only jobs queued by the caller's company, whatever their state.
+        if owner is None or int(owner) != user_company.id:
+            return Response({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        result = celery_app.AsyncResult(job_id)
+        job = result.info if isinstance(result.info, dict) else {}
+
+        data = {
+            "job_id": job_id,
+            "state": result.state,
+            "phase": job.get("phase") or self.CELERY_PHASES.get(result.state, result.state.lower()),
+            "entity": job.get("entity"),
+            "pages_fetched": job.get("pages", 0),
+            "rows_fetched": job.get("fetched", 0),
+            "rows_upserted": job.get("created", 0) + job.get("updated", 0),
+            "rows_skipped": job.get("skipped", 0),
+            "rows_rejected": job.get("rejected", 0),
+            "missing_ids": job.get("missing"),
+            "started_at": job.get("started_at"),
+            "elapsed_seconds": job.get("elapsed_seconds"),
+            "sync_run_id": job.get("sync_run_id"),
+        }
+        if result.state == "FAILURE":
+            data["error"] = str(result.info)
+        elif job.get("error") or job.get("reason"):
+            data["error"] = job.get("error") or job.get("reason")
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class QuickBooksOnlineRefreshRecordsAPIView(APIView):
+    """
+    Refresh specific QuickBooks records by id: POST {"ids": ["123", ...]}.
+    Queues refresh_integration_records (one QuickBooks call per chunk of ids instead
+    of a sync), poll the job status URL for the result.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, company_id, entity_name):
         if request.user.company.id != company_id:
             return Response(
                 {"error": "You are not authorized for this company."},
@@ -252,21 +393,74 @@ class QuickBooksOnlineSyncInvoicesAPIView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        ids = request.data.get("ids")
+        if not isinstance(ids, list) or not ids or not all(str(record_id).isdigit() for record_id in ids):
+            return Response(
+                {"error": "ids must be a non-empty list of QuickBooks ids"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(ids) > settings.INTEGRATION_REFRESH_MAX_IDS:
+            return Response(
+                {"error": f"At most {settings.INTEGRATION_REFRESH_MAX_IDS} ids per request"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
         company_integration = CompanyIntegration.objects.filter(
             company_id=company_id,
             provider__name="quickbooks_online"
         ).first()
 
         if not company_integration:
-            return JsonResponse({"error": "QuickBooks not connected for this company"}, status=400)
+            return Response(
+                {"error": "QuickBooks not connected for this company"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if not company_integration.is_active:
+            return Response(
+                {"error": "Integration is not Active"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return _queue_job(request, refresh_integration_records,
+                          [company_integration.id, entity_name, [str(i) for i in ids]], company_id,
+                          message="Refresh queued")
+
+
+class QuickBooksWebhookAPIView(APIView):
+    """
+    QuickBooks change notifications (webhooks):
+    - Verifies the intuit-signature header against QBO_WEBHOOK_VERIFIER_TOKEN
+    - Maps each realmId to the active integrations with that provider_identifier
+    - Buffers the changed/deleted ids and schedules one flush per integration after
+      INTEGRATION_WEBHOOK_COALESCE_SECONDS, see flush_qbo_webhook_changes
+    - Answers right away, Intuit expects a response within seconds and retries on errors
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        # The signature covers the raw body, read it before DRF parses it.
+        body = request.body
+        if not verify_qbo_webhook_signature(body, request.headers.get("intuit-signature")):
+            return Response({"error": "Invalid signature"}, status=status.HTTP_401_UNAUTHORIZED)
+
         try:
-            invoices = get_qbo_invoices(company_integration)
-            create_or_update_qbo_invoices(company_integration, invoices)
-        except Exception as e:
-            return JsonResponse({"error": str(e)}, status=500)
+            payload = json.loads(body)
+        except ValueError:
+            return Response({"error": "Invalid payload"}, status=status.HTTP_400_BAD_REQUEST)
 
-        return JsonResponse({"message": "Successfully Fetch and updated Invoices in Database"},
-                            status=status.HTTP_200_OK)
+        try:
+            schedule_qbo_webhook_flush(record_qbo_change_events(payload))
+        except ValueError:
+            # Signed but not shaped like a change notification
+            return Response({"error": "Invalid payload"}, status=status.HTTP_400_BAD_REQUEST)
+        except RedisError:
+            logger.error("Could not buffer QuickBooks webhook events.", exc_info=True)
+            # Intuit retries failed deliveries.
+            return Response({"error": "Try again later"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        return Response(status=status.HTTP_200_OK)
 
 
 class QuickBooksOnlineSyncCompanyAPIView(APIView):
@@ -303,3 +497,36 @@ class QuickBooksOnlineSyncCompanyAPIView(APIView):
 
         return JsonResponse({"message": "Need to Work on this"},
                             status=status.HTTP_200_OK)
+
+
+class SyncRunQuerysetMixin:
+    permission_classes = [IsAuthenticated]
+    serializer_class = SyncRunSerializer
+
+    def get_queryset(self):
+        user_company = getattr(self.request.user, 'company', None)
+        if not user_company:
+            raise NotAuthenticated('You are not authorized to access this page.')
+        return SyncRun.objects.filter(
+            company_integration__company=user_company
+        ).select_related("company_integration__provider")
+
+
+class SyncRunListAPIView(SyncRunQuerysetMixin, generics.ListAPIView):
+    """
+    Sync run ledger of the user's company, newest first.
+    Filter with ?entity_name=Invoice&status=failed&mode=full.
+    """
+    ordering_fields = ("started_at", "rows_fetched", "db_write_seconds", "fetch_seconds")
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        for param in ("entity_name", "status", "mode"):
+            value = self.request.query_params.get(param)
+            if value:
+                queryset = queryset.filter(**{param: value})
+        return queryset
+
+
+class SyncRunDetailAPIView(SyncRunQuerysetMixin, generics.RetrieveAPIView):
+    pass
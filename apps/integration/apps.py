@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class IntegrationConfig(AppConfig):
     name = 'apps.integration'
+
+    def ready(self):
+        from apps.integration import signals  # noqa: F401
@@ -0,0 +1,136 @@
+import logging
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from redis.exceptions import LockError, RedisError
+
+from utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Counting semaphore on a sorted set: member = holder token, score = lease expiry.
+# Expired leases (crashed workers) are dropped before counting.
+ACQUIRE_SLOT_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), ARGV[3])
+redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[2])))
+return 1
+"""
+
+_script = None
+
+
+def _slot_key(name: str) -> str:
+    return f"sync-slots:{name}"
+
+
+def _sync_lock_key(company_integration_id, entity_name: str) -> str:
+    return f"sync-lock:{company_integration_id}:{entity_name}"
+
+
+def acquire_slot(name: str, limit: int, ttl: int | None = None) -> str | None:
+    """
+    Take one of `limit` slots named `name`. Returns a token to release, or None when all are taken.
+    """
+    global _script
+    if _script is None:
+        _script = get_redis().register_script(ACQUIRE_SLOT_SCRIPT)
+    token = uuid.uuid4().hex
+    ttl = ttl or settings.INTEGRATION_SYNC_SLOT_TTL
+    if _script(keys=[_slot_key(name)], args=[limit, ttl, token]):
+        return token
+    return None
+
+
+def release_slot(name: str, token: str):
+    get_redis().zrem(_slot_key(name), token)
+
+
+def slots_in_use(name: str) -> int:
+    redis = get_redis()
+    key = _slot_key(name)
+    now = redis.time()
+    redis.zremrangebyscore(key, "-inf", now[0] + now[1] / 1_000_000)
+    return redis.zcard(key)
+
+
+def provider_sync_limit(provider_name: str) -> int:
+    return settings.INTEGRATION_SYNC_PROVIDER_CONCURRENCY.get(
+        provider_name, settings.INTEGRATION_SYNC_DEFAULT_PROVIDER_CONCURRENCY
+    )
+
+
+def _release_all(held):
+    for name, token in held:
+        try:
+            release_slot(name, token)
+        except RedisError:
+            # The lease expires on its own.
+            pass
+
+
+@contextmanager
+def sync_slot(provider_name: str):
+    """
+    Hold one global and one per-provider sync slot for the duration of the block.
+    Yields False (holding nothing) if either cap is reached. If Redis is down the
+    sync runs unthrottled rather than not at all.
+    """
+    held = []
+    acquired = True
+    try:
+        for name, limit in (
+                ("global", settings.INTEGRATION_SYNC_GLOBAL_CONCURRENCY),
+                (provider_name, provider_sync_limit(provider_name)),
+        ):
+            token = acquire_slot(name, limit)
+            if token is None:
+                acquired = False
+                break
+            held.append((name, token))
+    except RedisError as exc:
+        logger.warning(f"Sync slots unavailable, running without concurrency cap: {exc}")
+
+    if not acquired:
+        _release_all(held)
+        held = []
+    try:
+        yield acquired
+    finally:
+        _release_all(held)
+
+
+@contextmanager
+def entity_sync_lock(company_integration_id, entity_name: str):
+    """
+    Hold the lock of one integration's entity sync for the duration of the block,
+    so overlapping tasks (beat, API, retries) never write the same SyncState.
+    Yields False without waiting if another worker holds it. If Redis is down the
+    sync runs unlocked rather than not at all.
+    """
+    lock = get_redis().lock(
+        _sync_lock_key(company_integration_id, entity_name),
+        timeout=settings.INTEGRATION_SYNC_LOCK_TIMEOUT,
+        blocking=False,
+    )
+    try:
+        acquired = lock.acquire()
+    except RedisError as exc:
+        logger.warning(f"Sync lock unavailable, running without it: {exc}")
+        lock, acquired = None, True
+
+    try:
+        yield acquired
+    finally:
+        if lock is not None and acquired:
+            try:
+                lock.release()
+            except (LockError, RedisError):
+                # Lock expired while syncing, nothing left to release.
+                pass
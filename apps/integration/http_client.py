@@ -0,0 +1,121 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from apps.integration import metrics, rate_limit
+
+logger = logging.getLogger(__name__)
+
+# Throttling and transient upstream failures worth retrying.
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _base_url(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def get_session(url: str) -> requests.Session:
+    """
+    Return the process-wide keep-alive session for the provider base URL of `url`.
+    Connections are pooled and reused across calls (and Celery tasks) in this process.
+    """
+    base_url = _base_url(url)
+    with _sessions_lock:
+        session = _sessions.get(base_url)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=settings.INTEGRATION_HTTP_POOL_SIZE,
+                max_retries=0,
+            )
+            session.mount(base_url, adapter)
+            _sessions[base_url] = session
+    return session
+
+
+def _retry_after_seconds(response: requests.Response) -> float | None:
+    """
+    Parse a Retry-After header given either in seconds or as an HTTP date.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - timezone.now()).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff_seconds(attempt: int) -> float:
+    """
+    Exponential backoff with full jitter.
+    """
+    ceiling = min(settings.INTEGRATION_HTTP_BACKOFF_MAX, settings.INTEGRATION_HTTP_BACKOFF_BASE * 2 ** attempt)
+    return random.uniform(0, ceiling)
+
+
+def provider_request(method: str, url: str, max_retries: int | None = None,
+                     rate_limit_key: tuple[str, str] | None = None, **kwargs) -> requests.Response:
+    """
+    Send a request to a provider API through the pooled session.
+
+    `rate_limit_key` is (provider name, provider identifier); when given, every
+    attempt first takes a token from that bucket, see rate_limit.acquire.
+    Connection errors, timeouts and RETRY_STATUS_CODES responses are retried
+    with jittered exponential backoff; a Retry-After header takes precedence.
+    The last response is returned as is, callers still call raise_for_status().
+    """
+    if max_retries is None:
+        max_retries = settings.INTEGRATION_HTTP_MAX_RETRIES
+    kwargs.setdefault("timeout", settings.INTEGRATION_HTTP_TIMEOUT)
+    session = get_session(url)
+
+    attempt = 0
+    while True:
+        if rate_limit_key:
+            rate_limit.acquire(*rate_limit_key)
+        metrics.record("http_calls")
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            if attempt >= max_retries:
+                raise
+            delay = _backoff_seconds(attempt)
+            reason = str(exc)
+        else:
+            if not kwargs.get("stream"):
+                metrics.record("bytes_received", len(response.content))
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= max_retries:
+                return response
+            retry_after = _retry_after_seconds(response)
+            delay = (
+                min(retry_after, settings.INTEGRATION_HTTP_BACKOFF_MAX)
+                if retry_after is not None else _backoff_seconds(attempt)
+            )
+            reason = f"HTTP {response.status_code}"
+            response.close()
+
+        attempt += 1
+        logger.warning(f"{method} {url} failed ({reason}), retry {attempt}/{max_retries} in {delay:.1f}s.")
+        time.sleep(delay)
+
+
+def provider_get(url: str, **kwargs) -> requests.Response:
+    return provider_request("GET", url, **kwargs)
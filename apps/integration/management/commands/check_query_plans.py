@@ -0,0 +1,87 @@
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from apps.customer.models import Customer
+from apps.integration.models import CompanyIntegration, SyncRun, SyncState
+from apps.invoice.models import Invoice
+
+# SQLite: "SCAN invoice_invoice" (no index), PostgreSQL: "Seq Scan on invoice_invoice"
+FULL_SCAN_PATTERNS = [
+    re.compile(r"\bSCAN (?!.*\bUSING\b)\S+"),
+    re.compile(r"\bSeq Scan\b"),
+]
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the sync and reporting hot queries and flag full table scans"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fail-on-scan",
+            action="store_true",
+            help="Exit with an error when any query plan contains a full table scan",
+        )
+
+    def hot_queries(self):
+        """
+        (label, queryset) pairs for the queries syncs and reports run most.
+        Ids come from the first integration when there is one, plans do not depend on them.
+        """
+        company_integration = CompanyIntegration.objects.order_by("id").first()
+        company_id = company_integration.company_id if company_integration else 0
+        provider_id = company_integration.provider_id if company_integration else 0
+        integration_id = company_integration.id if company_integration else 0
+        today = timezone.now().date()
+
+        return [
+            ("customer upsert lookup", Customer.objects.filter(
+                company_id=company_id, integration_provider_id=provider_id, customer_id__in=["1", "2"]
+            ).values_list("customer_id", "integration_hash")),
+            ("customer by id", Customer.objects.filter(company_id=company_id, customer_id="1")),
+            ("invoice upsert lookup", Invoice.objects.filter(
+                company_id=company_id, integration_provider_id=provider_id, invoice_id__in=["1", "2"]
+            ).values_list("invoice_id", "integration_hash")),
+            ("invoices of a customer", Invoice.objects.filter(company_id=company_id, customer_id="1")),
+            ("invoices due", Invoice.objects.filter(
+                company_id=company_id, due_date__range=(today, today + timedelta(days=30))
+            )),
+            ("invoices by date", Invoice.objects.filter(
+                company_id=company_id, invoice_date__gte=timezone.now() - timedelta(days=30)
+            )),
+            ("sync state", SyncState.objects.filter(company_integration_id=integration_id, entity_name="Invoice")),
+            ("sync runs of an integration", SyncRun.objects.filter(
+                company_integration_id=integration_id, entity_name="Invoice"
+            ).order_by("-started_at")[:20]),
+        ]
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Database: {connection.vendor}")
+        flagged = []
+
+        for label, queryset in self.hot_queries():
+            plan = queryset.explain()
+            scans = [line.strip() for line in plan.splitlines()
+                     if any(pattern.search(line) for pattern in FULL_SCAN_PATTERNS)]
+            if scans:
+                flagged.append(label)
+                self.stdout.write(self.style.WARNING(f"SCAN  {label}"))
+                for line in scans:
+                    self.stdout.write(f"      {line}")
+            else:
+                self.stdout.write(self.style.SUCCESS(f"OK    {label}"))
+            if options["verbosity"] > 1:
+                self.stdout.write(plan)
+
+        if not flagged:
+            self.stdout.write(self.style.SUCCESS("No full table scans."))
+            return
+
+        # Planners prefer scans on tiny tables, run this against production-sized data.
+        message = f"{len(flagged)} queries scan a full table: {', '.join(flagged)}"
+        if options["fail_on_scan"]:
+            raise CommandError(message)
+        self.stdout.write(self.style.WARNING(message))
@@ -0,0 +1,345 @@
+"""
+ProviderFieldMapping engine.
+
+A mapping plan turns provider records into model field values. Its paths are
+the built-in defaults of a (provider, entity) overlaid with the company's
+ProviderFieldMapping rows. Paths are dotted:
+
+- `DocNumber`, `CustomerRef.value`: nested keys,
+- `Line.0.Amount`: list index,
+- `Line.$Index.Amount`: every item of a list, gives a list of values.
+
+Each path is compiled once into an itemgetter chain and plans are cached per
+(company, provider, entity), so tenant mappings cost nothing per row.
+
+Values are coerced to the column type (Decimal, date, datetime, ...) one column
+of a page at a time, and required fields are checked, before anything reaches the
+ORM. Records that fail are reported back instead of failing the whole write.
+"""
+import hashlib
+import json
+import logging
+import threading
+from datetime import date, datetime, time
+from decimal import Decimal
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.utils import timezone
+
+from apps.integration.models import CompanyIntegration, ProviderFieldMapping
+
+logger = logging.getLogger(__name__)
+
+WILDCARD = "$Index"
+
+# Bookkeeping columns set by the sync itself, never from a mapping
+RESERVED_FIELDS = {"company", "integration_provider", "integration_raw_data", "integration_hash",
+                   "created_at", "modified_at"}
+
+_NUMERIC_FIELDS = (models.DecimalField, models.IntegerField, models.FloatField)
+
+# Raised by coercers on a bad value; decimal.InvalidOperation is an ArithmeticError
+_COERCE_ERRORS = (ValueError, TypeError, ArithmeticError)
+
+
+def _identity(data):
+    return data
+
+
+def compile_path(path: str):
+    """
+    Compile a dotted provider path into an accessor; missing keys/indexes give None.
+    """
+    segments = path.split(".")
+    if WILDCARD in segments:
+        index = segments.index(WILDCARD)
+        outer = compile_path(".".join(segments[:index])) if index else _identity
+        inner = compile_path(".".join(segments[index + 1:])) if index + 1 < len(segments) else _identity
+
+        def get_each(data):
+            items = outer(data)
+            if not isinstance(items, list):
+                return None
+            return [value for value in map(inner, items) if value is not None]
+
+        return get_each
+
+    getters = [itemgetter(int(segment) if segment.isdigit() else segment) for segment in segments]
+    if len(getters) == 1:
+        getter = getters[0]
+
+        def get(data):
+            try:
+                return getter(data)
+            except (KeyError, IndexError, TypeError):
+                return None
+
+        return get
+
+    def get_chain(data):
+        try:
+            for getter in getters:
+                data = getter(data)
+            return data
+        except (KeyError, IndexError, TypeError):
+            return None
+
+    return get_chain
+
+
+def _field_accessor(field, path: str):
+    get = compile_path(path)
+    if WILDCARD in path.split(".") and not isinstance(field, models.JSONField):
+        # A wildcard fills a scalar column only when it matches exactly one value.
+        def get_single(data):
+            values = get(data)
+            return values[0] if values and len(values) == 1 else None
+
+        return get_single
+    return get
+
+
+def _empty_value(field):
+    """
+    Value stored when the provider omits a field: empty string for text columns
+    and 0 for non-nullable numbers, like the hand-written builders did.
+    """
+    if isinstance(field, models.CharField):
+        return ""
+    if isinstance(field, _NUMERIC_FIELDS) and not field.null:
+        return 0
+    return None
+
+
+def _decimal_coercer(field):
+    quantum = Decimal(1).scaleb(-field.decimal_places)
+    limit = Decimal(10) ** (field.max_digits - field.decimal_places)
+
+    def coerce(value):
+        if isinstance(value, bool):
+            raise TypeError(value)
+        # str() of a float is its shortest repr, Decimal(float) would keep the binary error
+        number = Decimal(str(value) if isinstance(value, float) else value).quantize(quantum)
+        if not number.is_finite() or abs(number) >= limit:
+            raise ValueError(value)
+        return number
+
+    return coerce, f"decimal({field.max_digits},{field.decimal_places})"
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    # QuickBooks sends dates as "2025-01-31", sometimes with a time part
+    return date.fromisoformat(value[:10])
+
+
+def _datetime_coercer(field):
+    tz = timezone.get_default_timezone() if settings.USE_TZ else None
+
+    def coerce(value):
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        elif not isinstance(value, datetime):
+            value = datetime.combine(_to_date(value), time())
+        if tz is not None and timezone.is_naive(value):
+            value = timezone.make_aware(value, tz)
+        return value
+
+    return coerce, "datetime"
+
+
+def _to_int(value):
+    if isinstance(value, bool) or isinstance(value, float) and not value.is_integer():
+        raise ValueError(value)
+    return int(value)
+
+
+def _char_coercer(field):
+    max_length = field.max_length
+
+    def coerce(value):
+        if isinstance(value, (dict, list)):
+            raise TypeError(value)
+        if not isinstance(value, str):
+            value = str(value)
+        if max_length and len(value) > max_length:
+            raise ValueError(value)
+        return value
+
+    return coerce, f"text({max_length})" if max_length else "text"
+
+
+def _coercer(field):
+    """
+    (coerce, description) for a model field, or (None, None) when values pass through.
+    Order matters: DateTimeField is a DateField subclass.
+    """
+    if isinstance(field, models.DecimalField):
+        return _decimal_coercer(field)
+    if isinstance(field, models.DateTimeField):
+        return _datetime_coercer(field)
+    if isinstance(field, models.DateField):
+        return _to_date, "date"
+    if isinstance(field, models.IntegerField):
+        return _to_int, "integer"
+    if isinstance(field, models.FloatField):
+        return float, "number"
+    if isinstance(field, models.CharField):
+        return _char_coercer(field)
+    return None, None
+
+
+def _coerce_column(name: str, coerce, description: str, values: list, errors: dict) -> list:
+    """
+    Coerce a whole column in one pass; only when some value fails is it redone
+    value by value to find the bad records, which get None and an error entry.
+    """
+    try:
+        return [None if value is None else coerce(value) for value in values]
+    except _COERCE_ERRORS:
+        pass
+
+    coerced = []
+    for index, value in enumerate(values):
+        if value is None:
+            coerced.append(None)
+            continue
+        try:
+            coerced.append(coerce(value))
+        except _COERCE_ERRORS:
+            errors.setdefault(index, {})[name] = f"expected {description}, got {value!r}"[:200]
+            coerced.append(None)
+    return coerced
+
+
+def mapping_fingerprint(paths: dict, required) -> str:
+    canonical = json.dumps([sorted(paths.items()), sorted(required)], separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class MappingPlan:
+    """
+    Compiled local field -> provider path mapping of one (company, provider, entity).
+    """
+
+    def __init__(self, model, paths: dict[str, str], required=()):
+        self.model = model
+        self.fields = []
+        self.paths = {}
+        self._accessors = []
+        self._coercers = []
+        self._empty = []
+        self._not_null = set()
+        for local_field, path in paths.items():
+            try:
+                field = model._meta.get_field(local_field)
+            except FieldDoesNotExist:
+                logger.warning(f"Ignoring mapping to unknown {model.__name__} field {local_field!r}.")
+                continue
+            if local_field in RESERVED_FIELDS or not field.concrete or field.primary_key:
+                logger.warning(f"Ignoring mapping to reserved {model.__name__} field {local_field!r}.")
+                continue
+            self.fields.append(local_field)
+            self.paths[local_field] = path
+            self._accessors.append(_field_accessor(field, path))
+            self._coercers.append(_coercer(field))
+            self._empty.append(_empty_value(field))
+            if not field.null and self._empty[-1] is None:
+                # Missing dates and the like would fail the NOT NULL constraint of the whole batch.
+                self._not_null.add(local_field)
+        self.required = frozenset(required) & set(self.fields)
+        self.fingerprint = mapping_fingerprint(self.paths, self.required)
+        # Fingerprint of the unfiltered paths it was built from, see get_mapping_plan
+        self.source = self.fingerprint
+
+    def columns(self, records: list[dict]) -> dict[str, list]:
+        """
+        Apply every accessor over the whole page: {local field: [value per record]}.
+        Missing values are None.
+        """
+        return {field: list(map(get, records)) for field, get in zip(self.fields, self._accessors)}
+
+    def rows(self, records: list[dict]) -> tuple[list[dict | None], dict[int, dict[str, str]]]:
+        """
+        Coerced model field values per record, missing values replaced by the column's empty value.
+
+        Returns:
+            (rows, errors): rows line up with `records`, None for a rejected record;
+            errors maps the index of each rejected record to {field: message}.
+        """
+        errors = {}
+        filled = []
+        for (name, values), (coerce, description), empty in zip(self.columns(records).items(), self._coercers,
+                                                                 self._empty):
+            if coerce is not None:
+                values = _coerce_column(name, coerce, description, values, errors)
+            if name in self.required or name in self._not_null:
+                if None in values or "" in values:
+                    for index, value in enumerate(values):
+                        if value is None or value == "":
+                            errors.setdefault(index, {}).setdefault(name, "required")
+            if empty is not None:
+                values = [empty if value is None else value for value in values]
+            filled.append(values)
+
+        if not filled:
+            return [{} for _ in records], errors
+        return [
+            None if index in errors else dict(zip(self.fields, values))
+            for index, values in enumerate(zip(*filled))
+        ], errors
+
+
+_plans: dict[tuple, MappingPlan] = {}
+_lock = threading.Lock()
+
+
+def get_mapping_plan(company_integration: CompanyIntegration, entity_name: str, model, default_paths: dict,
+                     reload: bool = True) -> MappingPlan:
+    """
+    Compiled plan for the integration's company, provider and `entity_name`.
+
+    With `reload` the company's mappings are read again (one query) and the plan is
+    recompiled only if they changed; without it a cached plan is returned as is.
+    Mappings with an empty provider_field keep the default path.
+    """
+    key = (company_integration.company_id, company_integration.provider_id, entity_name)
+    plan = _plans.get(key)
+    if plan is not None and not reload:
+        return plan
+
+    paths = dict(default_paths)
+    required = set()
+    mappings = ProviderFieldMapping.objects.filter(
+        company_id=company_integration.company_id,
+        provider_id=company_integration.provider_id,
+        entity_name=entity_name,
+    ).values_list("local_field", "provider_field", "is_required")
+    for local_field, provider_field, is_required in mappings:
+        if provider_field:
+            paths[local_field] = provider_field
+        if is_required:
+            required.add(local_field)
+
+    source = mapping_fingerprint(paths, required)
+    if plan is not None and plan.model is model and plan.source == source:
+        return plan
+
+    plan = MappingPlan(model, paths, required)
+    plan.source = source
+    with _lock:
+        _plans[key] = plan
+    return plan
+
+
+def cached_mapping_plan(company_integration: CompanyIntegration, entity_name: str) -> MappingPlan | None:
+    """
+    Plan compiled earlier in this process for the integration and entity, without a query.
+    """
+    return _plans.get((company_integration.company_id, company_integration.provider_id, entity_name))
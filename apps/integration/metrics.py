@@ -0,0 +1,63 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar("sync_metrics", default=None)
+
+
+class SyncMetrics:
+    """
+    Thread-safe counters and timers for one sync run.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values = defaultdict(float)
+
+    def add(self, name: str, value: float = 1):
+        with self._lock:
+            self.values[name] += value
+
+    def get(self, name: str) -> float:
+        return self.values.get(name, 0)
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+
+@contextmanager
+def collect_metrics():
+    """
+    Make a fresh SyncMetrics current for the block, so deep code paths
+    (HTTP client, bulk upsert) can record into it without plumbing.
+    Worker threads must run under contextvars.copy_context() to see it.
+    """
+    metrics = SyncMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+def record(name: str, value: float = 1):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add(name, value)
+
+
+@contextmanager
+def timer(name: str):
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    with metrics.timer(name):
+        yield
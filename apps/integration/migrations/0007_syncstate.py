@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-18 10:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integration', '0006_companyintegration_last_synced_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity_name', models.CharField(choices=[('Invoice', 'Invoice'), ('Customer', 'Customer')], max_length=50)),
+                ('last_updated_time', models.DateTimeField(blank=True, help_text='Latest provider LastUpdatedTime seen; next incremental sync starts here', null=True)),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('company_integration', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_states', to='integration.companyintegration')),
+            ],
+            options={
+                'unique_together': {('company_integration', 'entity_name')},
+            },
+        ),
+    ]
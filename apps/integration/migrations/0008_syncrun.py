@@ -0,0 +1,45 @@
+# Generated by Django 6.0 on 2026-10-18 10:53
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integration', '0007_syncstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity_name', models.CharField(choices=[('Invoice', 'Invoice'), ('Customer', 'Customer')], max_length=50)),
+                ('mode', models.CharField(choices=[('full', 'Full'), ('incremental', 'Incremental')], default='incremental', max_length=20)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('success', 'Success'), ('failed', 'Failed')], default='running', max_length=20)),
+                ('task_id', models.CharField(blank=True, db_index=True, max_length=255, null=True)),
+                ('started_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('http_calls', models.PositiveIntegerField(default=0)),
+                ('bytes_received', models.PositiveBigIntegerField(default=0)),
+                ('fetch_seconds', models.FloatField(default=0)),
+                ('transform_seconds', models.FloatField(default=0)),
+                ('db_write_seconds', models.FloatField(default=0)),
+                ('pages_fetched', models.PositiveIntegerField(default=0)),
+                ('rows_fetched', models.PositiveIntegerField(default=0)),
+                ('rows_created', models.PositiveIntegerField(default=0)),
+                ('rows_updated', models.PositiveIntegerField(default=0)),
+                ('rows_skipped', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('company_integration', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_runs', to='integration.companyintegration')),
+            ],
+            options={
+                'ordering': ('-started_at',),
+                'indexes': [models.Index(fields=['company_integration', 'entity_name', '-started_at'], name='integration_company_b4b3d9_idx')],
+            },
+        ),
+    ]
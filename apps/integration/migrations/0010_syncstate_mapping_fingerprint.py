@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 11:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integration', '0009_rawpayload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncstate',
+            name='mapping_fingerprint',
+            field=models.CharField(blank=True, default='', help_text='Field mapping the stored records were built with; a change forces a full resync', max_length=64),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 11:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integration', '0010_syncstate_mapping_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncrun',
+            name='rejects',
+            field=models.JSONField(blank=True, default=list, help_text='Records that could not be mapped: provider id and error per field (first few only)'),
+        ),
+        migrations.AddField(
+            model_name='syncrun',
+            name='rows_rejected',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-18 11:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integration', '0011_syncrun_rejects'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncrun',
+            name='resumed_from',
+            field=models.PositiveIntegerField(default=0, help_text='Records an interrupted run had already stored when this run resumed it'),
+        ),
+        migrations.AddField(
+            model_name='syncstate',
+            name='checkpoint_position',
+            field=models.PositiveIntegerField(default=0, help_text='Records of the in-flight run already stored; a retry resumes after them'),
+        ),
+        migrations.AddField(
+            model_name='syncstate',
+            name='checkpoint_updated_since',
+            field=models.DateTimeField(blank=True, help_text='Watermark the in-flight run queries from; it only resumes the same query', null=True),
+        ),
+        migrations.AddField(
+            model_name='syncstate',
+            name='checkpoint_watermark',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
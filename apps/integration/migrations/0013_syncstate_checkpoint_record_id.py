@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 11:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integration', '0012_sync_checkpoints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncstate',
+            name='checkpoint_record_id',
+            field=models.CharField(blank=True, default='', help_text='Provider id of the last record the in-flight run stored; a retry resumes after it', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='syncstate',
+            name='checkpoint_position',
+            field=models.PositiveIntegerField(default=0, help_text='Records of the in-flight run already stored'),
+        ),
+    ]
@@ -1,7 +1,11 @@
+import json
+import zlib
+
 from django.db import models
+from django.utils import timezone
 
 from apps.company.models import Company
-from utils.model_utils import EncryptedJSONField
+from utils.model_utils import EncryptedJSONField, LazyDecryptQuerySet
 
 
 class IntegrationProvider(models.Model):
@@ -27,6 +31,8 @@ class IntegrationProvider(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
 
+    objects = LazyDecryptQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
@@ -51,9 +57,14 @@ class CompanyIntegration(models.Model):
     is_active = models.BooleanField(default=True)
     last_synced_at = models.DateTimeField(null=True, blank=True)
 
+    objects = LazyDecryptQuerySet.as_manager()
+
     class Meta:
         unique_together = [("provider", "provider_identifier"), ("company", "provider")]
 
+    def __str__(self):
+        return f"{self.company} | {self.provider}"
+
 
 class ProviderFieldMapping(models.Model):
     ENTITY_CHOICES = [
@@ -90,3 +101,173 @@ class ProviderFieldMapping(models.Model):
 
     def __str__(self):
         return f"{self.company} | {self.provider} | {self.entity_name} | {self.local_field} -> {self.provider_field}"
+
+
+class SyncState(models.Model):
+    """
+    Per-entity sync bookkeeping for a company integration.
+    `last_updated_time` is the provider watermark used for incremental syncs.
+    """
+    company_integration = models.ForeignKey(
+        CompanyIntegration, on_delete=models.CASCADE, related_name="sync_states"
+    )
+    entity_name = models.CharField(max_length=50, choices=ProviderFieldMapping.ENTITY_CHOICES)
+    last_updated_time = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Latest provider LastUpdatedTime seen; next incremental sync starts here"
+    )
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    mapping_fingerprint = models.CharField(
+        max_length=64,
+        blank=True,
+        default="",
+        help_text="Field mapping the stored records were built with; a change forces a full resync"
+    )
+
+    # Progress of the current run, cleared when it completes
+    checkpoint_position = models.PositiveIntegerField(
+        default=0,
+        help_text="Records of the in-flight run already stored"
+    )
+    checkpoint_record_id = models.CharField(
+        max_length=255,
+        blank=True,
+        default="",
+        help_text="Provider id of the last record the in-flight run stored; a retry resumes after it"
+    )
+    checkpoint_updated_since = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Watermark the in-flight run queries from; it only resumes the same query"
+    )
+    checkpoint_watermark = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("company_integration", "entity_name")
+
+    def __str__(self):
+        return f"{self.company_integration_id} | {self.entity_name} | {self.last_updated_time}"
+
+
+class SyncRun(models.Model):
+    """
+    Ledger entry for one entity sync run, with throughput metrics.
+    """
+    MODE_FULL = "full"
+    MODE_INCREMENTAL = "incremental"
+    MODE_CHOICES = [
+        (MODE_FULL, "Full"),
+        (MODE_INCREMENTAL, "Incremental"),
+    ]
+
+    STATUS_RUNNING = "running"
+    STATUS_SUCCESS = "success"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_RUNNING, "Running"),
+        (STATUS_SUCCESS, "Success"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    company_integration = models.ForeignKey(
+        CompanyIntegration, on_delete=models.CASCADE, related_name="sync_runs"
+    )
+    entity_name = models.CharField(max_length=50, choices=ProviderFieldMapping.ENTITY_CHOICES)
+    mode = models.CharField(max_length=20, choices=MODE_CHOICES, default=MODE_INCREMENTAL)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_RUNNING)
+    task_id = models.CharField(max_length=255, blank=True, null=True, db_index=True)
+
+    started_at = models.DateTimeField(default=timezone.now, db_index=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    # Provider traffic
+    http_calls = models.PositiveIntegerField(default=0)
+    bytes_received = models.PositiveBigIntegerField(default=0)
+
+    # Wall time per stage, in seconds
+    fetch_seconds = models.FloatField(default=0)
+    transform_seconds = models.FloatField(default=0)
+    db_write_seconds = models.FloatField(default=0)
+
+    # Rows
+    pages_fetched = models.PositiveIntegerField(default=0)
+    rows_fetched = models.PositiveIntegerField(default=0)
+    rows_created = models.PositiveIntegerField(default=0)
+    rows_updated = models.PositiveIntegerField(default=0)
+    rows_skipped = models.PositiveIntegerField(default=0)
+    rows_rejected = models.PositiveIntegerField(default=0)
+    resumed_from = models.PositiveIntegerField(
+        default=0,
+        help_text="Records an interrupted run had already stored when this run resumed it"
+    )
+    rejects = models.JSONField(
+        default=list,
+        blank=True,
+        help_text="Records that could not be mapped: provider id and error per field (first few only)"
+    )
+
+    error = models.TextField(blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ("-started_at",)
+        indexes = [
+            models.Index(fields=["company_integration", "entity_name", "-started_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.company_integration_id} | {self.entity_name} | {self.mode} | {self.status}"
+
+    @property
+    def duration_seconds(self):
+        if not self.finished_at:
+            return None
+        return (self.finished_at - self.started_at).total_seconds()
+
+    @property
+    def rows_per_second(self):
+        duration = self.duration_seconds
+        if not duration:
+            return None
+        return round(self.rows_fetched / duration, 2)
+
+
+class RawPayload(models.Model):
+    """
+    Provider payload stored once, zlib-compressed, addressed by its SHA-256
+    (the `integration_hash` of the rows that reference it).
+    """
+    digest = models.CharField(max_length=64, unique=True)
+    data = models.BinaryField()
+    size = models.PositiveIntegerField(default=0, help_text="Uncompressed size in bytes")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.digest
+
+    @staticmethod
+    def pack(payload: dict) -> tuple[bytes, int]:
+        """
+        Compress a payload, returns (blob, uncompressed size).
+        """
+        raw = json.dumps(payload, separators=(",", ":"), default=str).encode()
+        return zlib.compress(raw), len(raw)
+
+    def unpack(self) -> dict:
+        return json.loads(zlib.decompress(self.data))
+
+    @classmethod
+    def load(cls, digest: str) -> dict | None:
+        """
+        Decompressed payload for `digest`, None if it is not stored.
+        """
+        blob = cls.objects.filter(digest=digest).values_list("data", flat=True).first()
+        if blob is None:
+            return None
+        return json.loads(zlib.decompress(blob))
@@ -0,0 +1,217 @@
+"""
+Provider-agnostic entity sync pipeline: fetch -> transform -> load.
+
+An EntityPipeline plugs three stages together for one (provider, entity):
+
+- fetch(company_integration, updated_since, concurrency, after_id) yields lists of provider records
+  (pages) ordered by record id, starting after record `after_id` when given (resuming an interrupted sync),
+- make_transform(company_integration) returns a function mapping one page of records to
+  (unsaved model instances, rejects), rejects being records that could not be mapped; it is
+  called once per sync on the calling thread, so it can read the DB (mappings, FKs) while the
+  returned function must not,
+- load(company_integration, objs, skip_unchanged=True) writes them and returns created/updated/skipped counts,
+- mapping_fingerprint(company_integration), optional, identifies the field mapping in use; when it
+  changes between syncs the next one re-reads and rewrites every record,
+- fetch_by_ids(company_integration, ids) and get_record_id(record), optional, fetch pages of the
+  given provider records for targeted refreshes (see apps.integration.services.sync.refresh_records);
+  without get_record_id an interrupted sync can not be resumed and starts over.
+
+Fetch and transform run in their own threads connected by bounded queues, so the next page
+is downloaded and mapped while the current one is written. Loading stays on the calling
+thread, DB writes keep its connection and transaction handling.
+
+Adding a provider or entity means registering a pipeline, see `register_pipeline`.
+"""
+import logging
+import queue
+import threading
+from collections.abc import Callable, Iterator
+from contextvars import copy_context
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connection
+
+from apps.integration.metrics import timer
+from apps.integration.models import CompanyIntegration
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class EntityPipeline:
+    provider_name: str
+    entity_name: str
+    fetch: Callable[[CompanyIntegration, datetime | None, int, str | None], Iterator[list[dict]]]
+    make_transform: Callable[[CompanyIntegration], Callable[[list[dict]], tuple[list, list[dict]]]]
+    load: Callable[..., dict]
+    # Provider change timestamp of a record, drives the incremental sync watermark
+    get_updated_time: Callable[[dict], datetime | None]
+    mapping_fingerprint: Callable[[CompanyIntegration], str] | None = None
+    fetch_by_ids: Callable[[CompanyIntegration, list[str]], Iterator[list[dict]]] | None = None
+    get_record_id: Callable[[dict], str] | None = None
+
+
+@dataclass
+class Batch:
+    """
+    One fetched page after the transform stage.
+    """
+    records: list[dict]
+    objs: list
+    # Latest change time of the accepted records
+    watermark: datetime | None
+    rejects: list[dict]
+    # Earliest change time of the rejected records, the saved watermark must not pass it
+    rejected_since: datetime | None = None
+
+
+# provider name -> entity name -> pipeline, entities kept in registration (= sync) order
+_pipelines: dict[str, dict[str, EntityPipeline]] = {}
+
+
+def register_pipeline(pipeline: EntityPipeline) -> EntityPipeline:
+    _pipelines.setdefault(pipeline.provider_name, {})[pipeline.entity_name] = pipeline
+    return pipeline
+
+
+def get_pipeline(provider_name: str, entity_name: str) -> EntityPipeline:
+    try:
+        return _pipelines[provider_name][entity_name]
+    except KeyError:
+        raise ValueError(f"No sync pipeline registered for {provider_name} {entity_name}") from None
+
+
+def registered_providers() -> list[str]:
+    return list(_pipelines)
+
+
+def provider_entities(provider_name: str) -> list[str]:
+    """
+    Entities synced for a provider, in sync order.
+    """
+    return list(_pipelines.get(provider_name, {}))
+
+
+class _StageError:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+_DONE = object()
+
+
+def _updated_times(pipeline: EntityPipeline, records: list[dict]) -> list[datetime]:
+    return [time for time in map(pipeline.get_updated_time, records) if time]
+
+
+def _page_watermarks(pipeline: EntityPipeline, records: list[dict],
+                     rejects: list[dict]) -> tuple[datetime | None, datetime | None]:
+    """
+    (latest change time of the accepted records, earliest of the rejected ones).
+    Without get_record_id rejected records can not be told apart, the whole page counts as rejected.
+    """
+    if not rejects:
+        return max(_updated_times(pipeline, records), default=None), None
+    if pipeline.get_record_id is None:
+        return None, min(_updated_times(pipeline, records), default=None)
+
+    rejected_ids = {str(reject["id"]) for reject in rejects}
+    accepted, rejected = [], []
+    for record in records:
+        (rejected if pipeline.get_record_id(record) in rejected_ids else accepted).append(record)
+    return (max(_updated_times(pipeline, accepted), default=None),
+            min(_updated_times(pipeline, rejected), default=None))
+
+
+def iter_batches(pipeline: EntityPipeline, company_integration: CompanyIntegration,
+                 updated_since: datetime | None = None, concurrency: int = 1,
+                 queue_size: int | None = None, after_id: str | None = None) -> Iterator[Batch]:
+    """
+    Run the fetch and transform stages in background threads and yield transformed
+    batches in fetch order, starting after record `after_id`. At most `queue_size` pages wait between two stages
+    (settings.INTEGRATION_PIPELINE_QUEUE_SIZE). A stage failure is re-raised here;
+    closing the iterator early stops both stages.
+    """
+    queue_size = queue_size or settings.INTEGRATION_PIPELINE_QUEUE_SIZE
+    transform = pipeline.make_transform(company_integration)
+    fetched = queue.Queue(maxsize=queue_size)
+    transformed = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(target: queue.Queue, item) -> bool:
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(source: queue.Queue):
+        while not stop.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def fetch_stage():
+        pages = None
+        try:
+            pages = pipeline.fetch(company_integration, updated_since, concurrency, after_id)
+            while True:
+                with timer("fetch_seconds"):
+                    records = next(pages, None)
+                if records is None:
+                    break
+                if not put(fetched, records):
+                    return
+            put(fetched, _DONE)
+        except BaseException as exc:
+            put(fetched, _StageError(exc))
+        finally:
+            if pages is not None and hasattr(pages, "close"):
+                pages.close()
+            # Token refresh may have opened a DB connection on this thread.
+            connection.close()
+
+    def transform_stage():
+        try:
+            while True:
+                item = get(fetched)
+                if item is _DONE or isinstance(item, _StageError):
+                    put(transformed, item)
+                    return
+                with timer("transform_seconds"):
+                    objs, rejects = transform(item)
+                    watermark, rejected_since = _page_watermarks(pipeline, item, rejects)
+                    batch = Batch(records=item, objs=objs, watermark=watermark, rejects=rejects,
+                                  rejected_since=rejected_since)
+                if not put(transformed, batch):
+                    return
+        except BaseException as exc:
+            put(transformed, _StageError(exc))
+
+    threads = [
+        # Each stage runs in a copy of the caller's context so its metrics reach the current sync run.
+        threading.Thread(target=copy_context().run, args=(stage,), daemon=True,
+                         name=f"sync-{pipeline.provider_name}-{pipeline.entity_name}-{stage.__name__}")
+        for stage in (fetch_stage, transform_stage)
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = transformed.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _StageError):
+                raise item.exc
+            yield item
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
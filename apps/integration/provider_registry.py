@@ -0,0 +1,91 @@
+import threading
+import time
+
+from django.conf import settings
+
+from apps.integration.models import IntegrationProvider
+
+_lock = threading.Lock()
+_by_name: dict[str, IntegrationProvider] = {}
+_by_id: dict[int, IntegrationProvider] = {}
+_loaded_at: float | None = None
+# Ids a reload did not find, with the time of that reload
+_missing_ids: dict[int, float] = {}
+
+
+def _registry_ttl() -> int:
+    return settings.INTEGRATION_PROVIDER_REGISTRY_TTL
+
+
+def _load():
+    """
+    Load every provider once and decrypt its config up front.
+    """
+    global _by_name, _by_id, _loaded_at
+    providers = list(IntegrationProvider.objects.all())
+    for provider in providers:
+        provider.config  # noqa: B018, decrypt now so cached instances never hit Fernet again
+    _by_name = {provider.name: provider for provider in providers}
+    _by_id = {provider.id: provider for provider in providers}
+    _loaded_at = time.monotonic()
+
+
+def _ensure_loaded():
+    # Signals only reach the current process, the TTL bounds staleness on other workers.
+    if _loaded_at is not None and time.monotonic() - _loaded_at < _registry_ttl():
+        return
+    with _lock:
+        if _loaded_at is None or time.monotonic() - _loaded_at >= _registry_ttl():
+            _load()
+
+
+def invalidate():
+    """
+    Drop the cached providers, the next lookup reloads them from the DB.
+    """
+    global _loaded_at
+    with _lock:
+        _loaded_at = None
+        _missing_ids.clear()
+
+
+def get_provider(name: str, active_only: bool = True) -> IntegrationProvider | None:
+    """
+    Cached IntegrationProvider by name, None if missing (or inactive with `active_only`).
+    The instance is shared, treat it as read-only.
+    """
+    _ensure_loaded()
+    provider = _by_name.get(name)
+    if provider is None or (active_only and not provider.is_active):
+        return None
+    return provider
+
+
+def get_provider_by_id(provider_id: int) -> IntegrationProvider | None:
+    """
+    Cached IntegrationProvider by primary key, active or not.
+    """
+    _ensure_loaded()
+    provider = _by_id.get(provider_id)
+    if provider is not None:
+        return provider
+    missed_at = _missing_ids.get(provider_id)
+    if missed_at is not None and time.monotonic() - missed_at < _registry_ttl():
+        return None
+    # Maybe created after the last load, reload once and remember a miss for the TTL
+    with _lock:
+        _load()
+        provider = _by_id.get(provider_id)
+        if provider is None:
+            _missing_ids[provider_id] = _loaded_at
+        else:
+            _missing_ids.pop(provider_id, None)
+    return provider
+
+
+def get_provider_config(provider_id: int) -> dict:
+    """
+    Decrypted config of a provider, as a copy callers may modify.
+    """
+    provider = get_provider_by_id(provider_id)
+    return dict(provider.config) if provider else {}
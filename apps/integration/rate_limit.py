@@ -0,0 +1,80 @@
+import logging
+import time
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Token bucket refilled continuously at `rate` tokens/second up to `capacity`.
+# Uses Redis server time so every worker shares one clock.
+# Returns "0" when a token was taken, otherwise the seconds to wait for the next one.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+_script = None
+
+
+class RateLimitTimeout(Exception):
+    pass
+
+
+def _token_bucket():
+    global _script
+    if _script is None:
+        _script = get_redis().register_script(TOKEN_BUCKET_SCRIPT)
+    return _script
+
+
+def acquire(provider_name: str, identifier: str, timeout: float | None = None):
+    """
+    Block until the (provider, identifier) bucket, e.g. a QuickBooks realm, grants one request.
+
+    Limits come from settings.INTEGRATION_RATE_LIMITS[provider_name]; providers
+    without an entry are not limited. If Redis is unreachable the call is let
+    through rather than stopping every sync.
+    Raises RateLimitTimeout if no token is granted within `timeout` seconds.
+    """
+    limit = settings.INTEGRATION_RATE_LIMITS.get(provider_name)
+    if not limit or not identifier:
+        return
+
+    rate = limit["per_minute"] / 60
+    capacity = limit.get("burst", 1)
+    key = f"ratelimit:{provider_name}:{identifier}"
+    timeout = settings.INTEGRATION_RATE_LIMIT_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+
+    while True:
+        try:
+            wait = float(_token_bucket()(keys=[key], args=[rate, capacity]))
+        except RedisError as exc:
+            logger.warning(f"Rate limiter unavailable for {key}, continuing without it: {exc}")
+            return
+        if wait <= 0:
+            return
+        if time.monotonic() + wait > deadline:
+            raise RateLimitTimeout(f"Rate limit for {key} not granted within {timeout}s")
+        time.sleep(wait)
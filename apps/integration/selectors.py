@@ -1,77 +1,349 @@
-import requests
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from datetime import datetime
+from itertools import islice
+
 from django.conf import settings
+from apps.integration import metrics
+from apps.integration.http_client import provider_get
 from apps.integration.models import CompanyIntegration
-from apps.integration.services import refresh_qbo_token_for_integration
+from apps.integration.provider_registry import get_provider_by_id, get_provider_config
+from apps.integration.services.bulk import chunked
+from apps.integration.services.integration_provider import refresh_qbo_token_for_integration
 
+try:
+    import ijson
+except ImportError:  # declared dependency, without it responses are parsed whole with response.json()
+    ijson = None
 
-def get_qbo_customers(company_integration: CompanyIntegration):
+logger = logging.getLogger(__name__)
+_ijson_missing_warned = False
+
+# QuickBooks caps MAXRESULTS at 1000 rows per query.
+QBO_MAX_RESULTS = 1000
+# Ids per "WHERE Id IN (...)" query, keeps the GET query string well under URL limits
+QBO_MAX_IDS_PER_QUERY = 200
+QBO_MINOR_VERSION = "75"
+
+
+def _qbo_quote(value) -> str:
+    return "'" + str(value).replace("'", "\\'") + "'"
+
+
+def build_qbo_query(entity: str, updated_since: datetime | None = None, select: str = "*", ids=None,
+                    after_id: str | None = None) -> str:
     """
-    Fetch QuickBooks customers for a given company integration.
-    Handles token refresh automatically.
-    Returns a list of customers or raises an exception.
+    Build the base QuickBooks query for an entity, optionally limited to records
+    changed at or after `updated_since` (MetaData.LastUpdatedTime), to the given `ids`
+    or to records after `after_id`.
+    Record queries are ordered by Id, so STARTPOSITION offsets (page fetches) address
+    the same records on every request and a resumed sync can continue after the last Id it stored.
     """
-    access_token = refresh_qbo_token_for_integration(company_integration)
-    if not access_token:
-        raise Exception("QuickBooks not connected or token expired")
+    conditions = []
+    if updated_since:
+        conditions.append(f"MetaData.LastUpdatedTime >= '{updated_since.isoformat()}'")
+    if ids is not None:
+        conditions.append(f"Id IN ({', '.join(map(_qbo_quote, ids))})")
+    if after_id:
+        conditions.append(f"Id > {_qbo_quote(after_id)}")
+
+    query = f"SELECT {select} FROM {entity}"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    if not select.upper().startswith("COUNT("):
+        query += " ORDERBY Id"
+    return query
+
 
+def get_qbo_last_updated_time(record: dict) -> datetime | None:
+    """
+    Parse MetaData.LastUpdatedTime of a QuickBooks record.
+    """
+    value = record.get("MetaData", {}).get("LastUpdatedTime")
+    if not value:
+        return None
+    return datetime.fromisoformat(value)
+
+
+def _get_qbo_query_url(company_integration: CompanyIntegration) -> str:
     realm_id = company_integration.provider_data.get("realm_id")
     if not realm_id:
         raise Exception("Realm ID not found for company integration")
 
-    base_url = company_integration.provider.config.get(
+    base_url = get_provider_config(company_integration.provider_id).get(
         "api_base_url",
         settings.QBO_BASE_URL
     )
+    return f"{base_url}/v3/company/{realm_id}/query"
+
+
+def _get_qbo_access_token(company_integration: CompanyIntegration) -> str:
+    access_token = refresh_qbo_token_for_integration(company_integration)
+    if not access_token:
+        raise Exception("QuickBooks not connected or token expired")
+    return access_token
+
+
+def _qbo_rate_limit_key(company_integration: CompanyIntegration) -> tuple[str, str]:
+    """
+    Rate limiter bucket of the integration's realm. May read the provider registry
+    (and the DB), resolve it on the calling thread.
+    """
+    return get_provider_by_id(company_integration.provider_id).name, company_integration.provider_identifier
 
-    url = f"{base_url}/v3/company/{realm_id}/query"
-    query = "SELECT * FROM Customer MAXRESULTS 1000"
 
+def _run_qbo_query(url: str, access_token: str, query: str, rate_limit_key: tuple[str, str]) -> dict:
+    """
+    Run one QuickBooks query and return its QueryResponse.
+    Only does HTTP (no DB access), so it is safe to call from worker threads.
+    """
     headers = {
         "Authorization": f"Bearer {access_token}",
         "Accept": "application/json"
     }
+    params = {
+        "query": query,
+        "minorversion": QBO_MINOR_VERSION,
+    }
 
-    response = requests.get(url, headers=headers, params={"query": query}, timeout=10)
+    response = provider_get(
+        url,
+        headers=headers,
+        params=params,
+        rate_limit_key=rate_limit_key,
+    )
     response.raise_for_status()
-
-    data = response.json()
-    customers = data.get("QueryResponse", {}).get("Customer", [])
-    return customers
+    return response.json().get("QueryResponse", {})
 
 
-def get_qbo_invoices(company_integration: CompanyIntegration):
+class _CountingReader:
     """
-    Fetch QuickBooks Invoices for a given company integration.
-    Handles token refresh automatically.
-    Returns a list of invoices an exception.
+    File-like view of a streamed response body that records bytes_received as it is read.
     """
-    access_token = refresh_qbo_token_for_integration(company_integration)
-    if not access_token:
-        raise Exception("QuickBooks not connected or token expired")
 
-    realm_id = company_integration.provider_data.get("realm_id")
-    if not realm_id:
-        raise Exception("Realm ID not found for company integration")
+    def __init__(self, raw):
+        self.raw = raw
 
-    base_url = company_integration.provider.config.get(
-        "api_base_url",
-        settings.QBO_BASE_URL
-    )
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        metrics.record("bytes_received", len(data))
+        return data
 
-    url = f"{base_url}/v3/company/{realm_id}/query"
-    params = {
-        "query": "SELECT * FROM Invoice  MAXRESULTS 1000",
-        "minorversion": "75"  #
-    }
 
+def _stream_qbo_query(url: str, access_token: str, query: str, entity: str, rate_limit_key: tuple[str, str]):
+    """
+    Run one QuickBooks query and yield QueryResponse.<entity> records one at a time,
+    decoding the body incrementally with ijson. Neither the raw body nor the
+    whole record list is ever held in memory.
+    """
     headers = {
         "Authorization": f"Bearer {access_token}",
         "Accept": "application/json"
     }
+    params = {
+        "query": query,
+        "minorversion": QBO_MINOR_VERSION,
+    }
+
+    response = provider_get(
+        url,
+        headers=headers,
+        params=params,
+        rate_limit_key=rate_limit_key,
+        stream=True,
+    )
+    try:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        # use_float keeps numbers as float, like response.json()
+        yield from ijson.items(_CountingReader(response.raw), f"QueryResponse.{entity}.item", use_float=True)
+    finally:
+        response.close()
 
-    response = requests.get(url, headers=headers, params=params, timeout=10)
-    response.raise_for_status()
 
-    data = response.json()
-    customers = data.get("QueryResponse", {}).get("Invoice", [])
-    return customers
+def stream_parse_enabled() -> bool:
+    global _ijson_missing_warned
+    if not settings.INTEGRATION_STREAM_PARSE:
+        return False
+    if ijson is None:
+        if not _ijson_missing_warned:
+            logger.warning("INTEGRATION_STREAM_PARSE is on but ijson is not installed, parsing responses whole.")
+            _ijson_missing_warned = True
+        return False
+    return True
+
+
+def get_qbo_count(company_integration: CompanyIntegration, entity: str, updated_since: datetime | None = None,
+                  after_id: str | None = None) -> int:
+    """
+    Number of records a (possibly incremental or resumed) entity query will return.
+    """
+    query = build_qbo_query(entity, updated_since=updated_since, select="COUNT(*)", after_id=after_id)
+    query_response = _run_qbo_query(
+        _get_qbo_query_url(company_integration),
+        _get_qbo_access_token(company_integration),
+        query,
+        _qbo_rate_limit_key(company_integration),
+    )
+    return query_response.get("totalCount", 0)
+
+
+def iter_qbo_pages(company_integration: CompanyIntegration, entity: str, page_size: int = QBO_MAX_RESULTS,
+                   updated_since: datetime | None = None, concurrency: int = 1, stream: bool | None = None,
+                   after_id: str | None = None):
+    """
+    Lazily fetch a QuickBooks entity page by page using STARTPOSITION/MAXRESULTS.
+    Yields one list of records per page as soon as it arrives, so callers can
+    persist a page before the next one is requested.
+    The access token is re-checked before every page, long syncs survive expiry.
+    Pass `updated_since` to only fetch records changed since a watermark and
+    `after_id` to skip the records (ordered by Id) an interrupted sync already stored.
+
+    With `concurrency` > 1 a COUNT query sizes the result set first and up to
+    `concurrency` pages are fetched ahead in threads. Pages are still yielded
+    in order and at most `concurrency` unconsumed pages are held in memory.
+    Every request goes through the per-realm rate limiter either way.
+
+    With `stream` (settings.INTEGRATION_STREAM_PARSE when ijson is installed)
+    responses are decoded incrementally. Pages fetched sequentially are then
+    yielded in chunks of settings.INTEGRATION_STREAM_CHUNK_SIZE records while
+    the body is still being read, so memory no longer grows with `page_size`.
+    Every fetched page is counted in the `pages_fetched` metric.
+    """
+    url = _get_qbo_query_url(company_integration)
+    # Resolved here, iter_page runs on worker threads that must not touch the DB
+    rate_limit_key = _qbo_rate_limit_key(company_integration)
+    query = build_qbo_query(entity, updated_since=updated_since, after_id=after_id)
+    if stream is None:
+        stream = stream_parse_enabled()
+
+    def iter_page(position, access_token):
+        page_query = f"{query} STARTPOSITION {position} MAXRESULTS {page_size}"
+        if stream:
+            records = _stream_qbo_query(url, access_token, page_query, entity, rate_limit_key)
+        else:
+            records = _run_qbo_query(url, access_token, page_query, rate_limit_key).get(entity, [])
+        for index, record in enumerate(records):
+            if index == 0:
+                metrics.record("pages_fetched")
+            yield record
+
+    def fetch_page(position, access_token):
+        return list(iter_page(position, access_token))
+
+    start_position = 1
+    records = []
+    if concurrency > 1:
+        total = get_qbo_count(company_integration, entity, updated_since=updated_since, after_id=after_id)
+        if total > page_size:
+            positions = iter(range(start_position, total + 1, page_size))
+            executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"qbo-{entity}")
+
+            def submit(position):
+                # Token refresh touches the DB, keep it on the calling thread.
+                access_token = _get_qbo_access_token(company_integration)
+                # Run in a copy of the caller's context so HTTP metrics reach the current sync run.
+                return position, executor.submit(copy_context().run, fetch_page, position, access_token)
+
+            try:
+                window = deque(submit(position) for position in islice(positions, concurrency))
+                while window:
+                    start_position, future = window.popleft()
+                    records = future.result()
+                    position = next(positions, None)
+                    if position is not None:
+                        window.append(submit(position))
+                    if records:
+                        yield records
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+            # Rows added since the COUNT query are picked up sequentially below.
+            if len(records) < page_size:
+                return
+            start_position += page_size
+
+    chunk_size = settings.INTEGRATION_STREAM_CHUNK_SIZE if stream else page_size
+    while True:
+        page_count = 0
+        for records in chunked(iter_page(start_position, _get_qbo_access_token(company_integration)), chunk_size):
+            page_count += len(records)
+            yield records
+
+        # A short page means we reached the end of the result set.
+        if page_count < page_size:
+            return
+        start_position += page_size
+
+
+def iter_qbo_pages_by_ids(company_integration: CompanyIntegration, entity: str, ids,
+                          chunk_size: int = QBO_MAX_IDS_PER_QUERY):
+    """
+    Fetch specific QuickBooks records with "WHERE Id IN (...)" queries, `chunk_size`
+    ids per request. Yields one list of records per request; ids that no longer
+    exist (deleted) are simply absent.
+    """
+    url = _get_qbo_query_url(company_integration)
+    rate_limit_key = _qbo_rate_limit_key(company_integration)
+    for chunk in chunked(dict.fromkeys(map(str, ids)), chunk_size):
+        query = f"{build_qbo_query(entity, ids=chunk)} MAXRESULTS {QBO_MAX_RESULTS}"
+        records = _run_qbo_query(
+            url, _get_qbo_access_token(company_integration), query, rate_limit_key
+        ).get(entity, [])
+        metrics.record("pages_fetched")
+        if records:
+            yield records
+
+
+def iter_qbo_customer_pages(company_integration: CompanyIntegration, page_size: int = QBO_MAX_RESULTS,
+                            updated_since: datetime | None = None, concurrency: int = 1):
+    """
+    Yield QuickBooks customers one page at a time.
+    """
+    return iter_qbo_pages(company_integration, "Customer", page_size=page_size, updated_since=updated_since,
+                          concurrency=concurrency)
+
+
+def iter_qbo_invoice_pages(company_integration: CompanyIntegration, page_size: int = QBO_MAX_RESULTS,
+                           updated_since: datetime | None = None, concurrency: int = 1):
+    """
+    Yield QuickBooks invoices one page at a time.
+    """
+    return iter_qbo_pages(company_integration, "Invoice", page_size=page_size, updated_since=updated_since,
+                          concurrency=concurrency)
+
+
+def get_qbo_customers(company_integration: CompanyIntegration):
+    """
+    Fetch QuickBooks customers for a given company integration.
+    Handles token refresh automatically.
+    Returns a list of all customers (every page) or raises an exception.
+    """
+    return [customer for page in iter_qbo_customer_pages(company_integration) for customer in page]
+
+
+def get_qbo_customers_by_ids(company_integration: CompanyIntegration, ids):
+    """
+    Fetch specific QuickBooks customers by id, one query per QBO_MAX_IDS_PER_QUERY ids.
+    Returns the customers found; deleted ids are missing from the result.
+    """
+    return [customer for page in iter_qbo_pages_by_ids(company_integration, "Customer", ids) for customer in page]
+
+
+def get_qbo_invoices_by_ids(company_integration: CompanyIntegration, ids):
+    """
+    Fetch specific QuickBooks invoices by id, one query per QBO_MAX_IDS_PER_QUERY ids.
+    Returns the invoices found; deleted ids are missing from the result.
+    """
+    return [invoice for page in iter_qbo_pages_by_ids(company_integration, "Invoice", ids) for invoice in page]
+
+
+def get_qbo_invoices(company_integration: CompanyIntegration):
+    """
+    Fetch QuickBooks Invoices for a given company integration.
+    Handles token refresh automatically.
+    Returns a list of all invoices (every page) or raises an exception.
+    """
+    return [invoice for page in iter_qbo_invoice_pages(company_integration) for invoice in page]
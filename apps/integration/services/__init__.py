@@ -2,3 +2,7 @@ from .customer import *
 from .integration_provider import *
 
 from .invoice import *
+from .sync import *
+from .bulk import *
+from .raw_payload import *
+from .webhook import *
@@ -0,0 +1,110 @@
+import hashlib
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+
+from apps.integration.metrics import timer
+
+
+def chunked(iterable, size: int):
+    """
+    Split any iterable into lists of at most `size` items without materialising it.
+    """
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def payload_hash(data: dict) -> str:
+    """
+    Stable SHA-256 of a provider payload, independent of key order.
+    """
+    canonical = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _unique_key(obj, fields):
+    return tuple(getattr(obj, field.attname) for field in fields)
+
+
+def _existing_hashes(model, fields, keys, hash_field: str | None):
+    """
+    Return {key: stored hash} for the subset of `keys` (tuples of unique field values)
+    already stored, in one query. Hash is None when no `hash_field` is given.
+    """
+    filters = {}
+    for index, field in enumerate(fields):
+        values = {key[index] for key in keys}
+        if len(values) == 1:
+            value = values.pop()
+            if value is None:
+                filters[f"{field.attname}__isnull"] = True
+            else:
+                filters[field.attname] = value
+        else:
+            filters[f"{field.attname}__in"] = values
+
+    attnames = [field.attname for field in fields]
+    rows = model.objects.filter(**filters).values_list(*attnames, *([hash_field] if hash_field else []))
+    wanted = set(keys)
+    existing = {}
+    for row in rows:
+        key = tuple(row[:len(attnames)])
+        if key in wanted:
+            existing[key] = row[len(attnames)] if hash_field else None
+    return existing
+
+
+def bulk_upsert(model, objs, unique_fields: list, update_fields: list, batch_size: int | None = None,
+                hash_field: str | None = None):
+    """
+    Insert or update model instances in batches, one INSERT ... ON CONFLICT DO UPDATE per batch.
+    With `hash_field`, rows whose stored hash equals the incoming one are skipped entirely.
+
+    Args:
+        model: Django model class, must have a unique constraint over `unique_fields`.
+        objs: Iterable of unsaved model instances.
+        unique_fields (list): Field names of the unique constraint used as conflict target.
+        update_fields (list): Field names rewritten when the row already exists.
+        batch_size (int): Rows per batch, defaults to settings.INTEGRATION_UPSERT_BATCH_SIZE.
+        hash_field (str): Optional field holding a payload hash used for change detection.
+
+    Returns:
+        dict: {"created": int, "updated": int, "skipped": int,
+               "batches": [{"created": int, "updated": int, "skipped": int}, ...]}
+    """
+    batch_size = batch_size or settings.INTEGRATION_UPSERT_BATCH_SIZE
+    fields = [model._meta.get_field(name) for name in unique_fields]
+    result = {"created": 0, "updated": 0, "skipped": 0, "batches": []}
+
+    for batch in chunked(objs, batch_size):
+        # ON CONFLICT cannot touch the same row twice in one statement; last one wins.
+        by_key = {_unique_key(obj, fields): obj for obj in batch}
+
+        with timer("db_write_seconds"), transaction.atomic():
+            existing = _existing_hashes(model, fields, list(by_key), hash_field)
+            changed = [
+                obj for key, obj in by_key.items()
+                if not (hash_field and key in existing and existing[key] and existing[key] == getattr(obj, hash_field))
+            ]
+            if changed:
+                model.objects.bulk_create(
+                    changed,
+                    update_conflicts=True,
+                    unique_fields=unique_fields,
+                    update_fields=update_fields,
+                )
+
+        skipped = len(by_key) - len(changed)
+        batch_result = {
+            "created": len(by_key) - len(existing),
+            "updated": len(existing) - skipped,
+            "skipped": skipped,
+        }
+        result["batches"].append(batch_result)
+        for counter in ("created", "updated", "skipped"):
+            result[counter] += batch_result[counter]
+
+    return result
@@ -1,54 +1,116 @@
-from django.db import transaction
 from apps.customer.models import Customer
+from apps.integration.mapping import cached_mapping_plan, get_mapping_plan
 from apps.integration.models import CompanyIntegration
+from apps.integration.metrics import timer
+from .bulk import bulk_upsert, payload_hash
+from .raw_payload import externalize_raw_payloads
 
+CUSTOMER_UNIQUE_FIELDS = ["company", "integration_provider", "customer_id"]
+# Rewritten on every update besides the mapped fields
+CUSTOMER_SYNC_FIELDS = ["integration_raw_data", "integration_hash", "modified_at"]
 
-def create_or_update_qbo_customers(company_integration: CompanyIntegration, customers: list):
+# Default QuickBooks paths, a company's ProviderFieldMapping rows override them
+QBO_CUSTOMER_FIELD_PATHS = {
+    "customer_id": "Id",
+    "company_name": "CompanyName",
+    "sales_tax_id": "SalesTaxCodeRef.value",
+    "license_id": "TaxExemptionRef.value",
+    "dba": "DisplayName",
+    "tax_id": "TaxIdentifier",
+    "country": "BillAddr.Country",
+    "city": "BillAddr.City",
+    "state": "BillAddr.CountrySubDivisionCode",
+    "street_address": "BillAddr.Line1",
+    "zipcode": "BillAddr.PostalCode",
+    "company_email1": "PrimaryEmailAddr.Address",
+    "company_email2": "OtherEmailAddr.Address",
+    "company_contact1": "PrimaryPhone.FreeFormNumber",
+    "company_contact2": "AlternatePhone.FreeFormNumber",
+}
+
+
+def get_qbo_customer_plan(company_integration: CompanyIntegration, reload: bool = True):
     """
-    Save or update customers from a provider (e.g., QuickBooks) for a specific company.
+    Compiled QuickBooks customer mapping of the integration's company.
+    `reload` re-reads the company's mappings (one query), see `get_mapping_plan`.
+    """
+    return get_mapping_plan(company_integration, "Customer", Customer, QBO_CUSTOMER_FIELD_PATHS, reload=reload)
 
-    Args:
-        company_integration (CompanyIntegration): The company integration object.
-        customers(list): List of customer dicts from the provider API.
+
+def make_qbo_customer_transform(company_integration: CompanyIntegration):
+    """
+    Sync pipeline transform stage: QuickBooks customer page -> (unsaved Customers, rejects),
+    mapped and type-coerced through the company's compiled field mapping.
+    Records with bad or missing required values are returned as
+    {"id": provider id, "errors": {field: message}} rejects instead of being built.
     """
     company = company_integration.company
     provider = company_integration.provider
+    plan = get_qbo_customer_plan(company_integration)
 
-    with transaction.atomic():
-        for data in customers:
-            # Extract address info
-            addresses = data.get("BillAddr", {})
-            primary_email = data.get("PrimaryEmailAddr", {}).get("Address")
-            secondary_email = data.get("OtherEmailAddr", {}).get("Address") if data.get("OtherEmailAddr") else None
-            primary_phone = data.get("PrimaryPhone", {}).get("FreeFormNumber")
-            secondary_phone = data.get("AlternatePhone", {}).get("FreeFormNumber") if data.get(
-                "AlternatePhone") else None
-
-            # Prepare defaults for update_or_create
-            customer_defaults = {
-                "company": company,
-                "integration_provider": provider,
-                "integration_raw_data": data,
-                "company_name": data.get("CompanyName", ""),
-                "sales_tax_id": data.get("SalesTaxCodeRef", {}).get("value", ""),
-                "customer_id": data.get("Id", ""),
-                "license_id": data.get("TaxExemptionRef", {}).get("value", ""),
-                "dba": data.get("DisplayName", ""),
-                "tax_id": data.get("TaxIdentifier", ""),
-                "country": addresses.get("Country", ""),
-                "city": addresses.get("City", ""),
-                "state": addresses.get("CountrySubDivisionCode", ""),
-                "street_address": addresses.get("Line1", ""),
-                "zipcode": addresses.get("PostalCode", ""),
-                "company_email1": primary_email or "",
-                "company_email2": secondary_email or "",
-                "company_contact1": primary_phone or "",
-                "company_contact2": secondary_phone or "",
-            }
-
-            # Create or update
-            customer, created = Customer.objects.update_or_create(
+    def transform(customers):
+        rows, errors = plan.rows(customers)
+        objs = [
+            Customer(
                 company=company,
-                customer_id=data.get("Id", ""),
-                defaults=customer_defaults
+                integration_provider=provider,
+                integration_raw_data=data,
+                integration_hash=payload_hash(data),
+                **values,
             )
+            for data, values in zip(customers, rows) if values is not None
+        ]
+        rejects = [{"id": customers[index].get("Id"), "errors": field_errors} for index, field_errors in errors.items()]
+        return objs, rejects
+
+    return transform
+
+
+def load_customers(company_integration: CompanyIntegration, customers: list[Customer], batch_size: int | None = None,
+                   skip_unchanged: bool = True):
+    """
+    Sync pipeline load stage: bulk upsert built Customers, provider-independent.
+    Only the fields of the entity's mapping plan are rewritten on update.
+    Raw payloads go to compressed storage first when that mode is enabled.
+
+    Returns:
+        dict: created/updated/skipped totals and per-batch counts, see `bulk_upsert`.
+    """
+    plan = cached_mapping_plan(company_integration, "Customer")
+    mapped_fields = plan.fields if plan else list(QBO_CUSTOMER_FIELD_PATHS)
+    update_fields = [field for field in mapped_fields if field not in CUSTOMER_UNIQUE_FIELDS] + CUSTOMER_SYNC_FIELDS
+
+    # Payloads first, so no row ever points at a digest that is not stored.
+    externalize_raw_payloads(customers, batch_size=batch_size)
+
+    return bulk_upsert(
+        Customer,
+        customers,
+        unique_fields=CUSTOMER_UNIQUE_FIELDS,
+        update_fields=update_fields,
+        batch_size=batch_size,
+        hash_field="integration_hash" if skip_unchanged else None,
+    )
+
+
+def create_or_update_qbo_customers(company_integration: CompanyIntegration, customers, batch_size: int | None = None,
+                                   skip_unchanged: bool = True):
+    """
+    Save or update customers from a provider (e.g., QuickBooks) for a specific company.
+
+    Args:
+        company_integration (CompanyIntegration): The company integration object.
+        customers: Iterable of customer dicts from the provider API.
+        batch_size (int): Rows per bulk upsert round trip.
+        skip_unchanged (bool): Skip rows whose stored payload hash matches the incoming payload.
+
+    Returns:
+        dict: created/updated/skipped totals and per-batch counts, see `bulk_upsert`,
+        plus the rejected count and rejects of records that could not be mapped.
+    """
+    transform = make_qbo_customer_transform(company_integration)
+    with timer("transform_seconds"):
+        objs, rejects = transform(list(customers))
+
+    result = load_customers(company_integration, objs, batch_size=batch_size, skip_unchanged=skip_unchanged)
+    return dict(result, rejected=len(rejects), rejects=rejects)
@@ -1,47 +1,177 @@
+import logging
+
+from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
 from intuitlib.client import AuthClient
+from redis.exceptions import LockError, RedisError
 
 from apps.integration.models import CompanyIntegration, ProviderFieldMapping
+from apps.integration.provider_registry import get_provider_config
+from utils.encryption import decrypt_value_cached, encrypt_value
+from utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+def _access_token_key(company_integration_id: int) -> str:
+    return f"access-token:{company_integration_id}"
+
+
+def _refresh_lock_key(company_integration_id: int) -> str:
+    return f"access-token-refresh:{company_integration_id}"
+
+
+def _token_expiry(credentials: dict):
+    token_created_at = credentials.get("token_created_at")
+    if not token_created_at:
+        return None
+    return timezone.datetime.fromisoformat(token_created_at) + timedelta(seconds=credentials.get("expires_in") or 0)
 
 
-def refresh_qbo_token_for_integration(company_integration: CompanyIntegration):
+def _get_cached_access_token(company_integration_id: int, min_valid_for: timedelta):
     """
-    Refresh access token using stored refresh token for CompanyIntegration.
+    Access token shared by all workers in Redis, if it stays valid for at least `min_valid_for`.
+    """
+    pipe = get_redis().pipeline()
+    pipe.get(_access_token_key(company_integration_id))
+    pipe.pttl(_access_token_key(company_integration_id))
+    token, ttl_ms = pipe.execute()
+    if token is None or ttl_ms < min_valid_for.total_seconds() * 1000:
+        return None
+    return decrypt_value_cached(token.decode())
+
+
+def cache_access_token(company_integration_id: int, credentials: dict):
+    """
+    Share a token with the other workers until it expires. Stored encrypted, like the DB copy.
+    """
+    expiry = _token_expiry(credentials)
+    if not expiry or not credentials.get("access_token"):
+        return
+    ttl = int((expiry - timezone.now()).total_seconds())
+    if ttl <= 0:
+        return
+    try:
+        get_redis().set(_access_token_key(company_integration_id), encrypt_value(credentials["access_token"]), ex=ttl)
+    except RedisError:
+        logger.warning(f"Could not cache access token for integration {company_integration_id}.", exc_info=True)
+
+
+def clear_cached_access_token(company_integration_id: int):
+    try:
+        get_redis().delete(_access_token_key(company_integration_id))
+    except RedisError:
+        logger.warning(f"Could not clear access token for integration {company_integration_id}.", exc_info=True)
+
+
+def get_qbo_token_state(company_integration: CompanyIntegration):
+    """
+    Current access token without calling Intuit, as (access_token, needs_refresh).
+    Reads the Redis token cache first and falls back to the stored credentials and
+    their expiry. access_token is None when no valid token is held, needs_refresh
+    is True when a refresh token exists but the access token (nearly) expired.
     """
+    margin = timedelta(seconds=settings.INTEGRATION_TOKEN_REFRESH_MARGIN)
+    try:
+        access_token = _get_cached_access_token(company_integration.id, margin)
+        if access_token:
+            return access_token, False
+    except RedisError:
+        logger.warning("Access token cache unavailable, reading stored credentials.", exc_info=True)
+
     credentials = company_integration.credentials
-    refresh_token = credentials.get("refresh_token")
-    expires_in = credentials.get("expires_in")
-    token_created_at = credentials.get("token_created_at")
+    if not credentials.get("refresh_token"):
+        return None, False
+    expiry = _token_expiry(credentials)
+    if expiry and expiry > timezone.now() + margin:
+        cache_access_token(company_integration.id, credentials)
+        return credentials.get("access_token"), False
+    return None, True
+
+
+def refresh_qbo_token_for_integration(company_integration: CompanyIntegration, min_valid_for: timedelta | None = None):
+    """
+    Refresh access token using stored refresh token for CompanyIntegration.
+    Valid tokens are served from Redis without touching the DB credentials.
+    Refresh is single-flight across workers: a Redis lock per integration is held
+    while refreshing, waiters re-read the credentials and reuse the rotated token
+    instead of spending the refresh token a second time.
+    Pass `min_valid_for` to refresh tokens expiring within that window (proactive refresh).
+    """
+    min_valid_for = min_valid_for or timedelta(seconds=settings.INTEGRATION_TOKEN_REFRESH_MARGIN)
 
-    if not refresh_token or not token_created_at:
+    try:
+        access_token = _get_cached_access_token(company_integration.id, min_valid_for)
+        if access_token:
+            return access_token
+    except RedisError:
+        logger.warning("Access token cache unavailable, reading stored credentials.", exc_info=True)
+
+    def valid_token():
+        expiry = _token_expiry(company_integration.credentials)
+        if expiry and expiry > timezone.now() + min_valid_for:
+            cache_access_token(company_integration.id, company_integration.credentials)
+            return company_integration.credentials.get("access_token")
+        return None
+
+    credentials = company_integration.credentials
+    if not credentials.get("refresh_token") or not credentials.get("token_created_at"):
         return None
 
     # Check if token is still valid
-    token_created = timezone.datetime.fromisoformat(token_created_at)
-    expiry_time = token_created + timedelta(seconds=expires_in)
-    if expiry_time > timezone.now() + timedelta(minutes=5):
-        return credentials.get("access_token")
-
-    # Refresh token
-    provider_config = company_integration.provider.config
-    auth_client = AuthClient(
-        client_id=provider_config.get("client_id"),
-        client_secret=provider_config.get("client_secret"),
-        redirect_uri=provider_config.get("redirect_uri"),
-        environment=provider_config.get("environment"),
+    access_token = valid_token()
+    if access_token:
+        return access_token
+
+    lock = get_redis().lock(
+        _refresh_lock_key(company_integration.id),
+        timeout=settings.INTEGRATION_TOKEN_REFRESH_LOCK_TIMEOUT,
+        blocking_timeout=settings.INTEGRATION_TOKEN_REFRESH_LOCK_TIMEOUT,
     )
-    auth_client.refresh(refresh_token)
-
-    # Update credentials
-    company_integration.credentials.update({
-        "access_token": auth_client.access_token,
-        "refresh_token": auth_client.refresh_token,
-        "expires_in": auth_client.expires_in,
-        "token_created_at": timezone.now().isoformat(),
-    })
-    company_integration.save(update_fields=["credentials"])
-    return auth_client.access_token
+    try:
+        acquired = lock.acquire()
+    except RedisError:
+        # Fail open, a refresh without the lock beats no sync at all.
+        logger.warning("Token refresh lock unavailable, refreshing without it.", exc_info=True)
+        lock, acquired = None, True
+    if not acquired:
+        raise Exception(f"Timed out waiting for token refresh of integration {company_integration.id}")
+
+    try:
+        # Another worker may have refreshed while we waited for the lock.
+        company_integration.refresh_from_db(fields=["credentials"])
+        access_token = valid_token()
+        if access_token:
+            return access_token
+
+        # Refresh token
+        provider_config = get_provider_config(company_integration.provider_id)
+        auth_client = AuthClient(
+            client_id=provider_config.get("client_id"),
+            client_secret=provider_config.get("client_secret"),
+            redirect_uri=provider_config.get("redirect_uri"),
+            environment=provider_config.get("environment"),
+        )
+        auth_client.refresh(company_integration.credentials.get("refresh_token"))
+
+        # Update credentials
+        company_integration.credentials.update({
+            "access_token": auth_client.access_token,
+            "refresh_token": auth_client.refresh_token,
+            "expires_in": auth_client.expires_in,
+            "token_created_at": timezone.now().isoformat(),
+        })
+        company_integration.save(update_fields=["credentials"])
+        cache_access_token(company_integration.id, company_integration.credentials)
+        return auth_client.access_token
+    finally:
+        if lock is not None:
+            try:
+                lock.release()
+            except (LockError, RedisError):
+                # Lock expired while refreshing, nothing left to release.
+                pass
 
 
 def create_default_invoice_field_mappings_qbo(company, integration_provider):
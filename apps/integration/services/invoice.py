@@ -1,31 +1,104 @@
-from django.db import transaction
-
 from apps.invoice.models import Invoice
+from apps.integration.mapping import cached_mapping_plan, get_mapping_plan
+from apps.integration.metrics import timer
+from .bulk import bulk_upsert, payload_hash
+from .raw_payload import externalize_raw_payloads
+
+INVOICE_UNIQUE_FIELDS = ["company", "integration_provider", "invoice_id"]
+# Rewritten on every update besides the mapped fields
+INVOICE_SYNC_FIELDS = ["integration_raw_data", "integration_hash", "modified_at"]
+
+# Default QuickBooks paths, a company's ProviderFieldMapping rows override and extend them
+# (see create_default_invoice_field_mappings_qbo)
+QBO_INVOICE_FIELD_PATHS = {
+    "invoice_id": "Id",
+    "invoice_no": "DocNumber",
+    "invoice_date": "TxnDate",
+    "due_date": "DueDate",
+    "customer_id": "CustomerRef.value",
+    "amount": "TotalAmt",
+    "invoice_balance": "Balance",
+}
+
 
+def get_qbo_invoice_plan(company_integration, reload: bool = True):
+    """
+    Compiled QuickBooks invoice mapping of the integration's company.
+    `reload` re-reads the company's mappings (one query), see `get_mapping_plan`.
+    """
+    return get_mapping_plan(company_integration, "Invoice", Invoice, QBO_INVOICE_FIELD_PATHS, reload=reload)
 
-def create_or_update_qbo_invoices(company_integration, invoices: list):
+
+def make_qbo_invoice_transform(company_integration):
+    """
+    Sync pipeline transform stage: QuickBooks invoice page -> (unsaved Invoices, rejects),
+    mapped and type-coerced through the company's compiled field mapping.
+    Records with bad or missing required values are returned as
+    {"id": provider id, "errors": {field: message}} rejects instead of being built.
+    """
     company = company_integration.company
     provider = company_integration.provider
+    plan = get_qbo_invoice_plan(company_integration)
 
-    with transaction.atomic():
-        for data in invoices:
-            invoice_id = data.get("Id")
-            customer_id = data.get("CustomerRef", {}).get("value")
-            invoice_no = data.get("DocNumber")
-            defaults = {
-                "integration_provider": provider,
-                "invoice_no": invoice_no,
-                "invoice_date": data.get("TxnDate"),
-                "due_date": data.get("DueDate"),
-                "customer_id": customer_id,
-                "amount": data.get("TotalAmt", 0),
-                "invoice_balance": data.get("Balance", 0),
-                "integration_raw_data": data,
-            }
-
-            invoice, created = Invoice.objects.update_or_create(
+    def transform(invoices):
+        rows, errors = plan.rows(invoices)
+        objs = [
+            Invoice(
                 company=company,
-                invoice_id=invoice_id,
-                integration_provider=company_integration.provider,
-                defaults=defaults
+                integration_provider=provider,
+                integration_raw_data=data,
+                integration_hash=payload_hash(data),
+                **values,
             )
+            for data, values in zip(invoices, rows) if values is not None
+        ]
+        rejects = [{"id": invoices[index].get("Id"), "errors": field_errors} for index, field_errors in errors.items()]
+        return objs, rejects
+
+    return transform
+
+
+def load_invoices(company_integration, invoices: list[Invoice], batch_size: int | None = None,
+                  skip_unchanged: bool = True):
+    """
+    Sync pipeline load stage: bulk upsert built Invoices, provider-independent.
+    Only the fields of the entity's mapping plan are rewritten on update,
+    so unmapped local columns (e.g. reference) keep their values.
+
+    Returns:
+        dict: created/updated/skipped totals and per-batch counts, see `bulk_upsert`.
+    """
+    plan = cached_mapping_plan(company_integration, "Invoice")
+    mapped_fields = plan.fields if plan else list(QBO_INVOICE_FIELD_PATHS)
+    update_fields = [field for field in mapped_fields if field not in INVOICE_UNIQUE_FIELDS] + INVOICE_SYNC_FIELDS
+
+    # Payloads first, so no row ever points at a digest that is not stored.
+    externalize_raw_payloads(invoices, batch_size=batch_size)
+
+    return bulk_upsert(
+        Invoice,
+        invoices,
+        unique_fields=INVOICE_UNIQUE_FIELDS,
+        update_fields=update_fields,
+        batch_size=batch_size,
+        hash_field="integration_hash" if skip_unchanged else None,
+    )
+
+
+def create_or_update_qbo_invoices(company_integration, invoices, batch_size: int | None = None,
+                                  skip_unchanged: bool = True):
+    """
+    Save or update invoices from QuickBooks for the integration's company
+    in bulk, `batch_size` rows per round trip. Invoices whose payload hash
+    did not change are skipped unless `skip_unchanged` is False.
+
+    Returns:
+        dict: created/updated/skipped totals and per-batch counts, see `bulk_upsert`,
+        plus the rejected count and rejects of records that could not be mapped.
+    """
+    transform = make_qbo_invoice_transform(company_integration)
+    with timer("transform_seconds"):
+        objs, rejects = transform(list(invoices))
+
+    result = load_invoices(company_integration, objs, batch_size=batch_size, skip_unchanged=skip_unchanged)
+    return dict(result, rejected=len(rejects), rejects=rejects)
@@ -0,0 +1,95 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from apps.customer.models import Customer
+from apps.integration.metrics import timer
+from apps.integration.models import RawPayload
+from apps.invoice.models import Invoice
+from .bulk import chunked
+
+# Models whose integration_hash addresses RawPayload rows
+RAW_PAYLOAD_MODELS = (Customer, Invoice)
+
+RAW_DATA_INLINE = "inline"
+RAW_DATA_COMPRESSED = "compressed"
+
+
+def store_raw_data_inline() -> bool:
+    """
+    Whether provider payloads go into the rows' integration_raw_data column
+    (INTEGRATION_RAW_DATA_STORAGE = "inline") or into compressed RawPayload rows.
+    """
+    return settings.INTEGRATION_RAW_DATA_STORAGE != RAW_DATA_COMPRESSED
+
+
+def externalize_raw_payloads(objs, batch_size: int | None = None):
+    """
+    In compressed storage mode move each object's integration_raw_data into
+    RawPayload (keyed by its integration_hash) and blank the inline column.
+    No-op in inline mode.
+    """
+    if store_raw_data_inline():
+        return
+    raw_payloads = {}
+    for obj in objs:
+        if obj.integration_raw_data:
+            raw_payloads[obj.integration_hash] = obj.integration_raw_data
+            obj.integration_raw_data = {}
+    store_raw_payloads(raw_payloads, batch_size=batch_size)
+
+
+def store_raw_payloads(payloads: dict, batch_size: int | None = None) -> int:
+    """
+    Store {digest: payload} as compressed RawPayload rows.
+    Digests already stored are neither compressed nor written again.
+
+    Returns:
+        int: Number of new payloads stored.
+    """
+    batch_size = batch_size or settings.INTEGRATION_UPSERT_BATCH_SIZE
+    stored = 0
+    for digests in chunked(payloads, batch_size):
+        with timer("db_write_seconds"):
+            existing = set(RawPayload.objects.filter(digest__in=digests).values_list("digest", flat=True))
+        missing = [digest for digest in digests if digest not in existing]
+        if not missing:
+            continue
+
+        with timer("transform_seconds"):
+            objs = []
+            for digest in missing:
+                data, size = RawPayload.pack(payloads[digest])
+                objs.append(RawPayload(digest=digest, data=data, size=size))
+        with timer("db_write_seconds"):
+            # Concurrent syncs may store the same payload, the digest makes that a no-op.
+            RawPayload.objects.bulk_create(objs, ignore_conflicts=True)
+        stored += len(objs)
+    return stored
+
+
+def delete_unreferenced_raw_payloads(batch_size: int | None = None) -> int:
+    """
+    Delete RawPayload rows no Customer or Invoice references any more (the record
+    changed or was deleted), `batch_size` rows per DELETE.
+    Rows younger than INTEGRATION_RAW_PAYLOAD_PRUNE_GRACE are kept, a sync may
+    have stored them but not yet written the rows that point at them.
+
+    Returns:
+        int: Number of payloads deleted.
+    """
+    batch_size = batch_size or settings.INTEGRATION_UPSERT_BATCH_SIZE
+    cutoff = timezone.now() - timedelta(seconds=settings.INTEGRATION_RAW_PAYLOAD_PRUNE_GRACE)
+    orphans = RawPayload.objects.filter(created_at__lt=cutoff)
+    for model in RAW_PAYLOAD_MODELS:
+        orphans = orphans.exclude(Exists(model.objects.filter(integration_hash=OuterRef("digest"))))
+
+    deleted = 0
+    while True:
+        ids = list(orphans.values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        count, _ = RawPayload.objects.filter(id__in=ids).delete()
+        deleted += count
@@ -0,0 +1,262 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+# Module import: selectors imports from this package, so bind names at call time.
+from apps.integration import selectors
+from apps.integration.metrics import collect_metrics
+from apps.integration.models import CompanyIntegration, SyncRun, SyncState
+from apps.integration.pipeline import EntityPipeline, get_pipeline, iter_batches, register_pipeline
+from apps.integration.provider_config import IntegrationProviderChoice
+from apps.integration.provider_registry import get_provider_by_id
+from .customer import get_qbo_customer_plan, load_customers, make_qbo_customer_transform
+from .invoice import get_qbo_invoice_plan, load_invoices, make_qbo_invoice_transform
+
+logger = logging.getLogger(__name__)
+
+
+def _qbo_fetcher(entity_name: str):
+    def fetch(company_integration, updated_since, concurrency, after_id=None):
+        return selectors.iter_qbo_pages(
+            company_integration, entity_name, updated_since=updated_since, concurrency=concurrency,
+            after_id=after_id,
+        )
+    return fetch
+
+
+def _qbo_fetcher_by_ids(entity_name: str):
+    def fetch_by_ids(company_integration, ids):
+        return selectors.iter_qbo_pages_by_ids(company_integration, entity_name, ids)
+    return fetch_by_ids
+
+
+register_pipeline(EntityPipeline(
+    provider_name=IntegrationProviderChoice.QUICKBOOKS,
+    entity_name="Customer",
+    fetch=_qbo_fetcher("Customer"),
+    make_transform=make_qbo_customer_transform,
+    load=load_customers,
+    get_updated_time=lambda record: selectors.get_qbo_last_updated_time(record),
+    mapping_fingerprint=lambda company_integration: get_qbo_customer_plan(company_integration).fingerprint,
+    fetch_by_ids=_qbo_fetcher_by_ids("Customer"),
+    get_record_id=lambda record: str(record.get("Id")),
+))
+register_pipeline(EntityPipeline(
+    provider_name=IntegrationProviderChoice.QUICKBOOKS,
+    entity_name="Invoice",
+    fetch=_qbo_fetcher("Invoice"),
+    make_transform=make_qbo_invoice_transform,
+    load=load_invoices,
+    get_updated_time=lambda record: selectors.get_qbo_last_updated_time(record),
+    mapping_fingerprint=lambda company_integration: get_qbo_invoice_plan(company_integration).fingerprint,
+    fetch_by_ids=_qbo_fetcher_by_ids("Invoice"),
+    get_record_id=lambda record: str(record.get("Id")),
+))
+
+
+CHECKPOINT_FIELDS = ["checkpoint_position", "checkpoint_record_id", "checkpoint_updated_since",
+                     "checkpoint_watermark", "modified_at"]
+
+
+def _saved_watermark(watermark, rejected_since):
+    """
+    Watermark to persist: never past a rejected record, so the next incremental
+    sync (LastUpdatedTime >= watermark) fetches it again.
+    """
+    if rejected_since and (watermark is None or rejected_since < watermark):
+        return rejected_since
+    return watermark
+
+
+def _store_run_metrics(sync_run: SyncRun, summary: dict, metrics):
+    summary["pages"] = int(metrics.get("pages_fetched"))
+    sync_run.pages_fetched = summary["pages"]
+    sync_run.rows_fetched = summary["fetched"]
+    sync_run.rows_created = summary["created"]
+    sync_run.rows_updated = summary["updated"]
+    sync_run.rows_skipped = summary["skipped"]
+    sync_run.rows_rejected = summary["rejected"]
+    sync_run.http_calls = int(metrics.get("http_calls"))
+    sync_run.bytes_received = int(metrics.get("bytes_received"))
+    sync_run.fetch_seconds = round(metrics.get("fetch_seconds"), 3)
+    sync_run.transform_seconds = round(metrics.get("transform_seconds"), 3)
+    sync_run.db_write_seconds = round(metrics.get("db_write_seconds"), 3)
+
+
+def sync_entity(company_integration: CompanyIntegration, entity_name: str, full_sync: bool = False,
+                concurrency: int | None = None, on_page=None, task_id: str | None = None):
+    """
+    Pull one entity of the integration's provider into the local DB through its
+    registered sync pipeline (fetch -> transform -> load, see apps.integration.pipeline).
+
+    By default only records changed since the stored per-entity watermark
+    are fetched. `full_sync=True` ignores the watermark and re-reads the whole ledger;
+    so does the first sync after the company's field mapping changed, rewriting every record.
+    Large result sets are fetched `concurrency` pages at a time
+    (settings.INTEGRATION_FETCH_CONCURRENCY by default).
+    `on_page(summary)` is called with the running totals after every persisted page
+    (or chunk of a page, when responses are stream-parsed).
+
+    Records with values that cannot be coerced to their column, or missing required
+    fields, are rejected at the transform stage and the rest of the page is still written.
+    The saved watermark stops at the earliest rejected record, so it is fetched again.
+    The first settings.INTEGRATION_SYNC_REJECTS_LIMIT rejects are kept on the SyncRun.
+
+    Progress is checkpointed on the SyncState after every persisted page: the id of the
+    last record written (pages come ordered by id), the number of records written and the
+    watermark seen so far. A run that fails (or whose worker dies) is resumed after that id
+    by the next sync of the same query, e.g. the task retry, as long as the checkpoint is
+    younger than settings.INTEGRATION_SYNC_CHECKPOINT_TTL. Resuming by id rather than by
+    position means records deleted meanwhile can not shift unfetched ones out of the run.
+
+    Every call is recorded as a SyncRun with HTTP, timing and row metrics.
+
+    Returns:
+        dict: pages/fetched/created/updated/skipped/rejected totals for the run, plus sync_run_id.
+    """
+    provider = get_provider_by_id(company_integration.provider_id)
+    pipeline = get_pipeline(provider.name, entity_name)
+    sync_state, _ = SyncState.objects.get_or_create(
+        company_integration=company_integration,
+        entity_name=entity_name,
+    )
+    fingerprint = pipeline.mapping_fingerprint(company_integration) if pipeline.mapping_fingerprint else ""
+    remap = fingerprint != sync_state.mapping_fingerprint and sync_state.last_synced_at is not None
+    updated_since = None if full_sync or remap else sync_state.last_updated_time
+
+    # The watermark only moves at the end of a run, so a retry builds the same query again.
+    after_id = None
+    resumed_from = 0
+    watermark = sync_state.last_updated_time
+    rejected_since = None
+    if (sync_state.checkpoint_record_id and pipeline.get_record_id
+            and sync_state.checkpoint_updated_since == updated_since
+            and timezone.now() - sync_state.modified_at < timedelta(seconds=settings.INTEGRATION_SYNC_CHECKPOINT_TTL)):
+        after_id = sync_state.checkpoint_record_id
+        resumed_from = sync_state.checkpoint_position
+        watermark = max(filter(None, (watermark, sync_state.checkpoint_watermark)), default=None)
+        # Rejects of the interrupted part are not known, never save a watermark past its checkpoint.
+        rejected_since = sync_state.checkpoint_watermark
+        logger.info(f"Resuming {provider.name} {entity_name} sync of integration {company_integration.id} "
+                    f"after record {after_id} ({resumed_from} records stored).")
+
+    sync_run = SyncRun.objects.create(
+        company_integration=company_integration,
+        entity_name=entity_name,
+        mode=SyncRun.MODE_INCREMENTAL if updated_since else SyncRun.MODE_FULL,
+        task_id=task_id,
+        resumed_from=resumed_from,
+    )
+    sync_state.checkpoint_position = resumed_from
+    sync_state.checkpoint_record_id = after_id or ""
+    sync_state.checkpoint_updated_since = updated_since
+    sync_state.checkpoint_watermark = watermark
+    summary = {"pages": 0, "fetched": 0, "created": 0, "updated": 0, "skipped": 0, "rejected": 0}
+    if concurrency is None:
+        concurrency = settings.INTEGRATION_FETCH_CONCURRENCY
+
+    with collect_metrics() as metrics:
+        try:
+            for batch in iter_batches(pipeline, company_integration, updated_since=updated_since,
+                                      concurrency=concurrency, after_id=after_id):
+                # Unchanged payloads still map to different values after a mapping change.
+                result = pipeline.load(company_integration, batch.objs, skip_unchanged=not remap)
+                summary["fetched"] += len(batch.records)
+                for counter in ("created", "updated", "skipped"):
+                    summary[counter] += result[counter]
+                if batch.rejects:
+                    summary["rejected"] += len(batch.rejects)
+                    room = settings.INTEGRATION_SYNC_REJECTS_LIMIT - len(sync_run.rejects)
+                    sync_run.rejects.extend(batch.rejects[:max(room, 0)])
+
+                if batch.watermark and (watermark is None or batch.watermark > watermark):
+                    watermark = batch.watermark
+                if batch.rejected_since and (rejected_since is None or batch.rejected_since < rejected_since):
+                    rejected_since = batch.rejected_since
+
+                # The page is committed, a retry can start after it.
+                sync_state.checkpoint_position += len(batch.records)
+                if pipeline.get_record_id and batch.records:
+                    sync_state.checkpoint_record_id = pipeline.get_record_id(batch.records[-1])
+                sync_state.checkpoint_watermark = _saved_watermark(watermark, rejected_since)
+                sync_state.save(update_fields=CHECKPOINT_FIELDS)
+
+                _store_run_metrics(sync_run, summary, metrics)
+                sync_run.save()
+                if on_page:
+                    on_page(summary)
+        except Exception as exc:
+            _store_run_metrics(sync_run, summary, metrics)
+            sync_run.status = SyncRun.STATUS_FAILED
+            sync_run.error = str(exc)
+            sync_run.finished_at = timezone.now()
+            sync_run.save()
+            raise
+
+    # Only move the watermark once every page is persisted.
+    now = timezone.now()
+    sync_state.last_updated_time = _saved_watermark(watermark, rejected_since)
+    sync_state.last_synced_at = now
+    sync_state.mapping_fingerprint = fingerprint
+    sync_state.checkpoint_position = 0
+    sync_state.checkpoint_record_id = ""
+    sync_state.checkpoint_updated_since = None
+    sync_state.checkpoint_watermark = None
+    sync_state.save(update_fields=["last_updated_time", "last_synced_at", "mapping_fingerprint", *CHECKPOINT_FIELDS])
+
+    company_integration.last_synced_at = now
+    company_integration.save(update_fields=["last_synced_at"])
+
+    _store_run_metrics(sync_run, summary, metrics)
+    sync_run.status = SyncRun.STATUS_SUCCESS
+    sync_run.finished_at = now
+    sync_run.save()
+    return dict(summary, sync_run_id=sync_run.id)
+
+
+def sync_qbo_entity(company_integration: CompanyIntegration, entity_name: str, full_sync: bool = False,
+                    concurrency: int | None = None, on_page=None, task_id: str | None = None):
+    """
+    Pull one QuickBooks entity into the local DB, see `sync_entity`.
+    """
+    return sync_entity(company_integration, entity_name, full_sync=full_sync, concurrency=concurrency,
+                       on_page=on_page, task_id=task_id)
+
+
+def refresh_records(company_integration: CompanyIntegration, entity_name: str, ids) -> dict:
+    """
+    Fetch specific records of one entity by provider id and upsert just those rows,
+    through the entity's sync pipeline (fetch_by_ids -> transform -> load).
+    Costs one provider call per chunk of ids instead of a sync; the sync watermark
+    is left alone.
+
+    Returns:
+        dict: fetched/created/updated/skipped/rejected totals, the requested ids the
+        provider did not return (deleted or unknown) as `missing`, and the rejects.
+    """
+    provider = get_provider_by_id(company_integration.provider_id)
+    pipeline = get_pipeline(provider.name, entity_name)
+    if pipeline.fetch_by_ids is None or pipeline.get_record_id is None:
+        raise ValueError(f"{provider.name} {entity_name} records can not be fetched by id")
+
+    ids = list(dict.fromkeys(map(str, ids)))
+    summary = {"fetched": 0, "created": 0, "updated": 0, "skipped": 0, "rejected": 0, "missing": [], "rejects": []}
+    if not ids:
+        return summary
+
+    transform = pipeline.make_transform(company_integration)
+    found = set()
+    for records in pipeline.fetch_by_ids(company_integration, ids):
+        objs, rejects = transform(records)
+        result = pipeline.load(company_integration, objs)
+        summary["fetched"] += len(records)
+        for counter in ("created", "updated", "skipped"):
+            summary[counter] += result[counter]
+        summary["rejected"] += len(rejects)
+        summary["rejects"].extend(rejects)
+        found.update(map(pipeline.get_record_id, records))
+
+    summary["missing"] = [record_id for record_id in ids if record_id not in found]
+    return summary
@@ -0,0 +1,182 @@
+import base64
+import hashlib
+import hmac
+import logging
+
+from django.conf import settings
+
+from apps.customer.models import Customer
+from apps.integration.models import CompanyIntegration
+from apps.integration.provider_config import IntegrationProviderChoice
+from apps.invoice.models import Invoice
+from utils.redis_client import get_redis
+from .sync import refresh_records
+
+logger = logging.getLogger(__name__)
+
+# Entities kept fresh by webhooks: local model and provider id field (for deletes)
+QBO_WEBHOOK_MODELS = {
+    "Customer": (Customer, "customer_id"),
+    "Invoice": (Invoice, "invoice_id"),
+}
+
+QBO_DELETE_OPERATION = "Delete"
+
+
+def _changed_key(company_integration_id, entity_name):
+    return f"webhook-changed:{company_integration_id}:{entity_name}"
+
+
+def _deleted_key(company_integration_id, entity_name):
+    return f"webhook-deleted:{company_integration_id}:{entity_name}"
+
+
+def _flush_queued_key(company_integration_id):
+    return f"webhook-flush-queued:{company_integration_id}"
+
+
+def verify_qbo_webhook_signature(body: bytes, signature: str | None) -> bool:
+    """
+    Check the intuit-signature header: base64 HMAC-SHA256 of the raw body keyed
+    with the app's webhook verifier token.
+    """
+    verifier_token = settings.QBO_WEBHOOK_VERIFIER_TOKEN
+    if not verifier_token or not signature:
+        return False
+    expected = base64.b64encode(hmac.new(verifier_token.encode(), body, hashlib.sha256).digest()).decode()
+    return hmac.compare_digest(expected, signature)
+
+
+def _qbo_events_by_realm(payload) -> dict[str, list[dict]]:
+    if not isinstance(payload, dict) or not isinstance(payload.get("eventNotifications", []), list):
+        raise ValueError("Unexpected QuickBooks webhook payload")
+    events_by_realm = {}
+    for notification in payload.get("eventNotifications", []):
+        if not isinstance(notification, dict):
+            raise ValueError("Unexpected QuickBooks webhook notification")
+        change_event = notification.get("dataChangeEvent")
+        if change_event is None:
+            change_event = {}
+        entities = change_event.get("entities", []) if isinstance(change_event, dict) else None
+        if not isinstance(entities, list) or not all(isinstance(entity, dict) for entity in entities):
+            raise ValueError("Unexpected QuickBooks webhook entities")
+        events_by_realm.setdefault(str(notification.get("realmId")), []).extend(entities)
+    return events_by_realm
+
+
+def record_qbo_change_events(payload: dict) -> list[int]:
+    """
+    Buffer the entity ids of a QuickBooks webhook notification in Redis sets per
+    integration and entity, so events of the coalescing window are applied together.
+    Events of unknown realms, inactive integrations and other entities are ignored.
+
+    Raises ValueError, before anything is buffered, when the payload is not shaped like a notification.
+
+    Returns:
+        list: ids of the integrations that received changes (their flush is due).
+    """
+    events_by_realm = _qbo_events_by_realm(payload)
+
+    integrations = CompanyIntegration.objects.filter(
+        provider__name=IntegrationProviderChoice.QUICKBOOKS,
+        provider_identifier__in=list(events_by_realm),
+        is_active=True,
+    ).values_list("id", "provider_identifier")
+
+    pipe = get_redis().pipeline()
+    touched = []
+    for company_integration_id, realm_id in integrations:
+        for event in events_by_realm[realm_id]:
+            entity_name, record_id = event.get("name"), str(event.get("id", ""))
+            # QuickBooks ids are numeric, anything else is not worth a query
+            if not isinstance(entity_name, str) or entity_name not in QBO_WEBHOOK_MODELS or not record_id.isdigit():
+                continue
+            if event.get("operation") == QBO_DELETE_OPERATION:
+                key = _deleted_key(company_integration_id, entity_name)
+            else:
+                key = _changed_key(company_integration_id, entity_name)
+            pipe.sadd(key, record_id)
+            # Sets a lost flush never drains must not live forever
+            pipe.expire(key, settings.INTEGRATION_WEBHOOK_BUFFER_TTL)
+            if company_integration_id not in touched:
+                touched.append(company_integration_id)
+    pipe.execute()
+    return touched
+
+
+def claim_qbo_webhook_flush(company_integration_id) -> bool:
+    """
+    True for the first event of a coalescing window; the caller schedules the flush.
+    """
+    return bool(get_redis().set(_flush_queued_key(company_integration_id), 1, nx=True,
+                                ex=settings.INTEGRATION_WEBHOOK_BUFFER_TTL))
+
+
+def drain_qbo_change_events(company_integration_id) -> dict[str, tuple[set, set]]:
+    """
+    Take every buffered change of an integration: {entity: (changed ids, deleted ids)}.
+    The flush marker is released first, so events arriving from now on schedule another flush.
+    """
+    redis = get_redis()
+    redis.delete(_flush_queued_key(company_integration_id))
+
+    entity_names = list(QBO_WEBHOOK_MODELS)
+    pipe = redis.pipeline()
+    for entity_name in entity_names:
+        for key in (_changed_key(company_integration_id, entity_name), _deleted_key(company_integration_id, entity_name)):
+            pipe.smembers(key)
+            pipe.delete(key)
+    results = pipe.execute()
+
+    changes = {}
+    for index, entity_name in enumerate(entity_names):
+        changed, _, deleted, _ = results[index * 4:index * 4 + 4]
+        if changed or deleted:
+            changes[entity_name] = ({value.decode() for value in changed}, {value.decode() for value in deleted})
+    return changes
+
+
+def requeue_qbo_change_events(company_integration_id, changes: dict[str, tuple[set, set]]):
+    """
+    Put drained changes back after a failed flush, the retry picks them up again.
+    """
+    pipe = get_redis().pipeline()
+    for entity_name, (changed, deleted) in changes.items():
+        for key, ids in ((_changed_key(company_integration_id, entity_name), changed),
+                         (_deleted_key(company_integration_id, entity_name), deleted)):
+            if ids:
+                pipe.sadd(key, *ids)
+                pipe.expire(key, settings.INTEGRATION_WEBHOOK_BUFFER_TTL)
+    pipe.execute()
+
+
+def apply_qbo_changes(company_integration: CompanyIntegration, entity_name: str, changed_ids, deleted_ids) -> dict:
+    """
+    Refresh changed records by id (see `refresh_records`), then delete the local rows
+    of deleted ones. A record changed and deleted in the same window is deleted.
+
+    Returns:
+        dict: fetched/created/updated/skipped/rejected/deleted counts.
+    """
+    summary = {"fetched": 0, "created": 0, "updated": 0, "skipped": 0, "rejected": 0, "deleted": 0}
+    changed_ids = set(changed_ids) - set(deleted_ids)
+
+    if changed_ids:
+        result = refresh_records(company_integration, entity_name, sorted(changed_ids, key=int))
+        for counter in ("fetched", "created", "updated", "skipped", "rejected"):
+            summary[counter] = result[counter]
+        for reject in result["rejects"]:
+            logger.warning(f"Rejected QuickBooks {entity_name} {reject['id']} of integration "
+                           f"{company_integration.id}: {reject['errors']}")
+
+    if deleted_ids:
+        model, id_field = QBO_WEBHOOK_MODELS[entity_name]
+        _, deleted_by_model = model.objects.filter(
+            company_id=company_integration.company_id,
+            integration_provider_id=company_integration.provider_id,
+            **{f"{id_field}__in": list(deleted_ids)},
+        ).delete()
+        # delete() also counts cascaded rows, report the entity's own
+        summary["deleted"] = deleted_by_model.get(model._meta.label, 0)
+
+    return summary
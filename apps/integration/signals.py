@@ -0,0 +1,20 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.integration import provider_registry
+from apps.integration.models import CompanyIntegration, IntegrationProvider
+from apps.integration.services.integration_provider import clear_cached_access_token
+
+
+@receiver(post_save, sender=IntegrationProvider)
+@receiver(post_delete, sender=IntegrationProvider)
+def invalidate_provider_registry(sender, **kwargs):
+    provider_registry.invalidate()
+
+
+@receiver(post_save, sender=CompanyIntegration)
+@receiver(post_delete, sender=CompanyIntegration)
+def invalidate_cached_access_token(sender, instance, update_fields=None, **kwargs):
+    # Reconnecting (or editing credentials in the admin) must not keep serving the old token.
+    if update_fields is None or "credentials" in update_fields:
+        clear_cached_access_token(instance.id)
@@ -1,122 +1,405 @@
 import logging
+from datetime import timedelta
 
 from celery import shared_task
+from django.conf import settings
+from django.db.models import Count, F, Min, Q
 from django.utils import timezone
+from redis.exceptions import RedisError
 
+from apps.company.models import Company
+from apps.integration.concurrency import entity_sync_lock, provider_sync_limit, slots_in_use, sync_slot
 from apps.integration.models import CompanyIntegration
-from apps.integration.selectors import get_qbo_customers, get_qbo_invoices
-from apps.integration.services import create_or_update_qbo_customers, create_or_update_qbo_invoices
+from apps.integration.pipeline import provider_entities, registered_providers
+from apps.integration.provider_config import IntegrationProviderChoice
+from apps.integration.provider_registry import get_provider_by_id
+from apps.integration.services import (
+    apply_qbo_changes,
+    claim_qbo_webhook_flush,
+    delete_unreferenced_raw_payloads,
+    drain_qbo_change_events,
+    refresh_qbo_token_for_integration,
+    refresh_records,
+    requeue_qbo_change_events,
+    sync_entity,
+)
+from utils.redis_client import get_redis
 
 logger = logging.getLogger(__name__)
 
 
-@shared_task(bind=True, max_retries=3)
-def sync_qbo_customers(self, company_integration_id):
+def _token_refresh_queued_key(company_integration_id):
+    return f"token-refresh-queued:{company_integration_id}"
+
+
+def _dispatched_key(company_integration_id):
+    return f"sync-dispatched:{company_integration_id}"
+
+
+def _run_sync(task, company_integration_id, entity_name, full_sync, retry_deferred=False):
     """
-    Pull customers from QuickBooks and update local DB.
-    - Retries if external API fails (3 times)
-    - Checks company + integration status safely
+    Shared body of the entity sync tasks.
+    Progress is published as task state "PROGRESS" (see SyncJobStatusAPIView);
+    the returned dict is the final job status.
+    With `retry_deferred` (user-triggered jobs) a sync held back by the concurrency caps
+    is retried after INTEGRATION_SYNC_DEFER_COUNTDOWN seconds instead of waiting for the dispatcher.
     """
+    started_at = timezone.now()
+    job = {
+        "phase": "starting",
+        "entity": entity_name,
+        "company_integration_id": company_integration_id,
+        "full_sync": full_sync,
+        "started_at": started_at.isoformat(),
+    }
+
+    def report(phase, **extra):
+        job.update(extra, phase=phase, elapsed_seconds=round((timezone.now() - started_at).total_seconds(), 3))
+        if task.request.id:
+            task.update_state(state="PROGRESS", meta=job)
+        return job
+
     try:
-        company_integration = CompanyIntegration.objects.select_related("company").get(
+        company_integration = CompanyIntegration.objects.select_related("company", "provider").get(
             id=company_integration_id
         )
     except CompanyIntegration.DoesNotExist:
         logger.error(f"CompanyIntegration {company_integration_id} does not exist.")
-        return
+        return report("skipped", reason="Integration does not exist")
 
     company = company_integration.company
+    job["company_id"] = company.id
 
     # --- Validation Checks ---
     if not company_integration.is_active:
         logger.warning(f"Integration {company_integration_id} is inactive. Skipping sync.")
-        return
+        return report("skipped", reason="Integration is not active")
 
     if not company.can_sync_provider():
         logger.warning(
             f"Company {company.id} is not allowed to sync provider. Skipping."
         )
-        return
+        return report("skipped", reason="Company is not allowed to sync")
 
-    try:
-        # Fetch from QuickBooks
-        customers = get_qbo_customers(company_integration)
+    provider_name = get_provider_by_id(company_integration.provider_id).name
+    with entity_sync_lock(company_integration_id, entity_name) as locked:
+        if not locked:
+            logger.info(f"{entity_name} sync of integration {company_integration_id} is already running. Skipping.")
+            return report("skipped", reason="A sync of this entity is already running")
 
-        # Update local DB
-        create_or_update_qbo_customers(company_integration, customers)
+        with sync_slot(provider_name) as acquired:
+            if not acquired:
+                logger.info(f"Sync concurrency cap reached, deferring {entity_name} sync for {company_integration_id}.")
+                if retry_deferred:
+                    try:
+                        raise task.retry(countdown=settings.INTEGRATION_SYNC_DEFER_COUNTDOWN)
+                    except task.MaxRetriesExceededError:
+                        return report("deferred", reason="Sync concurrency cap reached")
+                # Let the next dispatcher run pick this integration up again.
+                try:
+                    get_redis().delete(_dispatched_key(company_integration_id))
+                except RedisError:
+                    pass
+                return report("deferred", reason="Sync concurrency cap reached")
 
-        logger.info(
-            f"Synced {len(customers)} QuickBooks customers "
-            f"for company {company.id} at {timezone.now()}."
-        )
+            try:
+                report("syncing")
+                # Fetch from the provider page by page and update local DB as pages arrive
+                summary = sync_entity(
+                    company_integration,
+                    entity_name,
+                    full_sync=full_sync,
+                    on_page=lambda totals: report("syncing", **totals),
+                    task_id=task.request.id,
+                )
 
-        # Optional: update last synced timestamp
-        company_integration.last_synced_at = timezone.now()
-        company_integration.save(update_fields=["last_synced_at"])
+                logger.info(
+                    f"Synced {summary['fetched']} {provider_name} {entity_name} records "
+                    f"(created {summary['created']}, updated {summary['updated']}, unchanged {summary['skipped']}, "
+                    f"rejected {summary['rejected']}) "
+                    f"for company {company.id} at {timezone.now()}."
+                )
+                return report("done", **summary)
 
-    except Exception as exc:
-        logger.error(
-            f"QuickBooks customer sync failed for integration {company_integration_id}: {exc}"
-        )
+            except Exception as exc:
+                logger.error(
+                    f"{provider_name} {entity_name} sync failed for integration {company_integration_id}: {exc}"
+                )
 
-        # Optional retry (3 attempts)
-        try:
-            raise self.retry(exc=exc, countdown=60)
-        except self.MaxRetriesExceededError:
-            logger.error("Max retries exceeded for QuickBooks sync.")
+                # Optional retry (3 attempts)
+                try:
+                    raise task.retry(exc=exc, countdown=60)
+                except task.MaxRetriesExceededError:
+                    logger.error(f"Max retries exceeded for {provider_name} {entity_name} sync.")
+                    return report("failed", error=str(exc))
 
 
 @shared_task(bind=True, max_retries=3)
-def sync_qbo_invoices(self, company_integration_id):
+def sync_integration_entity(self, company_integration_id, entity_name, full_sync=False):
     """
-    Pull customers from QuickBooks and update local DB.
+    Pull one entity from the integration's provider through its registered sync pipeline.
+    - Incremental by default (only records changed since the last sync)
+    - `full_sync=True` forces a full resync
     - Retries if external API fails (3 times)
     - Checks company + integration status safely
+    - Runs only within the global/per-provider concurrency caps
+    - Skipped while another sync of the same integration and entity is running
+    """
+    return _run_sync(self, company_integration_id, entity_name, full_sync)
+
+
+@shared_task(bind=True, max_retries=3)
+def sync_qbo_customers(self, company_integration_id, full_sync=False):
+    """
+    `sync_integration_entity` for QuickBooks customers, retried later instead of deferred when the caps are full.
+    """
+    return _run_sync(self, company_integration_id, "Customer", full_sync, retry_deferred=True)
+
+
+@shared_task(bind=True, max_retries=3)
+def sync_qbo_invoices(self, company_integration_id, full_sync=False):
+    """
+    `sync_integration_entity` for QuickBooks invoices, retried later instead of deferred when the caps are full.
     """
+    return _run_sync(self, company_integration_id, "Invoice", full_sync, retry_deferred=True)
+
+
+@shared_task(bind=True, max_retries=3)
+def refresh_integration_records(self, company_integration_id, entity_name, ids):
+    """
+    Refresh specific records of one entity by provider id and upsert just those rows
+    (support "refresh this invoice", admin actions), see `refresh_records`.
+    - One provider call per chunk of ids instead of a sync
+    - Retries if external API fails (3 times)
+    - The returned dict is the job status (see SyncJobStatusAPIView)
+    """
+    job = {"entity": entity_name, "company_integration_id": company_integration_id, "requested": len(ids)}
     try:
-        company_integration = CompanyIntegration.objects.select_related("company").get(
-            id=company_integration_id
+        company_integration = CompanyIntegration.objects.select_related("company", "provider").get(
+            id=company_integration_id, is_active=True
         )
     except CompanyIntegration.DoesNotExist:
-        logger.error(f"CompanyIntegration {company_integration_id} does not exist.")
-        return
+        return dict(job, phase="skipped", reason="Integration does not exist or is not active")
 
-    company = company_integration.company
+    job["company_id"] = company_integration.company_id
+    try:
+        summary = refresh_records(company_integration, entity_name, ids)
+    except Exception as exc:
+        logger.error(f"Refreshing {entity_name} records failed for integration {company_integration_id}: {exc}")
+        raise self.retry(exc=exc, countdown=30)
 
-    # --- Validation Checks ---
-    if not company_integration.is_active:
-        logger.warning(f"Integration {company_integration_id} is inactive. Skipping sync.")
-        return
+    logger.info(
+        f"Refreshed {summary['fetched']} of {len(ids)} {entity_name} records for integration "
+        f"{company_integration_id} ({len(summary['missing'])} missing, {summary['rejected']} rejected)."
+    )
+    return dict(job, phase="done", **summary)
 
-    if not company.can_sync_provider():
-        logger.warning(
-            f"Company {company.id} is not allowed to sync provider. Skipping."
-        )
-        return
 
+def _free_slots(name: str, limit: int) -> int:
     try:
-        # Fetch from QuickBooks
-        invoices = get_qbo_invoices(company_integration)
+        return limit - slots_in_use(name)
+    except RedisError as exc:
+        # Like sync_slot, a Redis outage means running without the cap rather than not at all.
+        logger.warning(f"Sync slots unavailable, dispatching without concurrency cap: {exc}")
+        return limit
 
-        # Update local DB
-        create_or_update_qbo_invoices(company_integration, invoices)
 
-        logger.info(
-            f"Synced {len(invoices)} QuickBooks invoices"
-            f"for company {company.id} at {timezone.now()}."
-        )
+def _claim_dispatch(company_integration_id) -> bool:
+    try:
+        return bool(get_redis().set(_dispatched_key(company_integration_id), 1, nx=True,
+                                    ex=settings.INTEGRATION_SYNC_INTERVAL))
+    except RedisError:
+        # The per-entity sync lock still keeps duplicate tasks from running together.
+        logger.warning("Could not mark integration sync as dispatched, dispatching anyway.", exc_info=True)
+        return True
 
-        # Optional: update last synced timestamp
-        company_integration.last_synced_at = timezone.now()
-        company_integration.save(update_fields=["last_synced_at"])
 
-    except Exception as exc:
-        logger.error(
-            f"QuickBooks Invoice  sync failed for integration {company_integration_id}: {exc}"
+@shared_task
+def dispatch_integration_syncs():
+    """
+    Periodic (Celery beat) fan-out of per-integration sync tasks.
+    - Picks active integrations of syncable companies with an entity not synced within
+      INTEGRATION_SYNC_INTERVAL, for every provider with registered sync pipelines (one task per entity)
+    - Never-synced and stalest integrations (by their least recently synced entity) go first
+    - Dispatches no more than the free global / per-provider concurrency slots
+    - Each integration gets a fixed offset inside INTEGRATION_SYNC_STAGGER_SECONDS,
+      so tenants do not all hit the provider at the same moment
+    - Fails open when Redis is unavailable, like the sync tasks themselves
+    """
+    now = timezone.now()
+    due_before = now - timedelta(seconds=settings.INTEGRATION_SYNC_INTERVAL)
+    providers = registered_providers()
+
+    # Due as long as one of the provider's entities has no successful sync within the interval
+    due = Q(pk__in=[])
+    all_entities = set()
+    for provider_name in providers:
+        entity_names = provider_entities(provider_name)
+        all_entities.update(entity_names)
+        due |= Q(provider__name=provider_name, fresh_entities__lt=len(entity_names))
+    entity_states = Q(sync_states__entity_name__in=all_entities)
+
+    integrations = (
+        CompanyIntegration.objects.filter(
+            is_active=True,
+            provider__is_active=True,
+            provider__name__in=providers,
+            company__in=Company.objects.can_sync_provider(),
+        )
+        .annotate(
+            fresh_entities=Count("sync_states", filter=entity_states & Q(sync_states__last_synced_at__gte=due_before)),
+            oldest_synced_at=Min("sync_states__last_synced_at", filter=entity_states),
         )
+        .filter(due)
+        .select_related("provider")
+        .only("id", "provider__name")
+        .order_by(F("oldest_synced_at").asc(nulls_first=True), "id")
+    )
+
+    global_free = _free_slots("global", settings.INTEGRATION_SYNC_GLOBAL_CONCURRENCY)
+    provider_free = {}
+    dispatched = 0
+
+    for company_integration in integrations.iterator():
+        if global_free <= 0:
+            break
+
+        provider_name = company_integration.provider.name
+        entity_names = provider_entities(provider_name)
+        if provider_name not in provider_free:
+            provider_free[provider_name] = _free_slots(provider_name, provider_sync_limit(provider_name))
+        if provider_free[provider_name] <= 0:
+            continue
+
+        # Skip integrations already queued by a previous run that have not finished yet.
+        if not _claim_dispatch(company_integration.id):
+            continue
+
+        countdown = company_integration.id % settings.INTEGRATION_SYNC_STAGGER_SECONDS
+        for entity_name in entity_names:
+            sync_integration_entity.apply_async(args=[company_integration.id, entity_name], countdown=countdown)
+
+        # Every entity task holds its own slot while it runs.
+        global_free -= len(entity_names)
+        provider_free[provider_name] -= len(entity_names)
+        dispatched += 1
+
+    logger.info(f"Dispatched syncs for {dispatched} integrations at {now}.")
+    return dispatched
+
+
+@shared_task
+def refresh_expiring_qbo_tokens():
+    """
+    Beat task: refresh QuickBooks access tokens before they expire, so syncs and
+    page views find a valid token in the cache instead of refreshing inline.
+    Integrations whose cached token outlives the window are skipped without
+    reading their credentials.
+    """
+    window = timedelta(seconds=settings.INTEGRATION_TOKEN_PROACTIVE_REFRESH_WINDOW)
+    integrations = CompanyIntegration.objects.filter(
+        is_active=True,
+        provider__is_active=True,
+        provider__name=IntegrationProviderChoice.QUICKBOOKS,
+    )
+
+    ready = 0
+    for company_integration in integrations.iterator():
+        try:
+            if refresh_qbo_token_for_integration(company_integration, min_valid_for=window):
+                ready += 1
+        except Exception as e:
+            logger.error(f"Token refresh failed for integration {company_integration.id}: {e}")
+
+    logger.info(f"{ready} QuickBooks integrations hold a token valid for the next {window}.")
+    return ready
+
+
+@shared_task
+def prune_raw_payloads():
+    """
+    Beat task: delete compressed provider payloads no synced row references any more,
+    syncs only ever add them. See `delete_unreferenced_raw_payloads`.
+    """
+    deleted = delete_unreferenced_raw_payloads()
+    logger.info(f"Pruned {deleted} unreferenced raw payloads.")
+    return deleted
+
 
-        # Optional retry (3 attempts)
+@shared_task(bind=True, max_retries=3)
+def refresh_qbo_token(self, company_integration_id):
+    """
+    Refresh one integration's access token off the request path.
+    """
+    try:
+        company_integration = CompanyIntegration.objects.get(id=company_integration_id, is_active=True)
+    except CompanyIntegration.DoesNotExist:
+        return None
+    try:
+        return bool(refresh_qbo_token_for_integration(company_integration))
+    except Exception as e:
+        logger.error(f"Token refresh failed for integration {company_integration_id}: {e}")
+        raise self.retry(exc=e, countdown=30)
+    finally:
         try:
-            raise self.retry(exc=exc, countdown=60)
-        except self.MaxRetriesExceededError:
-            logger.error("Max retries exceeded for QuickBooks sync.")
+            get_redis().delete(_token_refresh_queued_key(company_integration_id))
+        except RedisError:
+            pass
+
+
+def queue_qbo_token_refresh(company_integration_id):
+    """
+    Enqueue refresh_qbo_token unless one is already queued for this integration,
+    so repeated page views do not pile up refresh tasks.
+    """
+    try:
+        if not get_redis().set(_token_refresh_queued_key(company_integration_id), 1, nx=True,
+                               ex=settings.INTEGRATION_TOKEN_REFRESH_LOCK_TIMEOUT):
+            return
+    except RedisError:
+        logger.warning("Could not mark token refresh as queued, enqueueing anyway.", exc_info=True)
+    refresh_qbo_token.delay(company_integration_id)
+
+
+@shared_task(bind=True, max_retries=3)
+def flush_qbo_webhook_changes(self, company_integration_id):
+    """
+    Apply the QuickBooks webhook changes buffered for one integration during the
+    coalescing window: one fetch-by-id query per entity (and per chunk of ids)
+    instead of a sync, and deletes of removed records.
+    Retries with the same changes if the provider call fails (3 times).
+    """
+    changes = drain_qbo_change_events(company_integration_id)
+    if not changes:
+        return {}
+    try:
+        company_integration = CompanyIntegration.objects.select_related("company", "provider").get(
+            id=company_integration_id, is_active=True
+        )
+    except CompanyIntegration.DoesNotExist:
+        return {}
+
+    results = {}
+    try:
+        for entity_name, (changed_ids, deleted_ids) in changes.items():
+            results[entity_name] = apply_qbo_changes(company_integration, entity_name, changed_ids, deleted_ids)
+    except Exception as exc:
+        logger.error(f"Applying QuickBooks webhook changes failed for integration {company_integration_id}: {exc}")
+        # Entities already applied are harmless to apply again.
+        requeue_qbo_change_events(company_integration_id, changes)
+        raise self.retry(exc=exc, countdown=30)
+
+    logger.info(f"Applied QuickBooks webhook changes for integration {company_integration_id}: {results}")
+    return results
+
+
+def schedule_qbo_webhook_flush(company_integration_ids):
+    """
+    Schedule flush_qbo_webhook_changes INTEGRATION_WEBHOOK_COALESCE_SECONDS ahead for
+    integrations without a pending flush; later events of the window join that flush.
+    """
+    for company_integration_id in company_integration_ids:
+        if claim_qbo_webhook_flush(company_integration_id):
+            flush_qbo_webhook_changes.apply_async(
+                args=[company_integration_id], countdown=settings.INTEGRATION_WEBHOOK_COALESCE_SECONDS
+            )
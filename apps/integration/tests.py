@@ -1,3 +1,1117 @@
-from django.test import TestCase
+import base64
+import hashlib
+import hmac
+import json
+import os
+import re
+import runpy
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import requests
+from celery.exceptions import MaxRetriesExceededError, Retry
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import ConnectionHandler
+from django.urls import reverse
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from redis.exceptions import RedisError
+from rest_framework.test import APIClient
+
+from apps.company.constants import CompanyStatusChoices
+from apps.company.models import Company, CompanyMember
+from apps.customer.models import Customer
+from apps.invoice.models import Invoice
+from apps.integration import http_client, provider_registry, rate_limit, selectors
+from apps.integration.models import CompanyIntegration, IntegrationProvider, ProviderFieldMapping, RawPayload, \
+    SyncRun, SyncState
+from apps.integration.management.commands.check_query_plans import Command as CheckQueryPlansCommand
+from apps.integration.mapping import MappingPlan, compile_path
+from apps.integration.pipeline import EntityPipeline, get_pipeline, iter_batches
+from apps.integration.selectors import build_qbo_query
+from apps.integration.services import apply_qbo_changes, create_or_update_qbo_customers, \
+    create_or_update_qbo_invoices, delete_unreferenced_raw_payloads, refresh_qbo_token_for_integration, \
+    refresh_records, sync_entity
+from apps.integration.services.invoice import QBO_INVOICE_FIELD_PATHS
+from apps.integration.tasks import _run_sync, dispatch_integration_syncs, queue_qbo_token_refresh, \
+    refresh_integration_records, sync_qbo_customers
+from utils.encryption import encrypt_value
+
+
+def answer_qbo_queries(entity, records, queries):
+    """
+    Fake `_run_qbo_query` serving `records` (ordered by Id) with STARTPOSITION/MAXRESULTS
+    and COUNT(*) support; every query it answers is appended to `queries`.
+    """
+    def run_query(url, access_token, query, rate_limit_key):
+        queries.append(query)
+        if query.startswith("SELECT COUNT(*)"):
+            return {"totalCount": len(records)}
+        start, size = map(int, re.search(r"STARTPOSITION (\d+) MAXRESULTS (\d+)", query).groups())
+        return {entity: records[start - 1:start - 1 + size]}
+    return run_query
+
+
+class QBOPagingTests(SimpleTestCase):
+
+    def setUp(self):
+        for name, value in (("_get_qbo_query_url", "https://qbo.test/query"), ("_get_qbo_access_token", "token"),
+                            ("_qbo_rate_limit_key", ("quickbooks_online", "123"))):
+            patcher = mock.patch.object(selectors, name, return_value=value)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        self.queries = []
+
+    def fetch_pages(self, records, **kwargs):
+        with mock.patch.object(selectors, "_run_qbo_query", answer_qbo_queries("Invoice", records, self.queries)):
+            return list(selectors.iter_qbo_pages(mock.Mock(), "Invoice", page_size=2, stream=False, **kwargs))
+
+    def test_pages_are_fetched_until_a_short_page(self):
+        records = [{"Id": str(record_id)} for record_id in range(1, 6)]
+
+        pages = self.fetch_pages(records)
+
+        self.assertEqual(pages, [records[0:2], records[2:4], records[4:]])
+        self.assertEqual([re.search(r"STARTPOSITION (\d+)", query).group(1) for query in self.queries],
+                         ["1", "3", "5"])
+        # The token is checked before every page
+        self.assertEqual(self._get_qbo_access_token.call_count, 3)
+
+    def test_full_last_page_ends_with_an_empty_page(self):
+        records = [{"Id": str(record_id)} for record_id in range(1, 5)]
+
+        pages = self.fetch_pages(records)
+
+        self.assertEqual(pages, [records[0:2], records[2:4]])
+        self.assertEqual(len(self.queries), 3)
+
+    def test_prefetched_pages_are_yielded_in_order(self):
+        records = [{"Id": str(record_id)} for record_id in range(1, 8)]
+        answer = answer_qbo_queries("Invoice", records, self.queries)
+
+        def slow_first_pages(url, access_token, query, rate_limit_key):
+            match = re.search(r"STARTPOSITION (\d+)", query)
+            if match:
+                # Earlier pages answer last
+                time.sleep((8 - int(match.group(1))) / 100)
+            return answer(url, access_token, query, rate_limit_key)
+
+        with mock.patch.object(selectors, "_run_qbo_query", slow_first_pages):
+            pages = list(selectors.iter_qbo_pages(mock.Mock(), "Invoice", page_size=2, stream=False, concurrency=3))
+
+        self.assertEqual(pages, [records[0:2], records[2:4], records[4:6], records[6:]])
+        self.assertTrue(self.queries[0].startswith("SELECT COUNT(*)"))
+
+    def test_records_added_after_the_count_are_still_fetched(self):
+        records = [{"Id": str(record_id)} for record_id in range(1, 7)]
+        # COUNT ran when only four records existed
+        answer = answer_qbo_queries("Invoice", records, self.queries)
+
+        def stale_count(*args):
+            return {"totalCount": 4} if args[2].startswith("SELECT COUNT(*)") else answer(*args)
+
+        with mock.patch.object(selectors, "_run_qbo_query", stale_count):
+            pages = list(selectors.iter_qbo_pages(mock.Mock(), "Invoice", page_size=2, stream=False, concurrency=3))
+
+        self.assertEqual(pages, [records[0:2], records[2:4], records[4:]])
+
+class QBOInvoiceUpsertTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        company = Company.objects.create(name="Acme")
+        provider = IntegrationProvider.objects.create(name="quickbooks_online", display_name="QuickBooks Online")
+        with mock.patch("apps.integration.services.integration_provider.get_redis"):
+            cls.company_integration = CompanyIntegration.objects.create(
+                company=company, provider=provider, provider_identifier="123", provider_data={"realm_id": "123"}
+            )
+
+    def qbo_invoice(self, invoice_id, amount="10.00"):
+        return {"Id": invoice_id, "DocNumber": f"D{invoice_id}", "TxnDate": "2025-01-01", "DueDate": "2025-02-01",
+                "CustomerRef": {"value": "1"}, "TotalAmt": amount}
+
+    def test_invoices_are_upserted_in_batches(self):
+        result = create_or_update_qbo_invoices(
+            self.company_integration, [self.qbo_invoice(invoice_id) for invoice_id in ("1", "2", "3")], batch_size=2
+        )
+
+        self.assertEqual(result["created"], 3)
+        self.assertEqual([batch["created"] for batch in result["batches"]], [2, 1])
+
+        result = create_or_update_qbo_invoices(
+            self.company_integration, [self.qbo_invoice("1", amount="12.50"), self.qbo_invoice("4")], batch_size=2
+        )
+
+        self.assertEqual((result["created"], result["updated"]), (1, 1))
+        self.assertEqual(Invoice.objects.count(), 4)
+        self.assertEqual(str(Invoice.objects.get(invoice_id="1").amount), "12.50")
+
+    def test_last_copy_of_a_record_in_one_batch_wins(self):
+        result = create_or_update_qbo_invoices(
+            self.company_integration, [self.qbo_invoice("1", amount="10.00"), self.qbo_invoice("1", amount="20.00")]
+        )
+
+        self.assertEqual(result["created"], 1)
+        self.assertEqual(str(Invoice.objects.get(invoice_id="1").amount), "20.00")
+
+    def test_rejected_records_are_reported_and_the_rest_saved(self):
+        result = create_or_update_qbo_invoices(
+            self.company_integration,
+            [self.qbo_invoice("1"), self.qbo_invoice("2", amount="abc"), self.qbo_invoice("3")],
+        )
+
+        self.assertEqual((result["created"], result["rejected"]), (2, 1))
+        self.assertEqual(result["rejects"], [{"id": "2", "errors": {"amount": "expected decimal(12,2), got 'abc'"}}])
+        self.assertEqual(set(Invoice.objects.values_list("invoice_id", flat=True)), {"1", "3"})
+
+@override_settings(INTEGRATION_HTTP_MAX_RETRIES=2, INTEGRATION_HTTP_BACKOFF_MAX=60)
+@mock.patch("apps.integration.http_client.time.sleep")
+class ProviderRequestTests(SimpleTestCase):
+
+    def response(self, status_code, **headers):
+        return mock.Mock(status_code=status_code, headers=headers, content=b"")
+
+    def request(self, *outcomes):
+        session = mock.Mock()
+        session.request.side_effect = outcomes
+        with mock.patch("apps.integration.http_client.get_session", return_value=session):
+            return http_client.provider_get("https://qbo.test/query"), session
+
+    def test_throttled_request_waits_for_retry_after(self, sleep):
+        response, session = self.request(self.response(429, **{"Retry-After": "7"}), self.response(200))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(session.request.call_count, 2)
+        sleep.assert_called_once_with(7.0)
+
+    def test_client_errors_are_not_retried(self, sleep):
+        response, session = self.request(self.response(404))
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(session.request.call_count, 1)
+        sleep.assert_not_called()
+
+    def test_last_server_error_is_returned_after_the_retries(self, sleep):
+        response, session = self.request(*(self.response(503) for _ in range(3)))
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_connection_error_is_raised_after_the_retries(self, sleep):
+        with self.assertRaises(requests.ConnectionError):
+            self.request(*(requests.ConnectionError("refused") for _ in range(3)))
+
+        self.assertEqual(sleep.call_count, 2)
+
+@override_settings(INTEGRATION_RATE_LIMITS={"quickbooks_online": {"per_minute": 60, "burst": 5}})
+@mock.patch("apps.integration.rate_limit.time.sleep")
+class RateLimitTests(SimpleTestCase):
+
+    def acquire(self, *waits, **kwargs):
+        bucket = mock.Mock(side_effect=waits)
+        with mock.patch("apps.integration.rate_limit._token_bucket", return_value=bucket):
+            rate_limit.acquire("quickbooks_online", "123", **kwargs)
+        return bucket
+
+    def test_waits_for_the_next_token(self, sleep):
+        bucket = self.acquire("0.5", "0")
+
+        sleep.assert_called_once_with(0.5)
+        self.assertEqual(bucket.call_count, 2)
+        # 60 per minute is one token per second, the burst is the bucket capacity
+        bucket.assert_called_with(keys=["ratelimit:quickbooks_online:123"], args=[1.0, 5])
+
+    def test_wait_beyond_the_timeout_raises(self, sleep):
+        with self.assertRaises(rate_limit.RateLimitTimeout):
+            self.acquire("30", timeout=10)
+
+        sleep.assert_not_called()
+
+    def test_redis_outage_lets_the_request_through(self, sleep):
+        self.acquire(RedisError("down"))
+
+        sleep.assert_not_called()
+
+    def test_providers_without_a_limit_are_not_limited(self, sleep):
+        with mock.patch("apps.integration.rate_limit._token_bucket") as token_bucket:
+            rate_limit.acquire("zoho", "123")
+
+        token_bucket.assert_not_called()
+
+class EntityPipelineTests(SimpleTestCase):
+
+    def pipeline(self, fetch):
+        return EntityPipeline(
+            provider_name="test", entity_name="Record", fetch=fetch,
+            make_transform=lambda company_integration: lambda records: ([record["Id"] for record in records], []),
+            load=mock.Mock(),
+            get_updated_time=lambda record: datetime.fromisoformat(record["Updated"]),
+            get_record_id=lambda record: record["Id"],
+        )
+
+    def record(self, record_id, updated="2025-01-01T00:00:00+00:00"):
+        return {"Id": record_id, "Updated": updated}
+
+    def stage_threads(self):
+        return [thread for thread in threading.enumerate() if thread.name.startswith("sync-test-Record")]
+
+    def test_batches_keep_fetch_order(self):
+        pages = [[self.record("1"), self.record("2", "2025-01-03T00:00:00+00:00")], [self.record("3")]]
+        fetch = mock.Mock(return_value=iter(pages))
+
+        batches = list(iter_batches(self.pipeline(fetch), mock.Mock(), after_id="0"))
+
+        self.assertEqual([batch.objs for batch in batches], [["1", "2"], ["3"]])
+        self.assertEqual(batches[0].watermark, datetime.fromisoformat("2025-01-03T00:00:00+00:00"))
+        self.assertEqual(fetch.call_args.args[1:], (None, 1, "0"))
+
+    def test_fetch_failure_is_raised_and_stops_the_stages(self):
+        def fetch(*args):
+            yield [self.record("1")]
+            raise ConnectionError("provider down")
+
+        with self.assertRaisesMessage(ConnectionError, "provider down"):
+            list(iter_batches(self.pipeline(fetch), mock.Mock()))
+
+        self.assertEqual(self.stage_threads(), [])
+
+    def test_closing_the_batches_stops_fetching(self):
+        closed = threading.Event()
+
+        def fetch(*args):
+            try:
+                for record_id in range(1, 1000):
+                    yield [self.record(str(record_id))]
+            finally:
+                closed.set()
+
+        batches = iter_batches(self.pipeline(fetch), mock.Mock(), queue_size=1)
+        next(batches)
+        batches.close()
+
+        self.assertTrue(closed.is_set())
+        self.assertEqual(self.stage_threads(), [])
+
+class MappingPathTests(SimpleTestCase):
+
+    record = {"DocNumber": "D1", "CustomerRef": {"value": "7"},
+              "Line": [{"Amount": 5}, {"Description": "no amount"}, {"Amount": 3}]}
+
+    def test_dotted_paths(self):
+        self.assertEqual(compile_path("CustomerRef.value")(self.record), "7")
+        self.assertEqual(compile_path("Line.2.Amount")(self.record), 3)
+        self.assertEqual(compile_path("Line.$Index.Amount")(self.record), [5, 3])
+
+    def test_missing_keys_give_none(self):
+        for path in ("Memo", "CustomerRef.name", "Line.9.Amount", "DocNumber.value", "Memo.$Index.Amount"):
+            with self.subTest(path=path):
+                self.assertIsNone(compile_path(path)(self.record))
+
+    def test_wildcard_fills_a_scalar_column_with_a_single_match_only(self):
+        plan = MappingPlan(Invoice, {"discount": "Line.$Index.Discount", "reference": "Line.$Index.Description"})
+
+        rows, errors = plan.rows([self.record])
+
+        self.assertEqual(rows, [{"discount": None, "reference": "no amount"}])
+        self.assertEqual(errors, {})
+
+    def test_reserved_and_unknown_fields_are_ignored(self):
+        plan = MappingPlan(Invoice, {"invoice_no": "DocNumber", "integration_hash": "Id", "no_such_field": "Id"})
+
+        self.assertEqual(plan.fields, ["invoice_no"])
+
+
+class MappingCoercionTests(SimpleTestCase):
+
+    plan = MappingPlan(Invoice, QBO_INVOICE_FIELD_PATHS, required=("invoice_id", "customer_id"))
+
+    def qbo_invoice(self, invoice_id, **fields):
+        return {"Id": invoice_id, "DocNumber": f"D{invoice_id}", "TxnDate": "2025-01-01", "DueDate": "2025-02-01",
+                "CustomerRef": {"value": "1"}, "TotalAmt": "10.00", **fields}
+
+    def test_values_are_coerced_to_the_column_types(self):
+        rows, errors = self.plan.rows([self.qbo_invoice(
+            "1", TotalAmt=0.1 + 0.2, Balance=7, DueDate="2025-02-01T10:30:00-08:00", DocNumber=1001,
+        )])
+
+        self.assertEqual(errors, {})
+        row = rows[0]
+        self.assertEqual(row["amount"], Decimal("0.30"))
+        self.assertEqual(row["invoice_balance"], Decimal("7.00"))
+        self.assertEqual(row["due_date"], date(2025, 2, 1))
+        self.assertEqual(row["invoice_no"], "1001")
+        self.assertTrue(timezone.is_aware(row["invoice_date"]))
+
+    def test_bad_values_reject_only_their_record(self):
+        records = [
+            self.qbo_invoice("1"),
+            self.qbo_invoice("2", TotalAmt="1e10"),
+            self.qbo_invoice("3", Balance=True),
+            self.qbo_invoice("4", DocNumber="x" * 256),
+            self.qbo_invoice("5", DueDate="soon"),
+            self.qbo_invoice("6", CustomerRef={}),
+            self.qbo_invoice("7", TxnDate=None),
+            self.qbo_invoice("8", Balance=None),
+        ]
+
+        rows, errors = self.plan.rows(records)
+
+        self.assertEqual([row is not None for row in rows], [True, False, False, False, False, False, False, True])
+        self.assertEqual(errors[1], {"amount": "expected decimal(12,2), got '1e10'"})
+        self.assertEqual(errors[2], {"invoice_balance": "expected decimal(12,2), got True"})
+        self.assertEqual(list(errors[3]), ["invoice_no"])
+        self.assertEqual(list(errors[4]), ["due_date"])
+        self.assertEqual(errors[5], {"customer_id": "required"})
+        self.assertEqual(errors[6], {"invoice_date": "required"})
+        self.assertIsNone(rows[7]["invoice_balance"])
+
+class CompanyFieldMappingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        company = Company.objects.create(name="Acme")
+        provider = IntegrationProvider.objects.create(name="quickbooks_online", display_name="QuickBooks Online")
+        with mock.patch("apps.integration.services.integration_provider.get_redis"):
+            cls.company_integration = CompanyIntegration.objects.create(
+                company=company, provider=provider, provider_identifier="123", provider_data={"realm_id": "123"}
+            )
+
+    def test_company_mapping_overrides_and_extends_the_defaults(self):
+        for local_field, provider_field in (("invoice_no", "CustomField.0.StringValue"), ("reference", "PrivateNote")):
+            ProviderFieldMapping.objects.create(
+                company=self.company_integration.company, provider=self.company_integration.provider,
+                entity_name="Invoice", local_field=local_field, provider_field=provider_field,
+            )
+        invoice = {"Id": "1", "DocNumber": "D1", "CustomField": [{"StringValue": "INV-0001"}], "PrivateNote": "rush",
+                   "TxnDate": "2025-01-01", "DueDate": "2025-02-01", "CustomerRef": {"value": "1"}, "TotalAmt": 10}
+
+        create_or_update_qbo_invoices(self.company_integration, [invoice])
+
+        self.assertEqual(Invoice.objects.values_list("invoice_no", "reference").get(), ("INV-0001", "rush"))
+
+class QBOCustomerUpsertTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        company = Company.objects.create(name="Acme")
+        provider = IntegrationProvider.objects.create(name="quickbooks_online", display_name="QuickBooks Online")
+        # Saving an integration clears its cached access token, keep Redis out of the tests.
+        with mock.patch("apps.integration.services.integration_provider.get_redis"):
+            cls.company_integration = CompanyIntegration.objects.create(
+                company=company, provider=provider, provider_identifier="123", provider_data={"realm_id": "123"}
+            )
+
+    def qbo_customer(self, name):
+        return {"Id": "1", "CompanyName": name, "DisplayName": name, "BillAddr": {"City": "Kathmandu"}}
+
+    def test_edited_customer_updates_its_row(self):
+        result = create_or_update_qbo_customers(self.company_integration, [self.qbo_customer("Old Name")])
+        self.assertEqual(result["created"], 1)
+
+        result = create_or_update_qbo_customers(self.company_integration, [self.qbo_customer("New Name")])
+
+        self.assertEqual((result["updated"], result["skipped"]), (1, 0))
+        customer = Customer.objects.get(customer_id="1")
+        self.assertEqual(customer.company_name, "New Name")
+        self.assertTrue(customer.integration_hash)
+
+    def test_unchanged_customer_is_skipped(self):
+        create_or_update_qbo_customers(self.company_integration, [self.qbo_customer("Same Name")])
+
+        result = create_or_update_qbo_customers(self.company_integration, [self.qbo_customer("Same Name")])
+
+        self.assertEqual((result["updated"], result["skipped"]), (0, 1))
+
+    def test_row_without_stored_hash_is_updated(self):
+        create_or_update_qbo_customers(self.company_integration, [self.qbo_customer("Old Name")])
+        Customer.objects.update(integration_hash="")
+
+        result = create_or_update_qbo_customers(self.company_integration, [self.qbo_customer("Old Name")])
+
+        self.assertEqual(result["updated"], 1)
+        self.assertTrue(Customer.objects.get(customer_id="1").integration_hash)
+
+
+class SyncWatermarkTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        company = Company.objects.create(name="Acme")
+        provider = IntegrationProvider.objects.create(name="quickbooks_online", display_name="QuickBooks Online")
+        with mock.patch("apps.integration.services.integration_provider.get_redis"):
+            cls.company_integration = CompanyIntegration.objects.create(
+                company=company, provider=provider, provider_identifier="123", provider_data={"realm_id": "123"}
+            )
+
+    def qbo_invoice(self, invoice_id, updated, txn_date="2025-01-01"):
+        return {"Id": invoice_id, "DocNumber": f"D{invoice_id}", "TxnDate": txn_date, "DueDate": "2025-02-01",
+                "CustomerRef": {"value": "1"}, "TotalAmt": "10.00", "MetaData": {"LastUpdatedTime": updated}}
+
+    def sync(self, page, **kwargs):
+        fetch = mock.Mock(side_effect=lambda *args: iter([page]))
+        pipeline = EntityPipeline(**{**get_pipeline("quickbooks_online", "Invoice").__dict__, "fetch": fetch})
+        with mock.patch("apps.integration.services.sync.get_pipeline", return_value=pipeline):
+            sync_entity(self.company_integration, "Invoice", concurrency=1, **kwargs)
+        return fetch
+
+    def test_next_sync_only_fetches_records_changed_since_the_watermark(self):
+        fetch = self.sync([self.qbo_invoice("1", "2025-01-01T10:00:00+00:00"),
+                           self.qbo_invoice("2", "2025-01-02T10:00:00+00:00")])
+        self.assertIsNone(fetch.call_args.args[1])
+
+        fetch = self.sync([])
+
+        self.assertEqual(fetch.call_args.args[1], datetime.fromisoformat("2025-01-02T10:00:00+00:00"))
+        sync_state = SyncState.objects.get(company_integration=self.company_integration, entity_name="Invoice")
+        self.assertEqual(sync_state.last_updated_time, datetime.fromisoformat("2025-01-02T10:00:00+00:00"))
+
+    def test_full_sync_ignores_the_watermark(self):
+        self.sync([self.qbo_invoice("1", "2025-01-01T10:00:00+00:00")])
+
+        fetch = self.sync([], full_sync=True)
+
+        self.assertIsNone(fetch.call_args.args[1])
+
+    def test_watermark_stops_at_rejected_record(self):
+        page = [
+            self.qbo_invoice("1", "2025-01-01T10:00:00+00:00"),
+            self.qbo_invoice("2", "2025-01-01T09:00:00+00:00", txn_date="not a date"),
+            self.qbo_invoice("3", "2025-01-01T11:00:00+00:00"),
+        ]
+        pipeline = EntityPipeline(**{**get_pipeline("quickbooks_online", "Invoice").__dict__,
+                                     "fetch": lambda *args: iter([page])})
+
+        with mock.patch("apps.integration.services.sync.get_pipeline", return_value=pipeline):
+            summary = sync_entity(self.company_integration, "Invoice", concurrency=1)
+
+        self.assertEqual((summary["created"], summary["rejected"]), (2, 1))
+        sync_state = SyncState.objects.get(company_integration=self.company_integration, entity_name="Invoice")
+        self.assertEqual(sync_state.last_updated_time, datetime.fromisoformat("2025-01-01T09:00:00+00:00"))
+
+
+@override_settings(INTEGRATION_STREAM_PARSE=False, INTEGRATION_HTTP_MAX_RETRIES=0)
+@mock.patch("apps.integration.http_client.rate_limit.acquire")
+@mock.patch("apps.integration.selectors._get_qbo_access_token", return_value="token")
+class SyncRunTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        company = Company.objects.create(name="Acme")
+        provider = IntegrationProvider.objects.create(name="quickbooks_online", display_name="QuickBooks Online")
+        with mock.patch("apps.integration.services.integration_provider.get_redis"):
+            cls.company_integration = CompanyIntegration.objects.create(
+                company=company, provider=provider, provider_identifier="123", provider_data={"realm_id": "123"}
+            )
+
+    def sync(self, response):
+        session = mock.Mock()
+        session.request.return_value = response
+        with mock.patch("apps.integration.http_client.get_session", return_value=session):
+            return sync_entity(self.company_integration, "Invoice", concurrency=1)
+
+    def test_run_records_rows_and_provider_traffic(self, access_token, acquire):
+        invoices = [{"Id": invoice_id, "DocNumber": f"D{invoice_id}", "TxnDate": "2025-01-01",
+                     "DueDate": "2025-02-01", "CustomerRef": {"value": "1"}, "TotalAmt": "10.00"}
+                    for invoice_id in ("1", "2")]
+        body = {"QueryResponse": {"Invoice": invoices}}
+        response = mock.Mock(status_code=200, content=json.dumps(body).encode(), **{"json.return_value": body})
+
+        summary = self.sync(response)
+
+        sync_run = SyncRun.objects.get(id=summary["sync_run_id"])
+        self.assertEqual((sync_run.status, sync_run.mode), (SyncRun.STATUS_SUCCESS, SyncRun.MODE_FULL))
+        self.assertEqual((sync_run.rows_fetched, sync_run.rows_created, sync_run.pages_fetched), (2, 2, 1))
+        self.assertEqual((sync_run.http_calls, sync_run.bytes_received), (1, len(response.content)))
+        self.assertIsNotNone(sync_run.finished_at)
+
+    def test_failed_run_keeps_the_error(self, access_token, acquire):
+        response = mock.Mock(status_code=500, content=b"")
+        response.raise_for_status.side_effect = requests.HTTPError("500 Server Error")
+
+        with self.assertRaises(requests.HTTPError):
+            self.sync(response)
+
+        sync_run = SyncRun.objects.get()
+        self.assertEqual(sync_run.status, SyncRun.STATUS_FAILED)
+        self.assertEqual((sync_run.error, sync_run.http_calls), ("500 Server Error", 1))
+
+class SyncResumeTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        company = Company.objects.create(name="Acme")
+        provider = IntegrationProvider.objects.create(name="quickbooks_online", display_name="QuickBooks Online")
+        with mock.patch("apps.integration.services.integration_provider.get_redis"):
+            cls.company_integration = CompanyIntegration.objects.create(
+                company=company, provider=provider, provider_identifier="123", provider_data={"realm_id": "123"}
+            )
+
+    def qbo_invoice(self, invoice_id):
+        return {"Id": invoice_id, "DocNumber": f"D{invoice_id}", "TxnDate": "2025-01-01", "DueDate": "2025-02-01",
+                "CustomerRef": {"value": "1"}, "TotalAmt": "10.00",
+                "MetaData": {"LastUpdatedTime": "2025-01-01T10:00:00+00:00"}}
+
+    def test_interrupted_sync_resumes_after_last_stored_id(self):
+        SyncState.objects.create(company_integration=self.company_integration, entity_name="Invoice",
+                                 checkpoint_position=2, checkpoint_record_id="7")
+        fetch = mock.Mock(return_value=iter([[self.qbo_invoice("9")]]))
+        pipeline = EntityPipeline(**{**get_pipeline("quickbooks_online", "Invoice").__dict__, "fetch": fetch})
+
+        with mock.patch("apps.integration.services.sync.get_pipeline", return_value=pipeline):
+            summary = sync_entity(self.company_integration, "Invoice", concurrency=1)
+
+        self.assertEqual(fetch.call_args.args[3], "7")
+        self.assertEqual(summary["created"], 1)
+        sync_state = SyncState.objects.get(company_integration=self.company_integration, entity_name="Invoice")
+        self.assertEqual((sync_state.checkpoint_position, sync_state.checkpoint_record_id), (0, ""))
+
+
+class EntitySyncLockTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        company = Company.objects.create(name="Acme", status=CompanyStatusChoices.ACTIVE)
+        provider = IntegrationProvider.objects.create(name="quickbooks_online", display_name="QuickBooks Online")
+        with mock.patch("apps.integration.services.integration_provider.get_redis"):
+            cls.company_integration = CompanyIntegration.objects.create(
+                company=company, provider=provider, provider_identifier="123", provider_data={"realm_id": "123"}
+            )
+
+    @mock.patch("apps.integration.tasks.sync_entity")
+    @mock.patch("apps.integration.concurrency.get_redis")
+    def test_sync_is_skipped_while_another_one_holds_the_lock(self, get_redis, sync_entity_mock):
+        get_redis.return_value.lock.return_value.acquire.return_value = False
+
+        # No task id, progress is not published to the result backend
+        task = mock.Mock(request=mock.Mock(id=None))
+
+        job = _run_sync(task, self.company_integration.id, "Invoice", full_sync=False)
+
+        self.assertEqual(job["phase"], "skipped")
+        sync_entity_mock.assert_not_called()
+        get_redis.return_value.lock.assert_called_once_with(
+            f"sync-lock:{self.company_integration.id}:Invoice", timeout=mock.ANY, blocking=False
+        )
+
+
+class QBOQueryTests(SimpleTestCase):
+
+    def test_record_queries_are_ordered_by_id(self):
+        updated_since = datetime.fromisoformat("2025-01-01T00:00:00+00:00")
+
+        self.assertEqual(
+            build_qbo_query("Invoice", updated_since=updated_since),
+            "SELECT * FROM Invoice WHERE MetaData.LastUpdatedTime >= '2025-01-01T00:00:00+00:00' ORDERBY Id",
+        )
+        self.assertEqual(build_qbo_query("Invoice", ids=["1", "2"]),
+                         "SELECT * FROM Invoice WHERE Id IN ('1', '2') ORDERBY Id")
+        self.assertEqual(build_qbo_query("Invoice", after_id="42"), "SELECT * FROM Invoice WHERE Id > '42' ORDERBY Id")
+
+    def test_count_query_is_not_ordered(self):
+        self.assertEqual(build_qbo_query("Invoice", select="COUNT(*)"), "SELECT COUNT(*) FROM Invoice")
+
+
+@override_settings(INTEGRATION_RAW_DATA_STORAGE="compressed", INTEGRATION_RAW_PAYLOAD_PRUNE_GRACE=0)
+class RawPayloadPruneTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        company = Company.objects.create(name="Acme")
+        provider = IntegrationProvider.objects.create(name="quickbooks_online", display_name="QuickBooks Online")
+        with mock.patch("apps.integration.services.integration_provider.get_redis"):
+            cls.company_integration = CompanyIntegration.objects.create(
+                company=company, provider=provider, provider_identifier="123", provider_data={"realm_id": "123"}
+            )
+
+    def test_payload_of_edited_customer_is_deleted(self):
+        customer = {"Id": "1", "CompanyName": "Old Name", "DisplayName": "Old Name"}
+        create_or_update_qbo_customers(self.company_integration, [customer])
+        old_digest = Customer.objects.get(customer_id="1").integration_hash
+        create_or_update_qbo_customers(self.company_integration, [dict(customer, CompanyName="New Name")])
+
+        self.assertEqual(delete_unreferenced_raw_payloads(), 1)
+
+        customer = Customer.objects.get(customer_id="1")
+        self.assertFalse(RawPayload.objects.filter(digest=old_digest).exists())
+        self.assertEqual(customer.raw_data["CompanyName"], "New Name")
+
+
+class StreamParseSettingTests(SimpleTestCase):
+
+    @override_settings(INTEGRATION_STREAM_PARSE=True)
+    def test_missing_ijson_falls_back_with_a_warning(self):
+        with mock.patch.object(selectors, "ijson", None), mock.patch.object(selectors, "_ijson_missing_warned", False):
+            with self.assertLogs("apps.integration.selectors", level="WARNING"):
+                self.assertFalse(selectors.stream_parse_enabled())
+
+    @override_settings(INTEGRATION_STREAM_PARSE=False)
+    def test_setting_turns_streaming_off(self):
+        self.assertFalse(selectors.stream_parse_enabled())
+
+
+@mock.patch("apps.integration.tasks.sync_integration_entity.apply_async")
+class DispatchIntegrationSyncsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        company = Company.objects.create(name="Acme", status=CompanyStatusChoices.ACTIVE)
+        provider = IntegrationProvider.objects.create(name="quickbooks_online", display_name="QuickBooks Online")
+        with mock.patch("apps.integration.services.integration_provider.get_redis"):
+            cls.company_integration = CompanyIntegration.objects.create(
+                company=company, provider=provider, provider_identifier="123", provider_data={"realm_id": "123"}
+            )
+
+    def setUp(self):
+        for target in ("apps.integration.tasks.get_redis", "apps.integration.tasks.slots_in_use"):
+            patcher = mock.patch(target)
+            self.addCleanup(patcher.stop)
+            setattr(self, target.rsplit(".", 1)[1], patcher.start())
+        self.slots_in_use.return_value = 0
+        self.get_redis.return_value.set.return_value = True
+
+    def synced(self, entity_name, age):
+        SyncState.objects.create(company_integration=self.company_integration, entity_name=entity_name,
+                                 last_synced_at=timezone.now() - timedelta(seconds=age))
+
+    def test_integration_with_a_stale_entity_is_due(self, apply_async):
+        self.synced("Customer", 0)
+        self.synced("Invoice", settings.INTEGRATION_SYNC_INTERVAL + 60)
+
+        self.assertEqual(dispatch_integration_syncs(), 1)
+        self.assertEqual(apply_async.call_count, 2)
+
+    def test_integration_with_every_entity_fresh_is_not_due(self, apply_async):
+        self.synced("Customer", 0)
+        self.synced("Invoice", 0)
+
+        self.assertEqual(dispatch_integration_syncs(), 0)
+        apply_async.assert_not_called()
+
+    def test_redis_outage_does_not_fail_the_run(self, apply_async):
+        self.slots_in_use.side_effect = RedisError
+        self.get_redis.return_value.set.side_effect = RedisError
+
+        with self.assertLogs("apps.integration.tasks", level="WARNING"):
+            self.assertEqual(dispatch_integration_syncs(), 1)
+
+
+class SyncJobQueueTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name="Acme", status=CompanyStatusChoices.ACTIVE)
+        provider = IntegrationProvider.objects.create(name="quickbooks_online", display_name="QuickBooks Online")
+        with mock.patch("apps.integration.services.integration_provider.get_redis"):
+            cls.company_integration = CompanyIntegration.objects.create(
+                company=cls.company, provider=provider, provider_identifier="123", provider_data={"realm_id": "123"}
+            )
+        cls.user = get_user_model().objects.create_user(email="owner@acme.test", username="owner")
+        CompanyMember.objects.create(user_account=cls.user, company=cls.company, role="Admin")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse("qbo-sync-customers", args=[self.company.id])
+
+    @mock.patch("apps.integration.api.views.get_redis")
+    def test_owner_is_recorded_before_the_job_is_queued(self, get_redis):
+        calls = mock.Mock()
+        calls.attach_mock(get_redis.return_value.set, "set_owner")
+        with mock.patch.object(sync_qbo_customers, "apply_async") as apply_async:
+            calls.attach_mock(apply_async, "apply_async")
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 202)
+        job_id = response.data["job_id"]
+        self.assertEqual([call[0] for call in calls.mock_calls], ["set_owner", "apply_async"])
+        self.assertEqual(calls.mock_calls[0].args[:2], (f"sync-job-company:{job_id}", self.company.id))
+        self.assertEqual(apply_async.call_args.kwargs["task_id"], job_id)
+
+    @mock.patch("apps.integration.api.views.get_redis")
+    def test_nothing_is_queued_when_the_owner_can_not_be_recorded(self, get_redis):
+        get_redis.return_value.set.side_effect = RedisError
+        with mock.patch.object(sync_qbo_customers, "apply_async") as apply_async, \
+                self.assertLogs("apps.integration.api.views", level="ERROR"):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 503)
+        apply_async.assert_not_called()
+
+    @mock.patch("apps.integration.tasks.sync_entity")
+    @mock.patch("apps.integration.tasks.sync_slot")
+    @mock.patch("apps.integration.concurrency.get_redis")
+    def test_user_triggered_sync_over_the_cap_is_retried(self, get_redis, sync_slot, sync_entity_mock):
+        get_redis.return_value.lock.return_value.acquire.return_value = True
+        sync_slot.return_value.__enter__.return_value = False
+        task = mock.Mock(request=mock.Mock(id=None), MaxRetriesExceededError=MaxRetriesExceededError)
+        task.retry.side_effect = Retry
+
+        with self.assertRaises(Retry):
+            _run_sync(task, self.company_integration.id, "Customer", full_sync=False, retry_deferred=True)
+
+        task.retry.assert_called_once_with(countdown=settings.INTEGRATION_SYNC_DEFER_COUNTDOWN)
+        sync_entity_mock.assert_not_called()
+
+
+class EncryptedJSONFieldTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        company = Company.objects.create(name="Acme")
+        provider = IntegrationProvider.objects.create(name="quickbooks_online", display_name="QuickBooks Online")
+        with mock.patch("apps.integration.services.integration_provider.get_redis"):
+            cls.company_integration = CompanyIntegration.objects.create(
+                company=company, provider=provider, provider_identifier="123", credentials={"access_token": "tok"}
+            )
+
+    def test_values_return_decrypted_dicts(self):
+        row = CompanyIntegration.objects.values("credentials").get(id=self.company_integration.id)
+        credentials = CompanyIntegration.objects.values_list("credentials", flat=True).get(
+            id=self.company_integration.id
+        )
+
+        self.assertEqual(row["credentials"], {"access_token": "tok"})
+        self.assertEqual(credentials, {"access_token": "tok"})
+
+    @mock.patch("apps.integration.services.integration_provider.get_redis")
+    def test_unread_value_is_saved_without_crypto(self, get_redis):
+        company_integration = CompanyIntegration.objects.get(id=self.company_integration.id)
+
+        with mock.patch("utils.model_utils.encrypt_value") as encrypt, \
+                mock.patch("utils.model_utils.decrypt_value_cached") as decrypt:
+            company_integration.save()
+
+        encrypt.assert_not_called()
+        decrypt.assert_not_called()
+        company_integration = CompanyIntegration.objects.get(id=self.company_integration.id)
+        self.assertEqual(company_integration.credentials, {"access_token": "tok"})
+
+
+@mock.patch("apps.integration.services.integration_provider.AuthClient")
+@mock.patch("apps.integration.services.integration_provider.get_redis")
+class AccessTokenTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        company = Company.objects.create(name="Acme")
+        provider = IntegrationProvider.objects.create(name="quickbooks_online", display_name="QuickBooks Online")
+        with mock.patch("apps.integration.services.integration_provider.get_redis"):
+            cls.company_integration = CompanyIntegration.objects.create(
+                company=company, provider=provider, provider_identifier="123",
+                credentials=cls.credentials("old", timezone.now() - timedelta(hours=2)),
+            )
+
+    @staticmethod
+    def credentials(access_token, created_at):
+        return {"access_token": access_token, "refresh_token": "refresh", "expires_in": 3600,
+                "token_created_at": created_at.isoformat()}
+
+    def test_cached_token_is_used_without_refreshing(self, get_redis, auth_client):
+        get_redis.return_value.pipeline.return_value.execute.return_value = (encrypt_value("cached").encode(), 3600000)
+
+        self.assertEqual(refresh_qbo_token_for_integration(self.company_integration), "cached")
+
+        auth_client.assert_not_called()
+        get_redis.return_value.lock.assert_not_called()
+
+    def test_expired_token_is_refreshed_under_the_lock_and_cached(self, get_redis, auth_client):
+        redis = get_redis.return_value
+        redis.pipeline.return_value.execute.return_value = (None, -2)
+        redis.lock.return_value.acquire.return_value = True
+        auth_client.return_value = mock.Mock(access_token="new", refresh_token="rotated", expires_in=3600)
+
+        self.assertEqual(refresh_qbo_token_for_integration(self.company_integration), "new")
+
+        auth_client.return_value.refresh.assert_called_once_with("refresh")
+        redis.lock.return_value.release.assert_called_once()
+        redis.set.assert_called_once_with(f"access-token:{self.company_integration.id}", mock.ANY, ex=mock.ANY)
+        self.company_integration.refresh_from_db()
+        self.assertEqual(self.company_integration.credentials["refresh_token"], "rotated")
+
+    def test_token_refreshed_by_another_worker_is_reused(self, get_redis, auth_client):
+        redis = get_redis.return_value
+        redis.pipeline.return_value.execute.return_value = (None, -2)
+        redis.lock.return_value.acquire.return_value = True
+        # Rotated while this worker waited for the lock
+        CompanyIntegration.objects.filter(id=self.company_integration.id).update(
+            credentials=self.credentials("rotated-elsewhere", timezone.now())
+        )
+
+        self.assertEqual(refresh_qbo_token_for_integration(self.company_integration), "rotated-elsewhere")
+
+        auth_client.assert_not_called()
+
+@mock.patch("apps.integration.services.integration_provider.AuthClient")
+@mock.patch("apps.integration.services.integration_provider.get_redis")
+class HomePageTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        company = Company.objects.create(name="Acme")
+        provider = IntegrationProvider.objects.create(name="quickbooks_online", display_name="QuickBooks Online")
+        cls.user = get_user_model().objects.create_user(email="owner@acme.test", username="owner", password="x")
+        CompanyMember.objects.create(user_account=cls.user, company=company, role="Admin")
+        expired = (timezone.now() - timedelta(hours=2)).isoformat()
+        with mock.patch("apps.integration.services.integration_provider.get_redis"):
+            cls.company_integration = CompanyIntegration.objects.create(
+                company=company, provider=provider, provider_identifier="123",
+                credentials={"access_token": "old", "refresh_token": "refresh", "expires_in": 3600,
+                             "token_created_at": expired},
+            )
+
+    @mock.patch("apps.integration.views.queue_qbo_token_refresh")
+    def test_expired_token_is_refreshed_in_the_background(self, queue_refresh, get_redis, auth_client):
+        get_redis.return_value.pipeline.return_value.execute.return_value = (None, -2)
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse("home"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["qb_connected"])
+        queue_refresh.assert_called_once_with(self.company_integration.id)
+        auth_client.assert_not_called()
+
+    @mock.patch("apps.integration.tasks.refresh_qbo_token.delay")
+    @mock.patch("apps.integration.tasks.get_redis")
+    def test_refresh_is_queued_once_per_integration(self, tasks_redis, delay, get_redis, auth_client):
+        # The queued marker is set by the first call only
+        tasks_redis.return_value.set.side_effect = [True, None]
+
+        queue_qbo_token_refresh(self.company_integration.id)
+        queue_qbo_token_refresh(self.company_integration.id)
+
+        delay.assert_called_once_with(self.company_integration.id)
+
+class ProviderRegistryTests(TestCase):
+
+    def setUp(self):
+        provider_registry.invalidate()
+        self.addCleanup(provider_registry.invalidate)
+
+    def test_unknown_id_reloads_once_per_ttl(self):
+        provider_registry.get_provider("quickbooks_online")
+
+        with mock.patch.object(provider_registry, "_load", wraps=provider_registry._load) as load:
+            self.assertIsNone(provider_registry.get_provider_by_id(999))
+            self.assertIsNone(provider_registry.get_provider_by_id(999))
+
+        load.assert_called_once()
+
+    def test_new_provider_is_found_after_a_miss(self):
+        self.assertIsNone(provider_registry.get_provider_by_id(999))
+
+        provider = IntegrationProvider.objects.create(name="quickbooks_online", display_name="QuickBooks Online")
+
+        self.assertEqual(provider_registry.get_provider_by_id(provider.id), provider)
+
+
+class RefreshRecordsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name="Acme", status=CompanyStatusChoices.ACTIVE)
+        provider = IntegrationProvider.objects.create(name="quickbooks_online", display_name="QuickBooks Online")
+        with mock.patch("apps.integration.services.integration_provider.get_redis"):
+            cls.company_integration = CompanyIntegration.objects.create(
+                company=cls.company, provider=provider, provider_identifier="123", provider_data={"realm_id": "123"}
+            )
+        cls.user = get_user_model().objects.create_user(email="owner@acme.test", username="owner")
+        CompanyMember.objects.create(user_account=cls.user, company=cls.company, role="Admin")
+
+    def setUp(self):
+        provider_registry.invalidate()
+        self.addCleanup(provider_registry.invalidate)
+        for name, value in (("_get_qbo_query_url", "https://qbo.test/query"), ("_get_qbo_access_token", "token"),
+                            ("_qbo_rate_limit_key", ("quickbooks_online", "123"))):
+            patcher = mock.patch.object(selectors, name, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.queries = []
+
+    def answer_id_queries(self, records):
+        by_id = {record["Id"]: record for record in records}
+
+        def run_query(url, access_token, query, rate_limit_key):
+            self.queries.append(query)
+            ids = re.findall(r"'(\d+)'", re.search(r"Id IN \((.*?)\)", query).group(1))
+            return {"Customer": [by_id[record_id] for record_id in ids if record_id in by_id]}
+        return run_query
+
+    def test_ids_are_fetched_in_chunks(self):
+        records = [{"Id": str(record_id)} for record_id in range(1, 6)]
+        with mock.patch.object(selectors, "_run_qbo_query", self.answer_id_queries(records)):
+            pages = list(selectors.iter_qbo_pages_by_ids(
+                self.company_integration, "Customer", ["1", "2", "2", "3", "9", "4"], chunk_size=2
+            ))
+
+        self.assertEqual(pages, [records[0:2], records[2:3], records[3:4]])
+        self.assertEqual(len(self.queries), 3)
+
+    def test_only_the_requested_records_are_upserted(self):
+        records = [{"Id": record_id, "CompanyName": "Acme", "DisplayName": f"Customer {record_id}"}
+                   for record_id in ("1", "2", "3")]
+        with mock.patch.object(selectors, "_run_qbo_query", self.answer_id_queries(records)):
+            summary = refresh_records(self.company_integration, "Customer", [3, "1", "404"])
+
+        self.assertEqual((summary["fetched"], summary["created"], summary["missing"]), (2, 2, ["404"]))
+        self.assertEqual(set(Customer.objects.values_list("customer_id", flat=True)), {"1", "3"})
+        self.assertFalse(SyncState.objects.exists())
+
+    @mock.patch("apps.integration.api.views.get_redis")
+    def test_refresh_request_queues_a_job(self, get_redis):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = reverse("qbo-refresh-invoices", args=[self.company.id])
+
+        with mock.patch.object(refresh_integration_records, "apply_async") as apply_async:
+            self.assertEqual(client.post(url, {"ids": ["1", "x"]}, format="json").status_code, 400)
+            response = client.post(url, {"ids": [12, "13"]}, format="json")
+
+        self.assertEqual(response.status_code, 202)
+        apply_async.assert_called_once_with(args=[self.company_integration.id, "Invoice", ["12", "13"]], kwargs=None,
+                                            task_id=response.data["job_id"])
+
+class QBOWebhookTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        company = Company.objects.create(name="Acme")
+        provider = IntegrationProvider.objects.create(name="quickbooks_online", display_name="QuickBooks Online")
+        with mock.patch("apps.integration.services.integration_provider.get_redis"):
+            cls.company_integration = CompanyIntegration.objects.create(
+                company=company, provider=provider, provider_identifier="123", provider_data={"realm_id": "123"}
+            )
+
+    def post_webhook(self, payload, token="verifier"):
+        body = json.dumps(payload).encode()
+        signature = base64.b64encode(hmac.new(token.encode(), body, hashlib.sha256).digest()).decode()
+        with override_settings(QBO_WEBHOOK_VERIFIER_TOKEN="verifier"):
+            return APIClient().post(reverse("qbo-webhook"), body, content_type="application/json",
+                                    HTTP_INTUIT_SIGNATURE=signature)
+
+    def notification(self, realm_id, *entities):
+        return {"realmId": realm_id, "dataChangeEvent": {"entities": [
+            {"name": name, "id": record_id, "operation": operation} for name, record_id, operation in entities
+        ]}}
+
+    @mock.patch("apps.integration.services.webhook.get_redis")
+    def test_unsigned_payload_is_rejected(self, get_redis):
+        payload = {"eventNotifications": [self.notification("123", ("Invoice", "5", "Update"))]}
+
+        self.assertEqual(self.post_webhook(payload, token="forged").status_code, 401)
+        with override_settings(QBO_WEBHOOK_VERIFIER_TOKEN="verifier"):
+            response = APIClient().post(reverse("qbo-webhook"), payload, format="json")
+        self.assertEqual(response.status_code, 401)
+        get_redis.assert_not_called()
+
+    @mock.patch("apps.integration.tasks.flush_qbo_webhook_changes.apply_async")
+    @mock.patch("apps.integration.services.webhook.get_redis")
+    def test_events_are_buffered_and_one_flush_is_scheduled_per_window(self, get_redis, apply_async):
+        pipe = get_redis.return_value.pipeline.return_value
+        get_redis.return_value.set.side_effect = [True, False]
+        payload = {"eventNotifications": [
+            self.notification("123", ("Invoice", "5", "Update"), ("Customer", "6", "Delete"), ("Bill", "7", "Create"),
+                              ("Invoice", "x", "Update")),
+            self.notification("999", ("Invoice", "8", "Update")),
+        ]}
+        company_integration_id = self.company_integration.id
+
+        for _ in range(2):
+            self.assertEqual(self.post_webhook(payload).status_code, 200)
+
+        self.assertEqual(pipe.sadd.call_args_list[:2], [
+            mock.call(f"webhook-changed:{company_integration_id}:Invoice", "5"),
+            mock.call(f"webhook-deleted:{company_integration_id}:Customer", "6"),
+        ])
+        self.assertEqual(pipe.sadd.call_count, 4)
+        get_redis.return_value.set.assert_called_with(f"webhook-flush-queued:{company_integration_id}", 1, nx=True,
+                                                      ex=settings.INTEGRATION_WEBHOOK_BUFFER_TTL)
+        apply_async.assert_called_once_with(args=[company_integration_id],
+                                            countdown=settings.INTEGRATION_WEBHOOK_COALESCE_SECONDS)
+
+    @mock.patch("apps.integration.services.webhook.refresh_records")
+    def test_record_changed_and_deleted_in_one_window_is_deleted(self, refresh_records):
+        refresh_records.return_value = {"fetched": 1, "created": 0, "updated": 1, "skipped": 0, "rejected": 0,
+                                        "rejects": []}
+        customers = [{"Id": customer_id, "CompanyName": "Acme", "DisplayName": "Acme"} for customer_id in ("1", "2")]
+        create_or_update_qbo_customers(self.company_integration, customers)
+
+        summary = apply_qbo_changes(self.company_integration, "Customer", {"1", "2", "10"}, {"1"})
+
+        refresh_records.assert_called_once_with(self.company_integration, "Customer", ["2", "10"])
+        self.assertEqual((summary["updated"], summary["deleted"]), (1, 1))
+        self.assertEqual(list(Customer.objects.values_list("customer_id", flat=True)), ["2"])
+
+    @mock.patch("apps.integration.services.webhook.get_redis")
+    def test_signed_payload_of_the_wrong_shape_is_rejected(self, get_redis):
+        for payload in ([], {"eventNotifications": ["1"]}, {"eventNotifications": [{"dataChangeEvent": []}]}):
+            with self.subTest(payload=payload):
+                self.assertEqual(self.post_webhook(payload).status_code, 400)
+        get_redis.assert_not_called()
+
+    def test_deleted_count_is_the_entity_rows_only(self):
+        customers = [{"Id": customer_id, "CompanyName": "Acme", "DisplayName": "Acme"} for customer_id in ("1", "2")]
+        create_or_update_qbo_customers(self.company_integration, customers)
+        delete = Customer.objects.filter(customer_id="1").delete
+
+        # As if cascaded rows were deleted with the customer
+        def delete_with_cascade(queryset):
+            _, deleted = delete()
+            return 3, {**deleted, "invoice.Invoice": 2}
+
+        with mock.patch("django.db.models.QuerySet.delete", delete_with_cascade):
+            summary = apply_qbo_changes(self.company_integration, "Customer", [], {"1"})
+
+        self.assertEqual(summary["deleted"], 1)
+        self.assertEqual(list(Customer.objects.values_list("customer_id", flat=True)), ["2"])
+
+
+class QueryPlanTests(TestCase):
+
+    def test_hot_queries_use_indexes(self):
+        stdout = StringIO()
+
+        call_command("check_query_plans", "--fail-on-scan", stdout=stdout)
+
+        self.assertIn("No full table scans.", stdout.getvalue())
+
+    def test_full_scan_fails_the_check(self):
+        unindexed = [("invoices by reference", Invoice.objects.filter(reference="R1"))]
+
+        with mock.patch.object(CheckQueryPlansCommand, "hot_queries", return_value=unindexed), \
+                self.assertRaisesMessage(CommandError, "invoices by reference"):
+            call_command("check_query_plans", "--fail-on-scan", stdout=StringIO())
+
+
+class DatabaseSettingsTests(SimpleTestCase):
+
+    def database(self, **env):
+        with mock.patch.dict(os.environ, env):
+            return runpy.run_path(settings.BASE_DIR / "config" / "settings.py")["DATABASES"]["default"]
+
+    def test_sqlite_runs_in_wal_mode(self):
+        with tempfile.TemporaryDirectory() as directory:
+            database = dict(self.database(DATABASE_ENGINE="sqlite"), NAME=os.path.join(directory, "db.sqlite3"))
+            # An alias unknown to the project, the test runner only guards configured ones
+            connection = ConnectionHandler({"default": database, "wal_check": database})["wal_check"]
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("PRAGMA journal_mode")
+                    self.assertEqual(cursor.fetchone()[0], "wal")
+            finally:
+                connection.close()
+
+    def test_postgresql_uses_the_pool_or_persistent_connections(self):
+        pooled = self.database(DATABASE_ENGINE="postgresql", DATABASE_POOL="true", DATABASE_POOL_MAX_SIZE="20")
+        persistent = self.database(DATABASE_ENGINE="postgresql", DATABASE_POOL="false")
+
+        self.assertEqual(pooled["OPTIONS"]["pool"]["max_size"], 20)
+        self.assertNotIn("CONN_MAX_AGE", pooled)
+        self.assertEqual((persistent["CONN_MAX_AGE"], persistent["CONN_HEALTH_CHECKS"]), (60, True))
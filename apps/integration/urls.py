@@ -1,12 +1,21 @@
 from django.urls import path
 from .api.views import QuickBooksConnectAPIView, QuickBooksCallbackAPIView, QuickBooksOnlineSyncCustomersAPIView, \
-    QuickBooksOnlineSyncInvoicesAPIView, QuickBooksOnlineSyncCompanyAPIView
+    QuickBooksOnlineSyncInvoicesAPIView, QuickBooksOnlineSyncCompanyAPIView, SyncJobStatusAPIView, SyncRunListAPIView, \
+    SyncRunDetailAPIView, QuickBooksWebhookAPIView, QuickBooksOnlineRefreshRecordsAPIView
 
 urlpatterns = [
     path("qbo/connect/<int:company_id>/", QuickBooksConnectAPIView.as_view(), name="qbo-connect"),
     path("qbo/callback/", QuickBooksCallbackAPIView.as_view(), name="quickbooks_callback"),
+    path("qbo/webhook/", QuickBooksWebhookAPIView.as_view(), name="qbo-webhook"),
     path("qbo/<int:company_id>/customers/", QuickBooksOnlineSyncCustomersAPIView.as_view(),
          name="qbo-sync-customers"),
     path("qbo/<int:company_id>/invoices/", QuickBooksOnlineSyncInvoicesAPIView.as_view(), name="qbo-sync-invoices"),
+    path("qbo/<int:company_id>/customers/refresh/", QuickBooksOnlineRefreshRecordsAPIView.as_view(),
+         {"entity_name": "Customer"}, name="qbo-refresh-customers"),
+    path("qbo/<int:company_id>/invoices/refresh/", QuickBooksOnlineRefreshRecordsAPIView.as_view(),
+         {"entity_name": "Invoice"}, name="qbo-refresh-invoices"),
+    path("qbo/jobs/<str:job_id>/", SyncJobStatusAPIView.as_view(), name="qbo-sync-job-status"),
+    path("sync-runs/", SyncRunListAPIView.as_view(), name="sync-run-list"),
+    path("sync-runs/<int:pk>/", SyncRunDetailAPIView.as_view(), name="sync-run-detail"),
     path("qbo/<int:company_id>/invoices/", QuickBooksOnlineSyncCompanyAPIView.as_view(), name="qbo-sync-company"),
 ]
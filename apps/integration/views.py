@@ -1,8 +1,14 @@
+import logging
+
 from django.contrib.auth import logout
 from django.shortcuts import redirect, render
 
-from apps.integration.models import IntegrationProvider, CompanyIntegration
-from .services import refresh_qbo_token_for_integration
+from apps.integration.models import CompanyIntegration
+from apps.integration.provider_registry import get_provider
+from apps.integration.tasks import queue_qbo_token_refresh
+from .services import get_qbo_token_state
+
+logger = logging.getLogger(__name__)
 
 
 def home(request):
@@ -15,29 +21,30 @@ def home(request):
     if request.user.is_authenticated and getattr(request.user, 'company', None):
         company = request.user.company
 
-        try:
-            # Get the QuickBooks provider
-            qb_provider = IntegrationProvider.objects.get(name="quickbooks_online", is_active=True)
-
-            # Get the company integration
-            company_integration = CompanyIntegration.objects.filter(
-                company=company, provider=qb_provider, is_active=True
-            ).first()
-
-            if company_integration:
-                # Refresh access token if expired
-                access_token = refresh_qbo_token_for_integration(company_integration)
-
-                if access_token:
-                    qb_connected = True
-                    qb_integration_data = {
-                        "access_token": access_token,
-                        "provider_name": qb_provider.display_name,
-                        "provider_identifier": company_integration.provider_identifier,
-                    }
-
-        except IntegrationProvider.DoesNotExist:
-            qb_connected = False
+        # Get the QuickBooks provider
+        qb_provider = get_provider("quickbooks_online")
+
+        # Get the company integration
+        company_integration = CompanyIntegration.objects.filter(
+            company=company, provider=qb_provider, is_active=True
+        ).first() if qb_provider else None
+
+        if company_integration:
+            # Never call Intuit here, an expired token is refreshed by a background task
+            access_token, needs_refresh = get_qbo_token_state(company_integration)
+            if needs_refresh:
+                try:
+                    queue_qbo_token_refresh(company_integration.id)
+                except Exception:
+                    logger.exception(f"Could not queue token refresh for integration {company_integration.id}.")
+
+            if access_token or needs_refresh:
+                qb_connected = True
+                qb_integration_data = {
+                    "access_token": access_token,
+                    "provider_name": qb_provider.display_name,
+                    "provider_identifier": company_integration.provider_identifier,
+                }
 
     context = {
         "qb_connected": qb_connected,
@@ -1,10 +1,12 @@
 from django.contrib import admin
 
+from apps.integration.admin_actions import refresh_from_provider_action
+from utils.admin_utils import ChangelistColumnsMixin
 from .models import Invoice
 
 
 @admin.register(Invoice)
-class InvoiceAdmin(admin.ModelAdmin):
+class InvoiceAdmin(ChangelistColumnsMixin, admin.ModelAdmin):
     list_display = (
         "invoice_no",
         "customer_id",
@@ -22,6 +24,7 @@ class InvoiceAdmin(admin.ModelAdmin):
         "invoice_date",
         "due_date",
     )
+    readonly_fields = ("created_at", "modified_at", "raw_data")
 
     search_fields = (
         "invoice_no",
@@ -29,3 +32,18 @@ class InvoiceAdmin(admin.ModelAdmin):
         "invoice_id",
         "reference",
     )
+
+    list_select_related = ("company", "integration_provider")
+    list_only_fields = (
+        "invoice_no",
+        "customer_id",
+        "invoice_date",
+        "due_date",
+        "amount",
+        "invoice_balance",
+        "company__name",
+        "integration_provider__name",
+    )
+    # Skip the unfiltered COUNT(*) on large tables
+    show_full_result_count = False
+    actions = (refresh_from_provider_action("Invoice", "invoice_id"),)
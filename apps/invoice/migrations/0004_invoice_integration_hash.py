@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 10:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0003_invoice_invoice_id_alter_invoice_unique_together'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='integration_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 6.0 on 2026-10-18 11:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0004_invoice_integration_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['company', 'customer_id'], name='invoice_inv_company_c8017a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['company', 'due_date'], name='invoice_inv_company_b41980_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['company', 'invoice_date'], name='invoice_inv_company_7d4bf5_idx'),
+        ),
+    ]
@@ -1,7 +1,9 @@
+from functools import cached_property
+
 from django.db import models
 
 from apps.company.models import Company
-from apps.integration.models import IntegrationProvider
+from apps.integration.models import IntegrationProvider, RawPayload
 
 
 class Invoice(models.Model):
@@ -25,9 +27,29 @@ class Invoice(models.Model):
     invoice_id = models.CharField(max_length=255, blank=False, verbose_name="Invoice ID", default="")  # Id
     integration_provider = models.ForeignKey(IntegrationProvider, on_delete=models.SET_NULL, null=True, blank=True)
     integration_raw_data = models.JSONField(default=dict, blank=True)
+    # SHA-256 of the provider payload, lets syncs skip unchanged records.
+    # With compressed raw data storage it also addresses the RawPayload row.
+    integration_hash = models.CharField(max_length=64, blank=True, default="", editable=False)
 
     class Meta:
         unique_together = ("company", "integration_provider", "invoice_id")
+        indexes = [
+            # Reporting filters, always scoped to a company
+            models.Index(fields=["company", "customer_id"]),
+            models.Index(fields=["company", "due_date"]),
+            models.Index(fields=["company", "invoice_date"]),
+        ]
 
     def __str__(self):
         return f"Invoice {self.invoice_no}"
+
+    @cached_property
+    def raw_data(self):
+        """
+        Provider payload, inline or loaded (once) from compressed RawPayload storage.
+        """
+        if self.integration_raw_data:
+            return self.integration_raw_data
+        if self.integration_hash:
+            return RawPayload.load(self.integration_hash)
+        return None
@@ -1,3 +1,40 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-# Create your tests here.
+from apps.company.models import Company
+from apps.invoice.models import Invoice
+
+
+class InvoiceAdminTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = get_user_model().objects.create_superuser(
+            email="admin@acme.test", username="admin", password="x"
+        )
+        company = Company.objects.create(name="Acme")
+        cls.invoice = Invoice.objects.create(
+            company=company, customer_id="1", invoice_no="D1", invoice_date="2025-01-01T00:00:00Z",
+            amount="10.00", due_date="2025-02-01", invoice_id="1", integration_raw_data={"Id": "1"},
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin_user)
+
+    def test_changelist_does_not_read_raw_payloads(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("admin:invoice_invoice_changelist"))
+
+        self.assertContains(response, "D1")
+        invoice_selects = [query["sql"] for query in queries if 'FROM "invoice_invoice"' in query["sql"]]
+        self.assertTrue(invoice_selects)
+        for sql in invoice_selects:
+            self.assertNotIn("integration_raw_data", sql)
+
+    def test_change_form_still_loads_the_full_row(self):
+        response = self.client.get(reverse("admin:invoice_invoice_change", args=[self.invoice.id]))
+
+        self.assertEqual(response.status_code, 200)
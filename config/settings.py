@@ -88,12 +88,49 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DATABASE_ENGINE=postgresql for production: SQLite serializes writers, concurrent
+# sync workers need PostgreSQL. SQLite stays the development default.
+DATABASE_ENGINE = config("DATABASE_ENGINE", default="sqlite")
+
+if DATABASE_ENGINE == "postgresql":
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config("DATABASE_NAME", default="multi_books"),
+            'USER': config("DATABASE_USER", default="postgres"),
+            'PASSWORD': config("DATABASE_PASSWORD", default=""),
+            'HOST': config("DATABASE_HOST", default="localhost"),
+            'PORT': config("DATABASE_PORT", default="5432"),
+        }
+    }
+    if config("DATABASE_POOL", default=False, cast=bool):
+        # psycopg 3 connection pool, one per process (excludes CONN_MAX_AGE)
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': config("DATABASE_POOL_MIN_SIZE", default=2, cast=int),
+                'max_size': config("DATABASE_POOL_MAX_SIZE", default=10, cast=int),
+                'timeout': config("DATABASE_POOL_TIMEOUT", default=10, cast=int),
+            },
+        }
+    else:
+        # Persistent connections, checked before reuse
+        DATABASES['default']['CONN_MAX_AGE'] = config("DATABASE_CONN_MAX_AGE", default=60, cast=int)
+        DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                # WAL lets readers run alongside the writer, writers wait (busy timeout)
+                # instead of failing with "database is locked"
+                'init_command': "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;",
+                'timeout': config("SQLITE_BUSY_TIMEOUT", default=20, cast=int),
+                # Take the write lock when the transaction starts, avoids lock upgrade deadlocks
+                'transaction_mode': "IMMEDIATE",
+            },
+        }
     }
-}
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -158,6 +195,8 @@ QBO_ENVIRONMENT = config('QBO_ENVIRONMENT', default='sandbox')
 QBO_SANDBOX_BASE_URL = config("QBO_SANDBOX_BASE_URL", default="https://sandbox-quickbooks.api.intuit.com")
 QBO_PRODUCTION_BASE_URL = config("QBO_PRODUCTION_BASE_URL", default="https://quickbooks.api.intuit.com")
 QBO_BASE_URL = QBO_SANDBOX_BASE_URL if QBO_ENVIRONMENT.lower() == "sandbox" else QBO_PRODUCTION_BASE_URL
+# Verifier token of the app's webhook subscription (Intuit developer portal), webhooks are refused without it
+QBO_WEBHOOK_VERIFIER_TOKEN = config("QBO_WEBHOOK_VERIFIER_TOKEN", default="")
 
 # OAuth config
 ZOHO_CLIENT_ID = config("ZOHO_CLIENT_ID")
@@ -183,6 +222,8 @@ ZOHO_OAUTH_AUTHORIZE_URL = f"{ZOHO_ACCOUNTS_BASE_URL}/oauth/v2/auth"
 ZOHO_OAUTH_TOKEN_URL = f"{ZOHO_ACCOUNTS_BASE_URL}/oauth/v2/token"
 
 FERNET_KEY = config("CUSTOM_FERNET_KEY")
+# Decrypted EncryptedJSONField payloads kept per process (LRU, keyed by ciphertext digest)
+ENCRYPTION_DECRYPT_CACHE_SIZE = config("ENCRYPTION_DECRYPT_CACHE_SIZE", default=1024, cast=int)
 
 CELERY_BROKER_URL = "redis://127.0.0.1:6379/0"
 CELERY_RESULT_BACKEND = "redis://127.0.0.1:6379/1"
@@ -190,3 +231,87 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = "Asia/Kathmandu"
+CELERY_BEAT_SCHEDULE = {
+    "dispatch-integration-syncs": {
+        "task": "apps.integration.tasks.dispatch_integration_syncs",
+        "schedule": config("INTEGRATION_SYNC_DISPATCH_INTERVAL", default=300, cast=int),
+    },
+    "refresh-expiring-qbo-tokens": {
+        "task": "apps.integration.tasks.refresh_expiring_qbo_tokens",
+        "schedule": config("INTEGRATION_TOKEN_REFRESH_INTERVAL", default=600, cast=int),
+    },
+    "prune-raw-payloads": {
+        "task": "apps.integration.tasks.prune_raw_payloads",
+        "schedule": config("INTEGRATION_RAW_PAYLOAD_PRUNE_INTERVAL", default=86400, cast=int),
+    },
+}
+
+INTEGRATION_REDIS_URL = config("INTEGRATION_REDIS_URL", default=CELERY_BROKER_URL)
+
+# Provider HTTP client
+INTEGRATION_HTTP_TIMEOUT = config("INTEGRATION_HTTP_TIMEOUT", default=10, cast=int)
+INTEGRATION_HTTP_POOL_SIZE = config("INTEGRATION_HTTP_POOL_SIZE", default=10, cast=int)
+INTEGRATION_HTTP_MAX_RETRIES = config("INTEGRATION_HTTP_MAX_RETRIES", default=4, cast=int)
+INTEGRATION_HTTP_BACKOFF_BASE = config("INTEGRATION_HTTP_BACKOFF_BASE", default=0.5, cast=float)
+INTEGRATION_HTTP_BACKOFF_MAX = config("INTEGRATION_HTTP_BACKOFF_MAX", default=60, cast=float)
+
+# Per provider account request budget (QuickBooks: per realm), shared by all workers
+INTEGRATION_RATE_LIMITS = {
+    "quickbooks_online": {
+        "per_minute": config("QBO_RATE_LIMIT_PER_MINUTE", default=500, cast=int),
+        "burst": config("QBO_RATE_LIMIT_BURST", default=10, cast=int),
+    },
+}
+INTEGRATION_RATE_LIMIT_TIMEOUT = config("INTEGRATION_RATE_LIMIT_TIMEOUT", default=120, cast=int)
+
+# Integration sync
+# OAuth access tokens: refreshed when they expire within MARGIN seconds, the beat task
+# refreshes those expiring within PROACTIVE_REFRESH_WINDOW (keep it above its interval)
+INTEGRATION_TOKEN_REFRESH_MARGIN = config("INTEGRATION_TOKEN_REFRESH_MARGIN", default=300, cast=int)
+INTEGRATION_TOKEN_PROACTIVE_REFRESH_WINDOW = config("INTEGRATION_TOKEN_PROACTIVE_REFRESH_WINDOW", default=900, cast=int)
+INTEGRATION_TOKEN_REFRESH_LOCK_TIMEOUT = config("INTEGRATION_TOKEN_REFRESH_LOCK_TIMEOUT", default=30, cast=int)
+# Seconds a worker serves IntegrationProvider rows from its in-process registry
+INTEGRATION_PROVIDER_REGISTRY_TTL = config("INTEGRATION_PROVIDER_REGISTRY_TTL", default=300, cast=int)
+# "inline" keeps provider payloads in integration_raw_data, "compressed" stores them
+# once per distinct payload in RawPayload (zlib) and loads them only when accessed
+INTEGRATION_RAW_DATA_STORAGE = config("INTEGRATION_RAW_DATA_STORAGE", default="inline")
+# Unreferenced RawPayload rows are pruned by a beat task once older than this (seconds)
+INTEGRATION_RAW_PAYLOAD_PRUNE_GRACE = config("INTEGRATION_RAW_PAYLOAD_PRUNE_GRACE", default=86400, cast=int)
+# Decode provider responses incrementally (needs ijson) and hand sequential pages
+# to the DB writer in chunks of this many records, instead of parsing whole pages
+INTEGRATION_STREAM_PARSE = config("INTEGRATION_STREAM_PARSE", default=True, cast=bool)
+INTEGRATION_STREAM_CHUNK_SIZE = config("INTEGRATION_STREAM_CHUNK_SIZE", default=200, cast=int)
+# Pages buffered between the fetch, transform and load stages of a sync pipeline
+INTEGRATION_PIPELINE_QUEUE_SIZE = config("INTEGRATION_PIPELINE_QUEUE_SIZE", default=2, cast=int)
+INTEGRATION_UPSERT_BATCH_SIZE = config("INTEGRATION_UPSERT_BATCH_SIZE", default=500, cast=int)
+# Records rejected by a sync (bad or missing values) kept on its SyncRun, the count is always complete
+INTEGRATION_SYNC_REJECTS_LIMIT = config("INTEGRATION_SYNC_REJECTS_LIMIT", default=100, cast=int)
+# Webhook change events are buffered this long and applied in one flush per integration
+INTEGRATION_WEBHOOK_COALESCE_SECONDS = config("INTEGRATION_WEBHOOK_COALESCE_SECONDS", default=5, cast=int)
+# Buffered events and the pending flush marker expire after this, in case a flush task is lost
+INTEGRATION_WEBHOOK_BUFFER_TTL = config("INTEGRATION_WEBHOOK_BUFFER_TTL", default=3600, cast=int)
+# How long the job status API knows which company queued a job
+INTEGRATION_SYNC_JOB_TTL = config("INTEGRATION_SYNC_JOB_TTL", default=86400, cast=int)
+# Seconds before a user-triggered sync held back by the concurrency caps is retried
+INTEGRATION_SYNC_DEFER_COUNTDOWN = config("INTEGRATION_SYNC_DEFER_COUNTDOWN", default=60, cast=int)
+# Most provider ids one targeted refresh (API, admin action) may ask for
+INTEGRATION_REFRESH_MAX_IDS = config("INTEGRATION_REFRESH_MAX_IDS", default=1000, cast=int)
+# Interrupted syncs resume from their last committed page unless the checkpoint is older than this
+INTEGRATION_SYNC_CHECKPOINT_TTL = config("INTEGRATION_SYNC_CHECKPOINT_TTL", default=86400, cast=int)
+# Pages fetched concurrently (and held ahead of the DB writer) on large result sets
+INTEGRATION_FETCH_CONCURRENCY = config("INTEGRATION_FETCH_CONCURRENCY", default=4, cast=int)
+
+# Scheduled sync fan-out (see apps.integration.tasks.dispatch_integration_syncs)
+INTEGRATION_SYNC_INTERVAL = config("INTEGRATION_SYNC_INTERVAL", default=3600, cast=int)
+INTEGRATION_SYNC_STAGGER_SECONDS = max(config("INTEGRATION_SYNC_STAGGER_SECONDS", default=300, cast=int), 1)
+INTEGRATION_SYNC_GLOBAL_CONCURRENCY = config("INTEGRATION_SYNC_GLOBAL_CONCURRENCY", default=50, cast=int)
+INTEGRATION_SYNC_DEFAULT_PROVIDER_CONCURRENCY = config(
+    "INTEGRATION_SYNC_DEFAULT_PROVIDER_CONCURRENCY", default=20, cast=int
+)
+INTEGRATION_SYNC_PROVIDER_CONCURRENCY = {
+    "quickbooks_online": config("QBO_SYNC_CONCURRENCY", default=20, cast=int),
+}
+# Lease on a concurrency slot, frees slots held by crashed workers
+INTEGRATION_SYNC_SLOT_TTL = config("INTEGRATION_SYNC_SLOT_TTL", default=3600, cast=int)
+# Lease on the per integration/entity sync lock, frees locks held by crashed workers
+INTEGRATION_SYNC_LOCK_TIMEOUT = config("INTEGRATION_SYNC_LOCK_TIMEOUT", default=3600, cast=int)
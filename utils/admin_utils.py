@@ -0,0 +1,20 @@
+class ChangelistColumnsMixin:
+    """
+    ModelAdmin mixin limiting the columns changelist pages read.
+    `list_only_fields` / `list_defer_fields` are applied with only() / defer(),
+    so raw payloads and encrypted blobs are neither fetched nor decrypted for
+    every listed row. Change forms still load the full row.
+    """
+    list_only_fields = ()
+    list_defer_fields = ()
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        match = getattr(request, "resolver_match", None)
+        if match is None or match.url_name != f"{self.opts.app_label}_{self.opts.model_name}_changelist":
+            return queryset
+        if self.list_only_fields:
+            queryset = queryset.only(*self.list_only_fields)
+        if self.list_defer_fields:
+            queryset = queryset.defer(*self.list_defer_fields)
+        return queryset
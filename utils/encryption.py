@@ -1,5 +1,9 @@
 from __future__ import annotations
 
+import hashlib
+import threading
+from collections import OrderedDict
+
 from cryptography.fernet import Fernet, InvalidToken
 from django.conf import settings
 
@@ -74,6 +78,46 @@ def decrypt_value(token: str | None) -> str | None:
         raise ValueError("Decryption failed – invalid key or corrupted token.")
 
 
+# -----------------------------
+# Process-local decrypt cache
+# -----------------------------
+_decrypt_cache: OrderedDict[bytes, str] = OrderedDict()
+_decrypt_cache_lock = threading.Lock()
+
+
+def _decrypt_cache_size() -> int:
+    try:
+        return getattr(settings, "ENCRYPTION_DECRYPT_CACHE_SIZE", 1024)
+    except Exception:
+        # Settings not configured (script mode)
+        return 1024
+
+
+def decrypt_value_cached(token: str | None) -> str | None:
+    """
+    Decrypt with a bounded LRU cache keyed by the SHA-256 digest of the token,
+    so loading the same ciphertext again skips Fernet (HMAC + AES) entirely.
+    """
+    if token is None:
+        return None
+
+    key = hashlib.sha256(token.encode()).digest()
+    with _decrypt_cache_lock:
+        plain = _decrypt_cache.get(key)
+        if plain is not None:
+            _decrypt_cache.move_to_end(key)
+            return plain
+
+    plain = decrypt_value(token)
+
+    with _decrypt_cache_lock:
+        _decrypt_cache[key] = plain
+        _decrypt_cache.move_to_end(key)
+        while len(_decrypt_cache) > _decrypt_cache_size():
+            _decrypt_cache.popitem(last=False)
+    return plain
+
+
 # -----------------------------
 # CLI Mode: Generate a key
 # -----------------------------
@@ -1,17 +1,105 @@
+from contextvars import ContextVar
+
 from django.db import models
-from .encryption import encrypt_value, decrypt_value
+from django.db.models.query import ModelIterable
+from django.db.models.query_utils import DeferredAttribute
+from .encryption import encrypt_value, decrypt_value_cached
 import json
 
+# Set while LazyDecryptQuerySet builds instances, anything else (values(), values_list()) gets plain values
+_defer_decryption = ContextVar("defer_decryption", default=False)
+
+
+class EncryptedValue:
+    """
+    Ciphertext as loaded from the DB, not decrypted yet.
+    """
+    __slots__ = ("token",)
+
+    def __init__(self, token):
+        self.token = token
+
+    def decrypt(self):
+        # json.loads gives every caller its own dict, the cache only holds the JSON string
+        return json.loads(decrypt_value_cached(self.token))
+
+    def __repr__(self):
+        return "<EncryptedValue>"
+
+
+class LazyDecryptedAttribute(DeferredAttribute):
+    """
+    Model attribute that decrypts an EncryptedJSONField on first access
+    and keeps the result on the instance.
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, EncryptedValue):
+            value = value.decrypt()
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        # Being a data descriptor keeps __get__ in the lookup path once the value is in __dict__
+        instance.__dict__[self.field.attname] = value
+
+
+class LazyDecryptModelIterable(ModelIterable):
+    """
+    Yields model instances whose EncryptedJSONField values are still ciphertext.
+    """
+
+    def __iter__(self):
+        rows = super().__iter__()
+        while True:
+            # Only around our own next(), the caller's code between rows decrypts as usual
+            reset_token = _defer_decryption.set(True)
+            try:
+                obj = next(rows, None)
+            finally:
+                _defer_decryption.reset(reset_token)
+            if obj is None:
+                return
+            yield obj
+
+
+class LazyDecryptQuerySet(models.QuerySet):
+    """
+    Manager queryset for models with EncryptedJSONField: instances decrypt on
+    first attribute access instead of on load.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._iterable_class = LazyDecryptModelIterable
+
 
 class EncryptedJSONField(models.JSONField):
     """
-    JSONField with automatic encryption/decryption using Fernet
+    JSONField with automatic encryption/decryption using Fernet.
+    Instances loaded through LazyDecryptQuerySet decrypt lazily, only when the
+    attribute is read, so loading a row for its other columns costs no crypto.
+    Every other read, values()/values_list() included, returns decrypted values.
     """
+    descriptor_class = LazyDecryptedAttribute
+
+    def pre_save(self, model_instance, add):
+        # Going through the attribute would decrypt a value nobody read
+        value = model_instance.__dict__.get(self.attname)
+        if isinstance(value, EncryptedValue):
+            return value
+        return super().pre_save(model_instance, add)
 
     def get_prep_value(self, value):
         """
         Called before saving to DB
         """
+        if isinstance(value, EncryptedValue):
+            # Never read since it was loaded, the stored ciphertext is still current
+            return value.token
         if value is None:
             return None
         # Convert dict to JSON string, then encrypt
@@ -20,13 +108,19 @@ class EncryptedJSONField(models.JSONField):
 
     def from_db_value(self, value, expression, connection):
         """
-        Called when reading from DB
+        Called when reading from DB, decryption is deferred to attribute access
+        while LazyDecryptQuerySet builds instances
         """
         if value is None:
             return None
-        # Decrypt and convert JSON string back to dict
-        decrypted = decrypt_value(value)
-        return json.loads(decrypted)
+        # The column holds the token as a JSON string, the way get_db_prep_value wrote it
+        try:
+            token = json.loads(value)
+        except json.JSONDecodeError:
+            token = value
+        if _defer_decryption.get():
+            return EncryptedValue(token)
+        return json.loads(decrypt_value_cached(token))
 
     def to_python(self, value):
         """
@@ -34,6 +128,8 @@ class EncryptedJSONField(models.JSONField):
         """
         if isinstance(value, dict) or value is None:
             return value
+        if isinstance(value, EncryptedValue):
+            return value.decrypt()
         # Decrypt if it's a string
-        decrypted = decrypt_value(value)
+        decrypted = decrypt_value_cached(value)
         return json.loads(decrypted)
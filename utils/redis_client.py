@@ -0,0 +1,15 @@
+import redis
+from django.conf import settings
+
+_client = None
+
+
+def get_redis() -> redis.Redis:
+    """
+    Shared Redis client (defaults to the Celery broker instance).
+    redis-py pools connections internally, one client per process is enough.
+    """
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.INTEGRATION_REDIS_URL)
+    return _client